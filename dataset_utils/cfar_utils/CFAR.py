@@ -3,11 +3,13 @@ import numpy as np
 from dataset_CFAR import CFARDataset
 from tqdm import tqdm
 from scipy import ndimage
+from numpy.lib.stride_tricks import sliding_window_view
 from tqdm import tqdm
 import open3d as o3d
 import cv2
 
 from utils.util_geometry import Object3D
+from utils.util_cfar import get_ca_cfar_threshold, get_train_sum, get_symmetric_offsets
 
 class CFAR:
     def __init__(self, roi, type='pointcloud'):
@@ -28,6 +30,11 @@ class CFAR:
         self.thr_rate = 0.02 # for OS-CFAR
         ### Design parameters ###
 
+        # thresholds (unnormalized power) of the cells under test of the last call, e.g., for statistics
+        #   ca: every valid cell, os: num_sample_os_thr valid cells (random), fixed: the quantile
+        self.arr_thr_last = None
+        self.num_sample_os_thr = 1024
+
         self.roi = roi
         arr_z_cb, arr_y_cb, arr_x_cb = self.roi
         self.min_values = [np.min(arr_z_cb), np.min(arr_y_cb), np.min(arr_x_cb)]
@@ -48,7 +55,9 @@ class CFAR:
     
     def fixed_points(self, cube, top_percent=0.1):
         cube_fix = cube.copy()
-        pc_idx = np.where(cube_fix > np.quantile(cube_fix, 1-top_percent))
+        thr = np.quantile(cube_fix, 1-top_percent)
+        self.arr_thr_last = np.array([thr])
+        pc_idx = np.where(cube_fix > thr)
         correp_power = cube[pc_idx] # Unnormalized
 
         ### To point cloud ###
@@ -60,7 +69,7 @@ class CFAR:
         
         total_values = np.concatenate([pc_x.reshape(-1,1), pc_y.reshape(-1,1), pc_z.reshape(-1,1), correp_power.reshape(-1,1)], axis=1)
         # fliter the power is -1.
-        total_values = np.array(list(filter(lambda x: x[3] != -1., total_values.tolist())))
+        total_values = total_values[total_values[:,3] != -1.]
         ### To point cloud ###
 
         if self.mode == 0:
@@ -80,21 +89,11 @@ class CFAR:
         # cube_norm[invalid_idx] = self.LARGE_VALUE
         cube_norm[invalid_idx] = np.mean(cube_norm)
         
-        # generating 3D mask
-        nh_g_z, nh_g_y, nh_g_x = self.n_half_guard_cell_zyx
-        nh_t_z, nh_t_y, nh_t_x = self.n_half_train_cell_zyx 
-        mask_size = (2*(nh_g_z+nh_t_z)+1, 2*(nh_g_y+nh_t_y)+1, 2*(nh_g_x+nh_t_x)+1) # 1 for own
-        mask = np.ones(mask_size)
-        mask[nh_t_z:nh_t_z+2*nh_g_z+1, nh_t_y:nh_t_y+2*nh_g_y+1, nh_t_x:nh_t_x+2*nh_g_x+1] = 0
-        num_total_train_cells = np.count_nonzero(mask)
-        mask = mask/num_total_train_cells
-
-        alpha = num_total_train_cells * (self.fa_rate**(-1/num_total_train_cells)-1)
-        
-        conv_out = ndimage.convolve(cube_norm, mask, mode='mirror')
-        conv_out = alpha * conv_out
-
-        out = np.greater(cube_norm, conv_out)
+        # training cells = outer box - guard box (summed-area tables, same as convolution with the 3D mask)
+        thr = get_ca_cfar_threshold(cube_norm, self.n_half_guard_cell_zyx, self.n_half_train_cell_zyx, \
+                                self.fa_rate, mode='mirror', dtype=np.float64)
+        self.arr_thr_last = thr[cube != -1.]*1e+13
+        out = cube_norm > thr
         pc_idx = np.where(out==True)
         correp_power = cube[pc_idx] # Unnormalized
 
@@ -107,7 +106,7 @@ class CFAR:
         
         total_values = np.concatenate([pc_x.reshape(-1,1), pc_y.reshape(-1,1), pc_z.reshape(-1,1), correp_power.reshape(-1,1)], axis=1)
         # fliter the power is -1.
-        total_values = np.array(list(filter(lambda x: x[3] != -1., total_values.tolist())))
+        total_values = total_values[total_values[:,3] != -1.]
         ### To point cloud ###
 
         if self.mode == 0:
@@ -131,22 +130,18 @@ class CFAR:
         nh_g_z, nh_g_y, nh_g_x = self.n_half_guard_cell_zyx
         nh_t_z, nh_t_y, nh_t_x = self.n_half_train_cell_zyx
 
-        margin_z = nh_g_z+nh_t_z
-        margin_y = nh_g_y+nh_t_y
-        margin_x = nh_g_x+nh_t_x
-
+        n_half_window = [nh_g_z+nh_t_z, nh_g_y+nh_t_y, nh_g_x+nh_t_x]
+        interior = tuple(slice(nh, n-nh) for nh, n in zip(n_half_window, cube.shape))
         out = np.zeros_like(cube)
+        out[interior] = \
+            get_os_cfar_mask(cube_norm, self.n_half_guard_cell_zyx, self.n_half_train_cell_zyx, 1-self.thr_rate)
 
-        n_z, n_y, n_x = out.shape
-
-        for idx_z in range(margin_z,n_z-margin_z):
-            for idx_y in range(margin_y,n_y-margin_y):
-                for idx_x in range(margin_x,n_x-margin_x):
-                    mask = cube_norm[idx_z-margin_z:idx_z+margin_z+1,idx_y-margin_y:idx_y+margin_y+1,idx_x-margin_x:idx_x+margin_x+1].copy()
-                    mask[nh_t_z:nh_t_z+2*nh_g_z+1, nh_t_y:nh_t_y+2*nh_g_y+1, nh_t_x:nh_t_x+2*nh_g_x+1] = -1
-                    arr = mask[np.where(mask!=-1.)]
-                    thr = np.quantile(arr, 1-self.thr_rate)
-                    out[idx_z,idx_y,idx_x] = 1 if cube_norm[idx_z,idx_y,idx_x] > thr else 0
+        # order statistic of sampled valid cells (same windows as the mask)
+        idx_valid = np.stack(np.where(cube[interior] != -1.), axis=-1)
+        if len(idx_valid) > self.num_sample_os_thr:
+            idx_valid = idx_valid[np.random.default_rng(0).choice(len(idx_valid), self.num_sample_os_thr, replace=False)]
+        self.arr_thr_last = get_os_cfar_threshold(cube_norm, self.n_half_guard_cell_zyx, self.n_half_train_cell_zyx, \
+                                                    1-self.thr_rate, tuple(idx_valid.T))*1e+13
 
         pc_idx = np.where(out==1)
         correp_power = cube[pc_idx] # Unnormalized
@@ -160,7 +155,7 @@ class CFAR:
         
         total_values = np.concatenate([pc_x.reshape(-1,1), pc_y.reshape(-1,1), pc_z.reshape(-1,1), correp_power.reshape(-1,1)], axis=1)
         # fliter the power is -1.
-        total_values = np.array(list(filter(lambda x: x[3] != -1., total_values.tolist())))
+        total_values = total_values[total_values[:,3] != -1.]
         ### To point cloud ###
 
         if self.mode == 0:
@@ -170,6 +165,74 @@ class CFAR:
         elif self.mode == 2:
             return total_values, pc_idx
 
+def get_os_cfar_mask(cube_norm, n_half_guard, n_half_train, q, num_bins=64, len_chunk=256):
+    '''
+    * out (interior cells) = cube_norm > np.quantile(training cells of the window, q)
+    *   same as the loop over cells, without sorting every window
+    * L: # of training cells lower than the cell under test (v), with s the sorted training cells,
+    *   v > s[k+1] <=> L >= k+2, v <= s[k] <=> L <= k (k = floor(q*(n-1)))
+    * L is bounded by counting cells lower than the bin edges of v with box sums (per bin),
+    *   only the cells with k < L < k+2 (few) are compared with np.quantile of their window
+    '''
+    n_half_window = [nh_g+nh_t for nh_g, nh_t in zip(n_half_guard, n_half_train)]
+    interior = tuple(slice(nh, n-nh) for nh, n in zip(n_half_window, cube_norm.shape))
+
+    footprint = get_os_cfar_footprint(n_half_guard, n_half_train)
+    num_train_cells = np.count_nonzero(footprint)
+    pos = q*(num_train_cells-1)
+    k = int(np.floor(pos))
+    num_lower_for_true = k+2 if pos > k else k+1
+
+    offsets_outer, offsets_guard, _ = get_symmetric_offsets(n_half_guard, n_half_train)
+    def count_train_lower(edge):
+        cnt = get_train_sum((cube_norm < edge).astype(np.float32), offsets_outer, offsets_guard)
+        return np.round(cnt[interior]).astype(np.int64)
+
+    vals = cube_norm[interior]
+    edges = np.unique(np.quantile(cube_norm, np.linspace(0., 1., num_bins+1)[1:-1]))
+    idx_bin = np.searchsorted(edges, vals, side='right') # edges[idx_bin-1] <= v < edges[idx_bin]
+    num_lower_min = np.zeros(vals.shape, dtype=np.int64)
+    num_lower_max = np.full(vals.shape, num_train_cells, dtype=np.int64)
+    for idx_edge, edge in enumerate(edges):
+        is_upper_edge, is_lower_edge = (idx_bin == idx_edge), (idx_bin == idx_edge+1)
+        if not (np.any(is_upper_edge) or np.any(is_lower_edge)):
+            continue
+        cnt = count_train_lower(edge)
+        num_lower_max[is_upper_edge] = cnt[is_upper_edge]
+        num_lower_min[is_lower_edge] = cnt[is_lower_edge]
+
+    out = num_lower_min >= num_lower_for_true
+    is_ambiguous = ~out & (num_lower_max > k)
+
+    idx_ambiguous = np.where(is_ambiguous)
+    out[idx_ambiguous] = vals[idx_ambiguous] > \
+        get_os_cfar_threshold(cube_norm, n_half_guard, n_half_train, q, idx_ambiguous, len_chunk)
+
+    return out
+
+def get_os_cfar_footprint(n_half_guard, n_half_train):
+    '''
+    * training cells (True) of a window (2*(n_half_guard+n_half_train)+1 per axis)
+    '''
+    size_window = [2*(nh_g+nh_t)+1 for nh_g, nh_t in zip(n_half_guard, n_half_train)]
+    size_guard = [2*nh+1 for nh in n_half_guard]
+    footprint = np.ones(size_window, dtype=bool)
+    footprint[tuple(slice(nh_t, nh_t+sz_g) for nh_t, sz_g in zip(n_half_train, size_guard))] = False
+    return footprint
+
+def get_os_cfar_threshold(cube_norm, n_half_guard, n_half_train, q, idx_cells, len_chunk=256):
+    '''
+    * np.quantile(training cells of the window, q) of the cells idx_cells (tuple of index arrays of the interior)
+    '''
+    footprint = get_os_cfar_footprint(n_half_guard, n_half_train)
+    windows = sliding_window_view(cube_norm, footprint.shape)
+    idx_cells = np.stack(idx_cells, axis=-1)
+    thr = np.empty((len(idx_cells),), dtype=np.float64)
+    for idx_start in range(0, len(idx_cells), len_chunk):
+        idx_chunk = tuple(idx_cells[idx_start:idx_start+len_chunk].T)
+        thr[idx_start:idx_start+len_chunk] = np.quantile(windows[idx_chunk][:, footprint], q, axis=1)
+    return thr
+
 def show_pointcloud_for_lidar_and_radar(lpc, rpc, show='both', label=None):
     '''
     * lpc np.array
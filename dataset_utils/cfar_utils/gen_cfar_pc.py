@@ -0,0 +1,182 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: generate cfar radar point clouds of every frame in a split (process pool)
+*   <dir_save>/<seq>/cfar_pc_<type>/pc_<rdr_idx>.bin: float32 (N, 5) = x, y, z, power, doppler
+*       (load with np.fromfile(path, dtype=np.float32).reshape(-1, 5), doppler is nan without doppler cube)
+*   <dir_save>/cfar_pc_<type>_<split>_stats.csv: # of points, cfar threshold (mean, p50, p95 over the valid cells),
+*       min & max power of the points & runtime per frame (thresholds of os are from CFAR.num_sample_os_thr cells)
+*   <dir_save>/cfar_pc_<type>_<split>_info.json: cfar parameters
+* e.g., python dataset_utils/cfar_utils/gen_cfar_pc.py --type os --split train --num_workers 16
+'''
+
+import os
+import os.path as osp
+import sys
+import time
+import json
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from scipy.io import loadmat
+from tqdm import tqdm
+
+sys.path.append(osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__)))))
+from CFAR import CFAR
+from utils.util_config import cfg, cfg_from_yaml_file
+from datasets.kradar_dataset_v2_1 import KRadarDataset_v2_1
+
+### Here to change ###
+PATH_CFG = './configs/cfg_RTNH.yml'
+DIR_SAVE = '/media/donghee/HDD_2/KRadar_CFAR_PC'
+LIST_CFAR_TYPE = ['ca', 'os', 'fixed']
+### Here to change ###
+
+LIST_STATS = ['seq', 'rdr_idx', 'num_points', 'thr_mean', 'thr_p50', 'thr_p95', 'min_power', 'max_power', \
+              'ratio_invalid', 'time_load', 'time_cfar']
+
+dataset = None
+cfar = None
+dict_args = None
+
+def init_worker(args):
+    global dataset, cfar, dict_args
+    dict_args = vars(args)
+    cfg_dataset = cfg_from_yaml_file(args.path_cfg, cfg)
+    cfg_dataset.DATASET.GET_ITEM['rdr_cube'] = True # for arr_*_cb and roi indices
+    dataset = KRadarDataset_v2_1(cfg_dataset, split=args.split)
+    cfar = CFAR(get_roi_arrays(dataset), type='index')
+
+def get_roi_arrays(dataset):
+    return dataset.arr_z_cb, dataset.arr_y_cb, dataset.arr_x_cb
+
+def get_paths(dataset, path_label):
+    '''
+    * same paths as KRadarDataset_v2_1.__getitem__
+    '''
+    seq_id, radar_idx, _, _ = dataset.get_data_indices(path_label)
+    path_header = path_label.split('/')[:-2]
+    path_cube = '/'+os.path.join(*path_header, 'radar_zyx_cube', 'cube_'+radar_idx+'.mat')
+    if dataset.is_dop_another_dir:
+        path_cube_doppler = os.path.join(dataset.dir_dop, path_header[-1], 'radar_cube_doppler', 'radar_cube_doppler_'+radar_idx+'.mat')
+    else:
+        path_cube_doppler = '/'+os.path.join(*path_header, 'radar_cube_doppler', 'radar_cube_doppler_'+radar_idx+'.mat')
+    return seq_id, radar_idx, path_cube, path_cube_doppler
+
+def get_raw_cube(dataset, path_cube):
+    '''
+    * same flip & roi as get_cube, but -1 (invalid) is kept for CFAR
+    '''
+    arr_cube = np.flip(loadmat(path_cube)['arr_zyx'], axis=0)
+    if dataset.is_consider_roi_rdr_cb:
+        idx_z_min, idx_z_max, idx_y_min, idx_y_max, idx_x_min, idx_x_max = dataset.list_roi_idx_cb
+        arr_cube = arr_cube[idx_z_min:idx_z_max+1,idx_y_min:idx_y_max+1,idx_x_min:idx_x_max+1]
+    return np.ascontiguousarray(arr_cube)
+
+def process_frame(path_label):
+    seq_id, radar_idx, path_cube, path_cube_doppler = get_paths(dataset, path_label)
+    dir_pc = osp.join(dict_args['dir_save'], seq_id, f'cfar_pc_{dict_args["type"]}')
+    path_pc = osp.join(dir_pc, f'pc_{radar_idx}.bin')
+    if dict_args['is_skip_exist'] and osp.exists(path_pc):
+        return None
+
+    t_start = time.time()
+    cube = get_raw_cube(dataset, path_cube)
+    cube_doppler = dataset.get_cube_doppler(path_cube_doppler) if osp.exists(path_cube_doppler) else None
+    t_load = time.time()
+
+    if dict_args['type'] == 'ca':
+        pc_idx = cfar.ca_cfar(cube)
+    elif dict_args['type'] == 'os':
+        pc_idx = cfar.os_cfar(cube)
+    elif dict_args['type'] == 'fixed':
+        pc_idx = cfar.fixed_points(cube, dict_args['top_percent'])
+    t_cfar = time.time()
+
+    ### To point cloud (x, y, z, power, doppler) ###
+    power = cube[pc_idx]
+    is_valid = power != -1.
+    idx_z, idx_y, idx_x = [idx[is_valid] for idx in pc_idx]
+    arr_z_cb, arr_y_cb, arr_x_cb = get_roi_arrays(dataset)
+    doppler = cube_doppler[idx_z, idx_y, idx_x] if cube_doppler is not None else np.full(len(idx_z), np.nan)
+    pc = np.stack([arr_x_cb[idx_x], arr_y_cb[idx_y], arr_z_cb[idx_z], power[is_valid], doppler], axis=1).astype(np.float32)
+    ### To point cloud (x, y, z, power, doppler) ###
+
+    os.makedirs(dir_pc, exist_ok=True)
+    with open(path_pc + '.tmp', 'wb') as f:
+        pc.tofile(f)
+    os.replace(path_pc + '.tmp', path_pc)
+
+    num_points = len(pc)
+    arr_thr = cfar.arr_thr_last # power threshold of the cells under test (CFAR)
+    is_thr = (arr_thr is not None) and (len(arr_thr) > 0)
+    return {
+        'seq': seq_id,
+        'rdr_idx': radar_idx,
+        'num_points': num_points,
+        'thr_mean': float(np.mean(arr_thr)) if is_thr else np.nan,
+        'thr_p50': float(np.percentile(arr_thr, 50)) if is_thr else np.nan,
+        'thr_p95': float(np.percentile(arr_thr, 95)) if is_thr else np.nan,
+        'min_power': float(np.min(pc[:,3])) if num_points > 0 else np.nan,
+        'max_power': float(np.max(pc[:,3])) if num_points > 0 else np.nan,
+        'ratio_invalid': float(np.count_nonzero(cube==-1.)/cube.size),
+        'time_load': t_load-t_start,
+        'time_cfar': t_cfar-t_load,
+    }
+
+def get_cfar_info(args):
+    cfar_params = CFAR([np.zeros(1)]*3)
+    return {
+        'type': args.type,
+        'split': args.split,
+        'path_cfg': args.path_cfg,
+        'grid_size': cfar_params.grid_size,
+        'n_half_guard_cell_zyx': cfar_params.n_half_guard_cell_zyx,
+        'n_half_train_cell_zyx': cfar_params.n_half_train_cell_zyx,
+        'fa_rate': cfar_params.fa_rate,
+        'thr_rate': cfar_params.thr_rate,
+        'num_sample_os_thr': cfar_params.num_sample_os_thr,
+        'top_percent': args.top_percent,
+        'columns': ['x', 'y', 'z', 'power', 'doppler'],
+        'dtype': 'float32',
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='generate cfar radar point clouds')
+    parser.add_argument('--path_cfg', type=str, default=PATH_CFG)
+    parser.add_argument('--split', type=str, default='train', choices=['train', 'test'])
+    parser.add_argument('--type', type=str, default='ca', choices=LIST_CFAR_TYPE)
+    parser.add_argument('--dir_save', type=str, default=DIR_SAVE)
+    parser.add_argument('--top_percent', type=float, default=0.1, help='for fixed')
+    parser.add_argument('--num_workers', type=int, default=8)
+    parser.add_argument('--is_skip_exist', action='store_true')
+    args = parser.parse_args()
+
+    init_worker(args)
+    list_path_label = list(dataset.label_paths)
+    print(f'* # of frames ({args.split}): {len(list_path_label)}')
+
+    os.makedirs(args.dir_save, exist_ok=True)
+    name_out = f'cfar_pc_{args.type}_{args.split}'
+    with open(osp.join(args.dir_save, f'{name_out}_info.json'), 'w') as f:
+        json.dump(get_cfar_info(args), f, indent=2)
+
+    list_stats = []
+    with Pool(args.num_workers, initializer=init_worker, initargs=(args,)) as pool:
+        for dict_stats in tqdm(pool.imap_unordered(process_frame, list_path_label, chunksize=4), total=len(list_path_label)):
+            if dict_stats is not None:
+                list_stats.append(dict_stats)
+
+    list_stats = sorted(list_stats, key=lambda x: (x['seq'], x['rdr_idx']))
+    with open(osp.join(args.dir_save, f'{name_out}_stats.csv'), 'w') as f:
+        f.write(','.join(LIST_STATS)+'\n')
+        for dict_stats in list_stats:
+            f.write(','.join([str(dict_stats[k]) for k in LIST_STATS])+'\n')
+
+    if len(list_stats) > 0:
+        arr_num_points = np.array([x['num_points'] for x in list_stats])
+        arr_time_cfar = np.array([x['time_cfar'] for x in list_stats])
+        print(f'* # of points: mean = {np.mean(arr_num_points):.1f}, min = {np.min(arr_num_points)}, max = {np.max(arr_num_points)}')
+        print(f'* cfar threshold (p50): mean = {np.nanmean([x["thr_p50"] for x in list_stats]):.4g}')
+        print(f'* cfar time: mean = {np.mean(arr_time_cfar):.3f} sec')
@@ -0,0 +1,131 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: python version of gen_4_get_bev_img.m & the bev part of gen_5_get_pc_img.m (process pool)
+*   os2-64/os2-64_<idx>.pcd -> lidar_bev_image/lidar_bev_<range>_<idx>.png (max height, density, intensity)
+*   radar_zyx_cube/cube_<idx>.mat -> radar_bev_image/radar_bev_<range>_<idx>.png (mean power [dB], jet)
+*   800 x 1280 images as the labeling ui: x in [0, range] (up), y in [-0.8*range, 0.8*range] (left is +y)
+*   --is_save_raster: float16 rasters (utils.util_bev) in <name>.npz next to the images
+*   --is_calib: lidar points are moved to the radar coordinate with info_calib/calib_radar_lidar.txt
+* e.g., python dataset_utils/data_converter/gen_bev_img.py --type lidar --num_workers 16
+'''
+
+import os
+import os.path as osp
+import sys
+import argparse
+import numpy as np
+import cv2
+from multiprocessing import Pool
+from scipy.io import loadmat
+from tqdm import tqdm
+
+sys.path.append(osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__)))))
+from utils.util_bev import get_bev_from_points, get_bev_from_cube, get_bev_img
+
+### Here to change ###
+LIST_DIR = ['/media/donghee/HDD_1/Radar_Data_Examples_2']
+GEN_DIR = None # None: in each sequence directory (overwriting)
+LIST_BEV_RANGE_LIDAR = [15, 30, 50, 100, 110]
+LIST_BEV_RANGE_RADAR = [15, 30, 50, 100]
+IMG_SIZE_HW = [800, 1280]
+RATIO_Y_TO_X = 0.8
+ROI_Z_LIDAR = [-5., 3.] # gen_5_get_pc_img.m
+LIST_RANGE_LIDAR = [[-2.0, 1.5], [0., 1.], [0., 128.]] # max height, density (log, normalized), intensity
+RANGE_POWER_RADAR = [40., 100.] # [dB]
+Z_OFFSET = 1.25 # for --is_calib (DATASET.Z_OFFSET)
+ARR_Z_CB = np.arange(-30, 30, 0.4) # KRadarDataset_v2_1
+ARR_Y_CB = np.arange(-80, 80, 0.4)
+ARR_X_CB = np.arange(0, 100, 0.4)
+### Here to change ###
+
+dict_args = None
+
+def init_worker(args):
+    global dict_args
+    dict_args = vars(args)
+
+def get_roi_bev(bev_range):
+    bin_xy = bev_range/IMG_SIZE_HW[0]
+    return [0., bin_xy, bev_range], [-RATIO_Y_TO_X*bev_range, bin_xy, RATIO_Y_TO_X*bev_range]
+
+def read_pcd(path_pcd):
+    '''
+    * ascii pcd (os2-64): x, y, z, intensity, t, reflectivity, ring, ambient, range
+    '''
+    with open(path_pcd, 'r') as f:
+        lines = f.readlines()
+    len_header = [idx for idx, line in enumerate(lines) if line.startswith('DATA')][0]+1
+    pc = np.loadtxt(lines[len_header:], dtype=np.float64, ndmin=2)[:,:4]
+    return pc[pc[:,0] > 0.01] # missing values
+
+def read_calib(path_calib):
+    with open(path_calib, 'r') as f:
+        lines = f.readlines()
+    list_calib = list(map(lambda x: float(x), lines[1].split(',')))
+    return np.array([list_calib[1], list_calib[2], Z_OFFSET])
+
+def save_img_and_raster(path_img, img, arr_raster):
+    with open(path_img + '.tmp', 'wb') as f:
+        f.write(cv2.imencode('.png', img)[1].tobytes())
+    os.replace(path_img + '.tmp', path_img)
+    if dict_args['is_save_raster']:
+        path_raster = path_img.replace('.png', '.npz')
+        with open(path_raster + '.tmp', 'wb') as f:
+            np.savez_compressed(f, bev=arr_raster.astype(np.float16))
+        os.replace(path_raster + '.tmp', path_raster)
+
+def gen_bev_lidar(paths):
+    path_pcd, path_calib, dir_save, idx_str = paths
+    pc = read_pcd(path_pcd)
+    if dict_args['is_calib']:
+        pc[:,:3] = pc[:,:3] + read_calib(path_calib)[np.newaxis,:]
+    for bev_range in LIST_BEV_RANGE_LIDAR:
+        roi_x, roi_y = get_roi_bev(bev_range)
+        arr_bev = get_bev_from_points(pc, roi_x, roi_y, ROI_Z_LIDAR, ['max_height', 'density', 'intensity'])
+        arr_vis = arr_bev.copy()
+        arr_vis[1] = np.minimum(1., np.log(arr_vis[1]+1.)/np.log(64.)) # density
+        arr_vis[1][arr_bev[1] == 0] = np.nan
+        img = get_bev_img(arr_vis, LIST_RANGE_LIDAR)
+        save_img_and_raster(osp.join(dir_save, f'lidar_bev_{bev_range}_{idx_str}.png'), img, arr_bev)
+
+def gen_bev_radar(paths):
+    path_cube, _, dir_save, idx_str = paths
+    arr_cube = np.flip(loadmat(path_cube)['arr_zyx'], axis=0) # z-axis is flipped
+    for bev_range in LIST_BEV_RANGE_RADAR:
+        roi_x, roi_y = get_roi_bev(bev_range)
+        arr_bev = get_bev_from_cube(arr_cube, ARR_Z_CB, ARR_Y_CB, ARR_X_CB, roi_x, roi_y)
+        img = get_bev_img(arr_bev, RANGE_POWER_RADAR, colormap=cv2.COLORMAP_JET)
+        save_img_and_raster(osp.join(dir_save, f'radar_bev_{bev_range}_{idx_str}.png'), img, arr_bev)
+
+def get_list_paths(type_data):
+    name_dir_in, name_dir_out = ('os2-64', 'lidar_bev_image') if type_data == 'lidar' else ('radar_zyx_cube', 'radar_bev_image')
+    list_paths = []
+    for path_dir in LIST_DIR:
+        for name_seq in sorted(os.listdir(path_dir)):
+            path_in_dir = osp.join(path_dir, name_seq, name_dir_in)
+            if not osp.exists(path_in_dir):
+                continue
+            dir_save = osp.join(path_dir if GEN_DIR is None else GEN_DIR, name_seq, name_dir_out)
+            os.makedirs(dir_save, exist_ok=True)
+            path_calib = osp.join(path_dir, name_seq, 'info_calib', 'calib_radar_lidar.txt')
+            for name_file in sorted(os.listdir(path_in_dir)):
+                idx_str = name_file.split('.')[0].split('_')[1]
+                list_paths.append((osp.join(path_in_dir, name_file), path_calib, dir_save, idx_str))
+    return list_paths
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='generate bev images of lidar point clouds & radar cubes')
+    parser.add_argument('--type', type=str, default='lidar', choices=['lidar', 'radar'])
+    parser.add_argument('--num_workers', type=int, default=8)
+    parser.add_argument('--is_save_raster', action='store_true')
+    parser.add_argument('--is_calib', action='store_true')
+    args = parser.parse_args()
+
+    list_paths = get_list_paths(args.type)
+    print(f'* Total frames = {len(list_paths)} ...')
+    func_gen = gen_bev_lidar if args.type == 'lidar' else gen_bev_radar
+    with Pool(args.num_workers, initializer=init_worker, initargs=(args,)) as pool:
+        for _ in tqdm(pool.imap_unordered(func_gen, list_paths, chunksize=4), total=len(list_paths)):
+            pass
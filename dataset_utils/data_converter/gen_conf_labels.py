@@ -0,0 +1,77 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: parallel version of KRadarDataset_v2_1.generate_gaussian_conf_labels
+*   <dir_gen>/<seq>/<file_name>.npz: float16 gaussian confidence label ('conf', 'roi_x', 'roi_y')
+*       (utils.util_dataset.save_conf_label, read by get_gen_conf_label with DATASET.LABEL.PRE_LABEL_DIR)
+*   gaussians are rendered only on the pixels of each box (utils.util_geometry.get_gaussian_patch_cart)
+* e.g., python dataset_utils/data_converter/gen_conf_labels.py --split train --gen_type cart --num_workers 16
+'''
+
+import os
+import os.path as osp
+import sys
+import argparse
+from multiprocessing import Pool
+from tqdm import tqdm
+
+sys.path.append(osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__)))))
+from utils.util_config import cfg, cfg_from_yaml_file
+from utils.util_geometry import get_gaussian_confidence_cart, change_arr_cart_to_polar_2d
+from utils.util_dataset import save_conf_label
+from datasets.kradar_dataset_v2_1 import KRadarDataset_v2_1
+
+### Here to change ###
+PATH_CFG = './configs/cfg_RTNH.yml'
+DIR_GEN = '/media/donghee/HDD_2/KRadar_Conf_Label'
+ROI_X_RES = [0.00, 0.16, 69.12] # [min, bin, max]
+ROI_Y_RES = [-39.68, 0.16, 39.68]
+### Here to change ###
+
+dataset = None
+dict_args = None
+
+def init_worker(args):
+    global dataset, dict_args
+    dict_args = vars(args)
+    cfg_dataset = cfg_from_yaml_file(args.path_cfg, cfg)
+    cfg_dataset.DATASET.GET_ITEM['rdr_tesseract'] = (args.gen_type == 'polar') # for arr_range & arr_azimuth
+    dataset = KRadarDataset_v2_1(cfg_dataset, split=args.split)
+
+def gen_conf_label(path_label):
+    dir_gen = osp.join(dict_args['dir_gen'], path_label.split('/')[-3])
+    file_name = path_label.split('/')[-1].split('.')[0]
+    path_gen = osp.join(dir_gen, f'{file_name}.npz')
+    if dict_args['is_skip_exist'] and osp.exists(path_gen):
+        return
+
+    path_header = path_label.split('/')[:-2]
+    path_calib = '/'+os.path.join(*path_header, 'info_calib', 'calib_radar_lidar.txt')
+    calib_info = dataset.get_calib_info(path_calib) if dataset.type_coord == 1 else None
+    bboxes = dataset.get_label_bboxes(path_label, calib_info)
+
+    arr_conf = get_gaussian_confidence_cart(roi_x=ROI_X_RES, roi_y=ROI_Y_RES, bboxes=bboxes)
+    if dict_args['gen_type'] == 'polar':
+        arr_conf = change_arr_cart_to_polar_2d(arr_conf, ROI_X_RES, ROI_Y_RES, dataset.arr_range, dataset.arr_azimuth)
+
+    os.makedirs(dir_gen, exist_ok=True)
+    save_conf_label(path_gen, arr_conf, ROI_X_RES, ROI_Y_RES)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='generate gaussian confidence labels')
+    parser.add_argument('--path_cfg', type=str, default=PATH_CFG)
+    parser.add_argument('--split', type=str, default='train', choices=['train', 'test'])
+    parser.add_argument('--gen_type', type=str, default='cart', choices=['cart', 'polar'])
+    parser.add_argument('--dir_gen', type=str, default=DIR_GEN)
+    parser.add_argument('--num_workers', type=int, default=8)
+    parser.add_argument('--is_skip_exist', action='store_true')
+    args = parser.parse_args()
+
+    init_worker(args)
+    list_path_label = list(dataset.label_paths)
+    print(f'* # of frames ({args.split}): {len(list_path_label)}')
+
+    with Pool(args.num_workers, initializer=init_worker, initargs=(args,)) as pool:
+        for _ in tqdm(pool.imap_unordered(gen_conf_label, list_path_label, chunksize=16), total=len(list_path_label)):
+            pass
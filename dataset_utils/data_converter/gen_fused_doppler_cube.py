@@ -0,0 +1,58 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: radar_tesseract (DREA) -> one float32 (4, Z, Y, X) cube per frame
+*   channels: mean power, max power, power-weighted mean doppler, argmax doppler
+*   <GEN_DIR>/<seq>/radar_cube_fused/cube_fused_<idx>.npy (used with DATASET.RDR_CUBE.DOPPLER.IS_FUSED)
+*   instead of radar_zyx_cube (gen_3_get_zyx_cube.m) & radar_cube_doppler (gen_doppler_ubuntu.m)
+'''
+
+import os
+import sys
+import os.path as osp
+import numpy as np
+from multiprocessing import Pool
+from scipy.io import loadmat
+from tqdm import tqdm
+
+sys.path.append(osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__)))))
+from utils.util_tesseract import load_physical_arrays, get_fused_doppler_cube
+
+### Here to change ###
+LIST_DIR = ['/media/donghee/HDD_1/Radar_Data_Examples_2']
+GEN_DIR = '/media/donghee/HDD_2/Radar_Data_Fused'
+NUM_WORKERS = 8
+IS_SKIP_EXIST = True
+### Here to change ###
+
+ARR_RANGE, ARR_AZIMUTH, ARR_ELEVATION, ARR_DOPPLER = load_physical_arrays()
+
+def gen_fused_cube(paths):
+    path_tesseract, path_save = paths
+    if IS_SKIP_EXIST and osp.exists(path_save):
+        return
+    arr_drea = loadmat(path_tesseract)['arrDREA']
+    arr_fused = get_fused_doppler_cube(arr_drea, ARR_RANGE, ARR_AZIMUTH, ARR_ELEVATION, ARR_DOPPLER)
+    with open(path_save + '.tmp', 'wb') as f:
+        np.save(f, arr_fused)
+    os.replace(path_save + '.tmp', path_save)
+
+if __name__ == '__main__':
+    list_paths = []
+    for path_dir in LIST_DIR:
+        for name_seq in sorted(os.listdir(path_dir)):
+            path_tes_dir = osp.join(path_dir, name_seq, 'radar_tesseract')
+            if not osp.exists(path_tes_dir):
+                continue
+            path_save_dir = osp.join(GEN_DIR, name_seq, 'radar_cube_fused')
+            os.makedirs(path_save_dir, exist_ok=True)
+            for rdr_tes in sorted(os.listdir(path_tes_dir)):
+                file_num = rdr_tes.split('.')[0].split('_')[1]
+                list_paths.append((osp.join(path_tes_dir, rdr_tes), \
+                                    osp.join(path_save_dir, f'cube_fused_{file_num}.npy')))
+
+    print(f'* Total frames = {len(list_paths)} ...')
+    with Pool(NUM_WORKERS) as pool:
+        for _ in tqdm(pool.imap_unordered(gen_fused_cube, list_paths), total=len(list_paths)):
+            pass
@@ -0,0 +1,109 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: numpy version of gen_1_load_data.m & gen_2_get_tesseract.m
+*   radar_bin_files/<seq>_<chip>.bin -> generated_files/<seq>/radar_tesseract/tesseract_<idx>.mat (arrDREA)
+*   calibration & dbf of srsAmanda (not public) are given as a .npz:
+*       'calib': complex (rx, chirps_per_loop, chips), 'steering': complex (elevation, azimuth, rx*chirps_per_loop*chips)
+*   frames are processed in parallel, window & zero-padding (# of bins) can be changed in DICT_PARAMS
+* e.g., python dataset_utils/data_converter/gen_tesseract.py
+*       python dataset_utils/data_converter/gen_tesseract.py --verify <path_tesseract.mat> --idx_frame 1
+'''
+
+import os
+import sys
+import argparse
+import os.path as osp
+import numpy as np
+from multiprocessing import Pool
+from scipy.io import loadmat, savemat
+from tqdm import tqdm
+
+sys.path.append(osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__)))))
+from utils.util_tesseract import get_tesseract_from_adc
+
+### Here to change ###
+PATH_BASE_DIR = '/media/donghee/HDD_1/radar_bin_lidar_bag_files'
+LIST_NAME_FILES = ['21_11_30_01', '21_11_30_03']
+PATH_CALIB = './resources/calib_dbf.npz'
+NUM_WORKERS = 8
+DTYPE_SAVE = np.float32 # np.float64 as the .mat of gen_2_get_tesseract.m
+DICT_PARAMS = {
+    'NUM_CHIPS': 4,
+    'NUM_ADC_SAMPLES': 256,
+    'NUM_RX': 4,
+    'NUM_CHIRPS_PER_LOOP': 12,
+    'NUM_CHIRP_LOOPS': 64,
+    'NUM_RANGE_BINS': 256,
+    'NUM_DOPPLER_BINS': 64,
+    'WINDOW_RANGE': None, # None (w/o windowing, as matlab), 'hann', 'hamming', 'blackman'
+    'WINDOW_DOPPLER': None,
+    'IS_FFTSHIFT_DOPPLER': True,
+    'IS_TDM_COMPENSATION': True,
+    'IS_POWER': True,
+}
+### Here to change ###
+
+CALIB, STEERING = None, None
+
+def init_worker(path_calib):
+    global CALIB, STEERING
+    dict_calib = np.load(path_calib)
+    CALIB = dict_calib['calib'] if 'calib' in dict_calib.files else None
+    STEERING = dict_calib['steering']
+
+def get_list_path_bin(name_file):
+    return [osp.join(PATH_BASE_DIR, 'radar_bin_files', f'{name_file}_{idx_chip}.bin') \
+                for idx_chip in range(1, DICT_PARAMS['NUM_CHIPS']+1)]
+
+def get_num_frames(list_path_bin):
+    size_frame = 2*2*DICT_PARAMS['NUM_ADC_SAMPLES']*DICT_PARAMS['NUM_RX']* \
+                    DICT_PARAMS['NUM_CHIRPS_PER_LOOP']*DICT_PARAMS['NUM_CHIRP_LOOPS'] # int16, I & Q
+    return min([os.path.getsize(path_bin) for path_bin in list_path_bin])//size_frame
+
+def gen_tesseract(args):
+    name_file, idx_frame = args # idx_frame from 1 as matlab
+    path_save = osp.join(PATH_BASE_DIR, 'generated_files', name_file, 'radar_tesseract', f'tesseract_{idx_frame:05d}.mat')
+    arr_drea = get_tesseract_from_adc(get_list_path_bin(name_file), idx_frame-1, DICT_PARAMS, CALIB, STEERING)
+    with open(path_save + '.tmp', 'wb') as f:
+        savemat(f, {'arrDREA': arr_drea.astype(DTYPE_SAVE)})
+    os.replace(path_save + '.tmp', path_save)
+
+def verify(path_ref, name_file, idx_frame):
+    '''
+    * compare with a tesseract from gen_2_get_tesseract.m
+    '''
+    arr_ref = loadmat(path_ref)['arrDREA'].astype(np.float64)
+    arr_drea = get_tesseract_from_adc(get_list_path_bin(name_file), idx_frame-1, DICT_PARAMS, CALIB, STEERING).astype(np.float64)
+    if arr_ref.shape != arr_drea.shape:
+        print(f'* shape is different: ref {arr_ref.shape}, gen {arr_drea.shape}')
+        return
+    rel_err = np.linalg.norm(arr_drea-arr_ref)/np.linalg.norm(arr_ref)
+    corr = np.corrcoef(np.log10(arr_drea.reshape(-1)+1.), np.log10(arr_ref.reshape(-1)+1.))[0,1]
+    is_same_peak = np.array_equal(np.argmax(arr_drea, axis=0), np.argmax(arr_ref, axis=0))
+    print(f'* relative error = {rel_err:.3e}, corr (log) = {corr:.5f}, same doppler argmax = {is_same_peak}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='generate radar tesseracts from adc')
+    parser.add_argument('--path_calib', type=str, default=PATH_CALIB)
+    parser.add_argument('--verify', type=str, default=None, help='path of a tesseract .mat to compare')
+    parser.add_argument('--name_file', type=str, default=LIST_NAME_FILES[0], help='for verify')
+    parser.add_argument('--idx_frame', type=int, default=1, help='for verify (from 1)')
+    args = parser.parse_args()
+
+    init_worker(args.path_calib)
+    if args.verify is not None:
+        verify(args.verify, args.name_file, args.idx_frame)
+        sys.exit(0)
+
+    list_args = []
+    for name_file in LIST_NAME_FILES:
+        num_frames = get_num_frames(get_list_path_bin(name_file))
+        print(f'* {name_file}: total frames = {num_frames} ...')
+        os.makedirs(osp.join(PATH_BASE_DIR, 'generated_files', name_file, 'radar_tesseract'), exist_ok=True)
+        list_args.extend([(name_file, idx_frame) for idx_frame in range(1, num_frames+1)])
+
+    with Pool(NUM_WORKERS, initializer=init_worker, initargs=(args.path_calib,)) as pool:
+        for _ in tqdm(pool.imap_unordered(gen_tesseract, list_args), total=len(list_args)):
+            pass
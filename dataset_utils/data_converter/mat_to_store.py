@@ -0,0 +1,106 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: parallel version of mat_to_pickle.py
+*   radar_tesseract/tesseract_<idx>.mat -> <GEN_DIR>/<seq>/rdr_<idx>.npz (utils.util_tesseract.save_tesseract_store)
+*   float32/float16, compressed chunks along range (partial reads), atomic writes
+*   <GEN_DIR>/<seq>/manifest.txt: file name, sha1 (one line per converted frame)
+*       frames in the manifest are skipped (resume), --verify checks sha1 of every stored frame
+'''
+
+import os
+import sys
+import argparse
+import os.path as osp
+import numpy as np
+from multiprocessing import Pool
+from scipy.io import loadmat
+from tqdm import tqdm
+
+sys.path.append(osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__)))))
+from utils.util_tesseract import save_tesseract_store, load_tesseract_store
+
+### Here to change ###
+LIST_DIR = ['/media/donghee/HDD_1/Radar_Data_Examples_2']
+GEN_DIR = '/media/donghee/HDD_2/KRadar_Store'
+NUM_WORKERS = 8
+### Here to change ###
+
+NAME_MANIFEST = 'manifest.txt'
+
+def read_manifest(path_seq_save):
+    path_manifest = osp.join(path_seq_save, NAME_MANIFEST)
+    dict_manifest = dict()
+    if osp.exists(path_manifest):
+        with open(path_manifest, 'r') as f:
+            for line in f.readlines():
+                name_file, checksum = line.strip().split(',')
+                dict_manifest[name_file] = checksum
+    return dict_manifest
+
+def convert(args):
+    path_tesseract, path_save, dtype, len_chunk, is_compress = args
+    arr_tesseract = loadmat(path_tesseract)['arrDREA']
+    checksum = save_tesseract_store(path_save, arr_tesseract, dtype, len_chunk, is_compress)
+    return path_save, checksum
+
+def verify(args):
+    path_save, checksum = args
+    try:
+        load_tesseract_store(path_save, is_verify=True)
+        with np.load(path_save, allow_pickle=False) as store:
+            if str(store['sha1']) != checksum:
+                raise ValueError(f'* checksum is different from manifest: {path_save}')
+        return path_save, True
+    except Exception as e:
+        print(e)
+        return path_save, False
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='convert radar tesseract .mat to compressed npz store')
+    parser.add_argument('--dtype', type=str, default='float32', choices=['float64', 'float32', 'float16'])
+    parser.add_argument('--len_chunk', type=int, default=32, help='# of range bins per chunk')
+    parser.add_argument('--no_compress', action='store_true')
+    parser.add_argument('--num_workers', type=int, default=NUM_WORKERS)
+    parser.add_argument('--verify', action='store_true', help='check the stored frames only')
+    args = parser.parse_args()
+
+    list_args = []
+    dict_manifest_per_seq = dict()
+    for path_dir in LIST_DIR:
+        for name_seq in sorted(os.listdir(path_dir)):
+            path_tes_dir = osp.join(path_dir, name_seq, 'radar_tesseract')
+            if not osp.exists(path_tes_dir):
+                continue
+            path_seq_save = osp.join(GEN_DIR, name_seq)
+            os.makedirs(path_seq_save, exist_ok=True)
+            dict_manifest = read_manifest(path_seq_save)
+            dict_manifest_per_seq[path_seq_save] = dict_manifest
+            for rdr_tes in sorted(os.listdir(path_tes_dir)):
+                file_num = rdr_tes.split('.')[0].split('_')[1]
+                name_save = f'rdr_{file_num}.npz'
+                if (name_save in dict_manifest.keys()) and osp.exists(osp.join(path_seq_save, name_save)):
+                    continue # resume
+                list_args.append((osp.join(path_tes_dir, rdr_tes), osp.join(path_seq_save, name_save), \
+                                    np.dtype(args.dtype), args.len_chunk, not args.no_compress))
+
+    if args.verify:
+        list_paths = [(osp.join(path_seq_save, name_file), checksum) for path_seq_save, dict_manifest \
+                        in dict_manifest_per_seq.items() for name_file, checksum in dict_manifest.items()]
+        list_fails = []
+        with Pool(args.num_workers) as pool:
+            for path_save, is_valid in tqdm(pool.imap_unordered(verify, list_paths), total=len(list_paths)):
+                if not is_valid:
+                    list_fails.append(path_save)
+        print(f'* verified {len(list_paths)-len(list_fails)}/{len(list_paths)} frames')
+        for path_save in list_fails:
+            print(f'* failed: {path_save}')
+        sys.exit(0)
+
+    print(f'* Total frames to convert = {len(list_args)} ...')
+    with Pool(args.num_workers) as pool:
+        for path_save, checksum in tqdm(pool.imap_unordered(convert, list_args), total=len(list_args)):
+            # written after the file is complete, so an interrupted frame is converted again
+            with open(osp.join(osp.dirname(path_save), NAME_MANIFEST), 'a') as f:
+                f.write(f'{osp.basename(path_save)},{checksum}\n')
@@ -0,0 +1,297 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: statistics of a split (process pool) -> one json summary
+*   histograms: class, box size (l, w, h), center z, distance, azimuth, heading, # of objects per frame
+*   tags (description.txt): # of frames & objects per road type, capture time, climate
+*   radar power inside boxes (--is_power, rdr cube): mean/max power [dB] & # of valid cells per box
+*   per class: mean, std, percentiles of size & z -> anchor_sizes, anchor_bottom_heights (RdrCubeSedanHead)
+*   roi: percentiles of box centers -> RDR_CB_ROI
+*   every label is counted (CLASS_ID -1 & outside of roi too), 'in_roi' is the label roi of the cfg
+* e.g., python dataset_utils/label_dist/gen_dataset_stats.py --split train --is_power --num_workers 16
+'''
+
+import os
+import os.path as osp
+import sys
+import json
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from scipy.io import loadmat
+from tqdm import tqdm
+
+sys.path.append(osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__)))))
+from utils.util_config import cfg, cfg_from_yaml_file
+from datasets.kradar_dataset_v2_1 import KRadarDataset_v2_1
+from utils.util_geometry import Object3D
+
+### Here to change ###
+PATH_CFG = './configs/cfg_RTNH.yml'
+PATH_SAVE = './resources/stats'
+DICT_BINS = { # [min, max, step]
+    'l': [0., 20., 0.2],
+    'w': [0., 5., 0.1],
+    'h': [0., 5., 0.1],
+    'z': [-5., 5., 0.1],
+    'distance': [0., 120., 2.],
+    'azimuth': [-90., 90., 2.], # [deg]
+    'heading': [-180., 180., 5.], # [deg]
+    'num_objs': [0, 30, 1],
+    'power': [0., 200., 1.], # [dB]
+    'num_cells': [0, 2000, 10],
+}
+LIST_PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+### Here to change ###
+
+LIST_OBJ_KEYS = ['in_roi', 'x', 'y', 'z', 'l', 'w', 'h', 'heading', 'distance', 'azimuth']
+LIST_TAG_KEYS = ['road_type', 'capture_time', 'climate']
+
+dataset = None
+dict_args = None
+
+def init_worker(args):
+    global dataset, dict_args
+    dict_args = vars(args)
+    cfg_dataset = cfg_from_yaml_file(args.path_cfg, cfg)
+    cfg_dataset.DATASET.GET_ITEM['rdr_tesseract'] = False
+    cfg_dataset.DATASET.GET_ITEM['rdr_cube'] = True # for arr_*_cb and roi indices
+    cfg_dataset.DATASET.RDR_CUBE.DOPPLER.IS_GET_DOPPLER = False
+    dataset = KRadarDataset_v2_1(cfg_dataset, split=args.split)
+
+    ### Every label for statistics ###
+    dataset.roi_label_cfg = dataset.roi_label
+    dataset.is_roi_check_with_azimuth_cfg = dataset.is_roi_check_with_azimuth
+    dataset.roi_label = [-np.inf, -np.inf, -np.inf, np.inf, np.inf, np.inf]
+    dataset.is_roi_check_with_azimuth = False
+    dataset.dict_cls_id_cfg = dict(dataset.cfg.DATASET.CLASS_ID)
+    for name_cls, idx_cls in dataset.cfg.DATASET.CLASS_ID.items():
+        if idx_cls == -1:
+            dataset.cfg.DATASET.CLASS_ID[name_cls] = 0 # not to be filtered in get_tuple_object
+    ### Every label for statistics ###
+
+def is_in_label_roi(x, y, z, l, w, h, theta):
+    '''
+    * same condition as KRadarDataset_v2_1.get_tuple_object
+    '''
+    x_min, y_min, z_min, x_max, y_max, z_max = dataset.roi_label_cfg
+    if not ((x > x_min) and (x < x_max) and (y > y_min) and (y < y_max) and (z > z_min) and (z < z_max)):
+        return False
+    if dataset.is_roi_check_with_azimuth_cfg:
+        min_azi, max_azi = dataset.max_azimtuth_rad
+        obj3d = Object3D(x, y, z, l, w, h, theta)
+        for pt in [obj3d.corners[0,:], obj3d.corners[2,:], obj3d.corners[4,:], obj3d.corners[6,:]]:
+            azimuth_apex = np.arctan2(-pt[1], pt[0])
+            if (azimuth_apex < min_azi) or (azimuth_apex > max_azi):
+                return False
+    return True
+
+def get_power_in_boxes(arr_cube, list_objs):
+    '''
+    * arr_cube: (Z, Y, X) in roi, -1 for invalid
+    * out: (N, 3) mean power [dB], max power [dB], # of valid cells (nan for boxes without valid cells)
+    '''
+    arr_z_cb, arr_y_cb, arr_x_cb = dataset.arr_z_cb, dataset.arr_y_cb, dataset.arr_x_cb
+    arr_power = np.full((len(list_objs), 3), np.nan)
+    for idx_obj, (_, _, [x, y, z, theta, l, w, h], _) in enumerate(list_objs):
+        # candidate cells from the circumscribed box
+        rad_xy = np.sqrt(l**2+w**2)/2.
+        idx_x = np.where((arr_x_cb >= x-rad_xy) & (arr_x_cb <= x+rad_xy))[0]
+        idx_y = np.where((arr_y_cb >= y-rad_xy) & (arr_y_cb <= y+rad_xy))[0]
+        idx_z = np.where((arr_z_cb >= z-h/2.) & (arr_z_cb <= z+h/2.))[0]
+        if (len(idx_x) == 0) or (len(idx_y) == 0) or (len(idx_z) == 0):
+            arr_power[idx_obj,2] = 0
+            continue
+
+        # rotated box in bev
+        grid_y, grid_x = np.meshgrid(arr_y_cb[idx_y]-y, arr_x_cb[idx_x]-x, indexing='ij')
+        cos_th, sin_th = np.cos(theta), np.sin(theta)
+        local_x = grid_x*cos_th + grid_y*sin_th
+        local_y = -grid_x*sin_th + grid_y*cos_th
+        mask_bev = (np.abs(local_x) <= l/2.) & (np.abs(local_y) <= w/2.)
+
+        arr_cell = arr_cube[idx_z[0]:idx_z[-1]+1,idx_y[0]:idx_y[-1]+1,idx_x[0]:idx_x[-1]+1][:,mask_bev]
+        arr_cell = arr_cell[arr_cell != -1.]
+        arr_cell = arr_cell[arr_cell > 0.]
+        arr_power[idx_obj,2] = len(arr_cell)
+        if len(arr_cell) > 0:
+            arr_power[idx_obj,0] = 10*np.log10(np.mean(arr_cell))
+            arr_power[idx_obj,1] = 10*np.log10(np.max(arr_cell))
+    return arr_power
+
+def process_frame(path_label):
+    seq_id, radar_idx, _, _ = dataset.get_data_indices(path_label)
+    path_header = path_label.split('/')[:-2]
+    path_calib = '/'+os.path.join(*path_header, 'info_calib', 'calib_radar_lidar.txt')
+    path_desc = '/'+os.path.join(*path_header, 'description.txt')
+
+    calib_info = dataset.get_calib_info(path_calib) if dataset.type_coord == 1 else None
+    list_objs = dataset.get_label_bboxes(path_label, calib_info)
+    dict_desc = dataset.get_description(path_desc)
+
+    arr_objs = np.zeros((len(list_objs), len(LIST_OBJ_KEYS)))
+    list_cls = []
+    for idx_obj, (cls_name, _, [x, y, z, theta, l, w, h], _) in enumerate(list_objs):
+        list_cls.append(cls_name)
+        arr_objs[idx_obj,:] = [is_in_label_roi(x, y, z, l, w, h, theta), x, y, z, l, w, h, \
+            theta*180./np.pi, np.sqrt(x**2+y**2), np.arctan2(y, x)*180./np.pi]
+
+    arr_power = None
+    if dict_args['is_power']:
+        path_cube = '/'+os.path.join(*path_header, 'radar_zyx_cube', 'cube_'+radar_idx+'.mat')
+        arr_cube = np.flip(loadmat(path_cube)['arr_zyx'], axis=0)
+        if dataset.is_consider_roi_rdr_cb:
+            idx_z_min, idx_z_max, idx_y_min, idx_y_max, idx_x_min, idx_x_max = dataset.list_roi_idx_cb
+            arr_cube = arr_cube[idx_z_min:idx_z_max+1,idx_y_min:idx_y_max+1,idx_x_min:idx_x_max+1]
+        arr_power = get_power_in_boxes(arr_cube, list_objs)
+
+    return {
+        'seq': seq_id,
+        'cls': list_cls,
+        'objs': arr_objs,
+        'power': arr_power,
+        'desc': {k: v.strip() for k, v in dict_desc.items()},
+    }
+
+def get_hist(arr, key):
+    val_min, val_max, val_step = DICT_BINS[key]
+    arr_edges = np.arange(val_min, val_max+val_step/2., val_step)
+    arr = arr[np.isfinite(arr)]
+    hist, _ = np.histogram(np.clip(arr, val_min, val_max), bins=arr_edges) # out of range -> end bins
+    return {'edges': np.round(arr_edges, 4).tolist(), 'counts': hist.tolist()}
+
+def get_summary_values(arr):
+    arr = arr[np.isfinite(arr)]
+    if len(arr) == 0:
+        return None
+    dict_summary = {'mean': float(np.mean(arr)), 'std': float(np.std(arr)), \
+        'min': float(np.min(arr)), 'max': float(np.max(arr))}
+    for per, val in zip(LIST_PERCENTILES, np.percentile(arr, LIST_PERCENTILES)):
+        dict_summary[f'p{per}'] = float(val)
+    return dict_summary
+
+def get_stats(list_frames, is_power):
+    list_cls = [cls_name for dict_frame in list_frames for cls_name in dict_frame['cls']]
+    arr_cls = np.array(list_cls)
+    arr_objs = np.concatenate([dict_frame['objs'] for dict_frame in list_frames], axis=0) \
+        if len(list_cls) > 0 else np.zeros((0, len(LIST_OBJ_KEYS)))
+    dict_objs = {key: arr_objs[:,idx] for idx, key in enumerate(LIST_OBJ_KEYS)}
+    is_in_roi = dict_objs['in_roi'] == 1.
+    if is_power:
+        arr_power = np.concatenate([dict_frame['power'] for dict_frame in list_frames], axis=0) \
+            if len(list_cls) > 0 else np.zeros((0, 3))
+
+    dict_stats = {
+        'num_frames': len(list_frames),
+        'num_objs': len(list_cls),
+        'num_objs_in_roi': int(np.count_nonzero(is_in_roi)),
+        'hist_num_objs_per_frame': get_hist(np.array([len(x['cls']) for x in list_frames], dtype=float), 'num_objs'),
+        'per_class': dict(),
+        'per_tag': dict(),
+    }
+
+    ### Class ###
+    for cls_name in sorted(set(list_cls)):
+        is_cls = arr_cls == cls_name
+        dict_cls = {
+            'num_objs': int(np.count_nonzero(is_cls)),
+            'num_objs_in_roi': int(np.count_nonzero(is_cls & is_in_roi)),
+            'class_id': int(dataset.dict_cls_id_cfg.get(cls_name, -1)),
+        }
+        for is_only_roi in [False, True]:
+            is_valid = (is_cls & is_in_roi) if is_only_roi else is_cls
+            name_postfix = '_in_roi' if is_only_roi else ''
+            for key in ['l', 'w', 'h', 'z', 'distance', 'azimuth', 'heading']:
+                dict_cls[f'{key}{name_postfix}'] = get_summary_values(dict_objs[key][is_valid])
+                dict_cls[f'hist_{key}{name_postfix}'] = get_hist(dict_objs[key][is_valid], key)
+            if is_power:
+                dict_cls[f'power_mean{name_postfix}'] = get_summary_values(arr_power[is_valid,0])
+                dict_cls[f'hist_power_mean{name_postfix}'] = get_hist(arr_power[is_valid,0], 'power')
+                dict_cls[f'hist_power_max{name_postfix}'] = get_hist(arr_power[is_valid,1], 'power')
+                dict_cls[f'hist_num_cells{name_postfix}'] = get_hist(arr_power[is_valid,2], 'num_cells')
+
+        # anchor (median box in roi, bottom = center z - h/2)
+        is_valid = (is_cls & is_in_roi) if np.count_nonzero(is_cls & is_in_roi) > 0 else is_cls
+        l, w, h, z = [float(np.median(dict_objs[key][is_valid])) for key in ['l', 'w', 'h', 'z']]
+        dict_cls['anchor'] = {
+            'class_name': cls_name,
+            'anchor_sizes': [[round(l, 2), round(w, 2), round(h, 2)]],
+            'anchor_bottom_heights': [round(z-h/2., 2)],
+        }
+        dict_stats['per_class'][cls_name] = dict_cls
+    ### Class ###
+
+    ### Tag ###
+    arr_idx_frame = np.concatenate([np.full(len(x['cls']), idx) for idx, x in enumerate(list_frames)]).astype(int) \
+        if len(list_cls) > 0 else np.zeros(0, dtype=int)
+    for key_tag in LIST_TAG_KEYS:
+        arr_tag_frame = np.array([x['desc'][key_tag] for x in list_frames])
+        arr_tag_obj = arr_tag_frame[arr_idx_frame]
+        dict_tag = dict()
+        for name_tag in sorted(set(arr_tag_frame.tolist())):
+            is_tag = arr_tag_obj == name_tag
+            dict_tag[name_tag] = {
+                'num_frames': int(np.count_nonzero(arr_tag_frame == name_tag)),
+                'num_seqs': len(set([x['seq'] for x in list_frames if x['desc'][key_tag] == name_tag])),
+                'num_objs': int(np.count_nonzero(is_tag)),
+                'num_objs_in_roi': int(np.count_nonzero(is_tag & is_in_roi)),
+                'num_objs_per_class': {cls_name: int(np.count_nonzero(is_tag & (arr_cls == cls_name))) \
+                    for cls_name in sorted(set(list_cls))},
+            }
+            if is_power:
+                dict_tag[name_tag]['power_mean_in_roi'] = get_summary_values(arr_power[is_tag & is_in_roi,0])
+        dict_stats['per_tag'][key_tag] = dict_tag
+    ### Tag ###
+
+    ### ROI (box centers in cfg roi) ###
+    dict_stats['roi'] = {
+        'label_roi_cfg': [float(x) for x in dataset.roi_label_cfg],
+        'x': get_summary_values(dict_objs['x']),
+        'y': get_summary_values(dict_objs['y']),
+        'z': get_summary_values(dict_objs['z']),
+        'hist_distance': get_hist(dict_objs['distance'], 'distance'),
+        'hist_azimuth': get_hist(dict_objs['azimuth'], 'azimuth'),
+    }
+    ### ROI (box centers in cfg roi) ###
+
+    return dict_stats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='statistics of labels, tags & radar power of a split')
+    parser.add_argument('--path_cfg', type=str, default=PATH_CFG)
+    parser.add_argument('--split', type=str, default='train', choices=['train', 'test'])
+    parser.add_argument('--path_save', type=str, default=PATH_SAVE)
+    parser.add_argument('--is_power', action='store_true', help='radar power inside boxes (loading rdr cubes)')
+    parser.add_argument('--num_workers', type=int, default=8)
+    args = parser.parse_args()
+
+    init_worker(args)
+    list_path_label = list(dataset.label_paths)
+    print(f'* # of frames ({args.split}): {len(list_path_label)}')
+
+    list_frames = []
+    with Pool(args.num_workers, initializer=init_worker, initargs=(args,)) as pool:
+        for dict_frame in tqdm(pool.imap_unordered(process_frame, list_path_label, chunksize=16), total=len(list_path_label)):
+            list_frames.append(dict_frame)
+    list_frames = sorted(list_frames, key=lambda x: x['seq'])
+
+    dict_stats = get_stats(list_frames, args.is_power)
+    dict_stats['info'] = {
+        'path_cfg': args.path_cfg,
+        'split': args.split,
+        'is_power': args.is_power,
+        'bins': DICT_BINS,
+        'percentiles': LIST_PERCENTILES,
+    }
+
+    os.makedirs(args.path_save, exist_ok=True)
+    path_json = osp.join(args.path_save, f'stats_{args.split}.json')
+    with open(path_json + '.tmp', 'w') as f:
+        json.dump(dict_stats, f, indent=2)
+    os.replace(path_json + '.tmp', path_json)
+
+    print(f'* # of objects: {dict_stats["num_objs"]} (in roi: {dict_stats["num_objs_in_roi"]})')
+    for cls_name, dict_cls in dict_stats['per_class'].items():
+        print(f'* {cls_name}: {dict_cls["num_objs_in_roi"]}/{dict_cls["num_objs"]}, anchor = {dict_cls["anchor"]}')
+    print(f'* saved in {path_json}')
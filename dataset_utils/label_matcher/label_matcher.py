@@ -9,8 +9,50 @@ PATH_SEQ = '/media/donghee/5_SSD/radar_bin_lidar_bag_files/generated_files/25'
 FRAME_DIFFERNECE = 6
 X_CALIB = -2.640
 Y_CALIB = +0.500
+TOLERANCE = 0.05 # [s], matches with larger offset are reported
 ### Here to change ###
 
+def get_nearest_indices(arr_query, arr_time):
+    '''
+    * same as [np.argmin(np.abs(arr_time-t)) for t in arr_query] (first index for ties)
+    *   with one sort of arr_time & searchsorted for all queries
+    '''
+    arr_query = np.asarray(arr_query, dtype=np.float64)
+    arr_time = np.asarray(arr_time, dtype=np.float64)
+    idx_sort = np.argsort(arr_time, kind='stable')
+    arr_sorted = arr_time[idx_sort]
+
+    idx_right = np.clip(np.searchsorted(arr_sorted, arr_query, side='left'), 0, len(arr_sorted)-1)
+    idx_left = np.clip(idx_right-1, 0, len(arr_sorted)-1)
+    idx_left = np.searchsorted(arr_sorted, arr_sorted[idx_left], side='left') # first of equal times
+
+    diff_left = np.abs(arr_sorted[idx_left]-arr_query)
+    diff_right = np.abs(arr_sorted[idx_right]-arr_query)
+    cand_left, cand_right = idx_sort[idx_left], idx_sort[idx_right]
+    is_left = (diff_left < diff_right) | ((diff_left == diff_right) & (cand_left < cand_right))
+
+    return np.where(is_left, cand_left, cand_right)
+
+def match_sensors(arr_query, dict_sensors, tolerance=TOLERANCE):
+    '''
+    * dict_sensors: name -> (list of str idx, list of float time)
+    * returns name -> (list of matched str idx, offsets [s]) & prints offset distribution
+    '''
+    dict_matched = dict()
+    for name_sensor, (list_idx, list_time) in dict_sensors.items():
+        idx_nearest = get_nearest_indices(arr_query, list_time)
+        offsets = np.array(list_time, dtype=np.float64)[idx_nearest]-arr_query
+        dict_matched[name_sensor] = ([list_idx[idx] for idx in idx_nearest], offsets)
+
+        if len(offsets) == 0:
+            continue
+        abs_offsets = np.abs(offsets)
+        num_over = np.count_nonzero(abs_offsets > tolerance)
+        print(f'* {name_sensor}: offset [s] mean = {np.mean(offsets):.4f}, median(abs) = {np.median(abs_offsets):.4f}, ' + \
+            f'p95(abs) = {np.percentile(abs_offsets, 95):.4f}, max(abs) = {np.max(abs_offsets):.4f}, ' + \
+            f'> {tolerance}s: {num_over}/{len(offsets)}')
+    return dict_matched
+
 def get_dict_and_list_time_info(path_time_info):
     f = open(path_time_info, 'r')
     lines = f.readlines()
@@ -70,7 +112,8 @@ if __name__ == '__main__':
 
     # print(dict_os2, lst_os2)
     
-    num_avail = 0
+    ### Available labels (radar & lidar exist) ###
+    list_avail = []
     for name_label in list_name_label:
         temp_list_str_idx = name_label.split('.')[0].split('_')
         # rar_idx_b4 = int(temp_list_str_idx[0])
@@ -99,16 +142,30 @@ if __name__ == '__main__':
         if not osp.exists(temp_path_lar):
             print(f'{temp_path_lar} does not exist!')
             continue
-        
+
+        list_avail.append((name_label, rar_idx, lar_idx))
+    ### Available labels (radar & lidar exist) ###
+
+    ### Matching all sensors at once (criterion is os2-64 timestamp) ###
+    list_str_time = [dict_os2[lar_idx] for _, _, lar_idx in list_avail]
+    arr_query = np.array(list(map(lambda x: float(x), list_str_time)), dtype=np.float64)
+    dict_matched = match_sensors(arr_query, {
+        'cam-front': (list(dict_camf.keys()), lst_camf),
+        'os1-128': (list(dict_os1.keys()), lst_os1),
+        'cam-left': (list(dict_camlrr.keys()), lst_camlrr),
+    })
+    ### Matching all sensors at once (criterion is os2-64 timestamp) ###
+
+    num_avail = 0
+    for idx_avail, (name_label, rar_idx, lar_idx) in enumerate(list_avail):
         # make new available labels
         f = open(osp.join(PATH_SEQ, 'info_label', name_label), 'r')
         lines = f.readlines()
-        str_time = dict_os2[lar_idx]
-        flt_time = float(str_time)
+        str_time = list_str_time[idx_avail]
 
-        camf_idx = list(dict_camf.keys())[np.argmin(np.abs(np.array(lst_camf)-flt_time))]
-        os1_idx = list(dict_os1.keys())[np.argmin(np.abs(np.array(lst_os1)-flt_time))]
-        camlrr_idx = list(dict_camlrr.keys())[np.argmin(np.abs(np.array(lst_camlrr)-flt_time))]
+        camf_idx = dict_matched['cam-front'][0][idx_avail]
+        os1_idx = dict_matched['os1-128'][0][idx_avail]
+        camlrr_idx = dict_matched['cam-left'][0][idx_avail]
         
         name_file = f'{rar_idx}_{lar_idx}.txt'
         txt_new = f'* idx(tesseract_os2-64_cam-front_os1-128_cam-lrr)={rar_idx}_{lar_idx}_{camf_idx}_{os1_idx}_{camlrr_idx}, timestamp={str_time}'
@@ -22,11 +22,15 @@ try:
     from utils.util_geometry import *
     from utils.util_geometry import Object3D
     from utils.util_dataset import *
+    from utils.util_tesseract import load_tesseract_store
+    from utils.util_augment import SparseCubeAugmentor
 except:
     sys.path.append(osp.dirname(osp.dirname(osp.abspath(__file__))))
     from utils.util_geometry import *
     from utils.util_geometry import Object3D
     from utils.util_dataset import *
+    from utils.util_tesseract import load_tesseract_store
+    from utils.util_augment import SparseCubeAugmentor
 
 class KRadarDataset_v2_1(Dataset):
     def __init__(self, cfg=None, split='train'):
@@ -34,16 +38,9 @@ class KRadarDataset_v2_1(Dataset):
         self.cfg = cfg
 
         ### Load label paths wrt split ###
-        # load label paths
+        # label paths are loaded on first use (see label_paths)
         self.split = split # 'train', 'test'
-        self.dict_split = self.get_split_dict(self.cfg.DATASET.SPLIT.PATH_SPLIT[split])
-        self.label_paths = [] # a list of dic
-        for dir_seq in self.cfg.DATASET.SPLIT.LIST_DIR:
-            list_seq = os.listdir(dir_seq)
-            for seq in list_seq:
-                seq_label_paths = sorted(glob(osp.join(dir_seq, seq, 'info_label', '*.txt')))
-                seq_label_paths = list(filter(lambda x: (x.split('/')[-1].split('.')[0] in self.dict_split[seq]), seq_label_paths))
-                self.label_paths.extend(seq_label_paths)
+        self.list_label_paths = None
 
         # load generated labels (Gaussian confidence)
         self.is_use_gen_labels = self.cfg.DATASET.LABEL.IS_USE_PREDEFINED_LABEL
@@ -65,10 +62,13 @@ class KRadarDataset_v2_1(Dataset):
             self.is_consider_roi_rdr = cfg.DATASET.RDR.IS_CONSIDER_ROI_RDR
             if self.is_consider_roi_rdr:
                 self.consider_roi_rdr(cfg.DATASET.RDR.RDR_POLAR_ROI)
+            # compressed store from dataset_utils/data_converter/mat_to_store.py (None: .mat)
+            self.dir_tesseract_store = cfg.DATASET.RDR.get('DIR_TESSERACT_STORE', None)
         ### Radar Tesseract ###
 
         ### Radar Cube ###
         self.is_get_cube_dop = False
+        self.is_cube_fused = False
         if self.cfg.DATASET.GET_ITEM['rdr_cube']:
             # dealing cube data
             _, _, _, self.arr_doppler = self.load_physical_values(is_with_doppler=True)
@@ -101,6 +101,12 @@ class KRadarDataset_v2_1(Dataset):
                 self.is_get_cube_dop = False
                 self.is_dop_another_dir = False
                 self.dir_dop = None
+            try:
+                self.is_cube_fused = cfg.DATASET.RDR_CUBE.DOPPLER.IS_FUSED
+                self.dir_fused = cfg.DATASET.RDR_CUBE.DOPPLER.DIR_FUSED
+            except:
+                self.is_cube_fused = False
+                self.dir_fused = None
         ### Radar Cube ###
 
         ### Considering Label ###
@@ -122,6 +128,14 @@ class KRadarDataset_v2_1(Dataset):
         else:
             raise AttributeError('ROI_CONSIDER_LABEL_TYPE should be cube or default.')
         ### Considering Label ###
+
+        ### Augmentation (train split, per batch in collate_fn_train) ###
+        self.augmentor = None
+        cfg_aug = self.cfg.DATASET.get('AUGMENTATION', None)
+        if (cfg_aug is not None) and cfg_aug.get('IS_AUGMENT', False) and (split == 'train'):
+            max_azimuth_rad = self.max_azimtuth_rad if self.is_roi_check_with_azimuth else None
+            self.augmentor = SparseCubeAugmentor(self.cfg, self.roi_label, max_azimuth_rad)
+        ### Augmentation (train split, per batch in collate_fn_train) ###
         
         ### Lidar ###
         # (TBD)
@@ -131,6 +145,33 @@ class KRadarDataset_v2_1(Dataset):
         # (TBD)
         ### Camera ###
 
+    @property
+    def label_paths(self):
+        '''
+        * walking the sequence dirs is slow, e.g., not needed for the physical values of the pipeline
+        '''
+        if self.list_label_paths is None:
+            self.list_label_paths = self.load_label_paths()
+        return self.list_label_paths
+
+    def load_label_paths(self):
+        self.dict_split = self.get_split_dict(self.cfg.DATASET.SPLIT.PATH_SPLIT[self.split])
+        label_paths = [] # a list of dic
+        for dir_seq in self.cfg.DATASET.SPLIT.LIST_DIR:
+            list_seq = os.listdir(dir_seq)
+            for seq in list_seq:
+                seq_label_paths = sorted(glob(osp.join(dir_seq, seq, 'info_label', '*.txt')))
+                seq_label_paths = list(filter(lambda x: (x.split('/')[-1].split('.')[0] in self.dict_split[seq]), seq_label_paths))
+                label_paths.extend(seq_label_paths)
+        return label_paths
+
+    def get_tesseract_shape(self):
+        '''
+        * (doppler, range, azimuth, elevation) of get_tesseract (in DRAE) from the physical values in roi
+        '''
+        num_doppler = len(self.load_physical_values(is_with_doppler=True)[3])
+        return (num_doppler, len(self.arr_range), len(self.arr_azimuth), len(self.arr_elevation))
+
     def get_split_dict(self, path_split):
         f = open(path_split, 'r')
         lines = f.readlines()
@@ -335,13 +376,23 @@ class KRadarDataset_v2_1(Dataset):
 
     def get_tesseract(self, path_tesseract, is_in_DRAE=True, is_in_3d=False, is_in_log=False):
         # Otherwise you make the input as 4D, you should not get the data as log scale
-        arr_tesseract = loadmat(path_tesseract)['arrDREA']
+        if path_tesseract.endswith('.npz'): # store, read only the range bins in roi
+            idx_range = None
+            if self.is_consider_roi_rdr:
+                idx_range = [self.list_roi_idx[0], self.list_roi_idx[1]+1]
+            arr_tesseract = load_tesseract_store(path_tesseract, idx_range)
+        else:
+            arr_tesseract = loadmat(path_tesseract)['arrDREA']
         
         if is_in_DRAE:
             arr_tesseract = np.transpose(arr_tesseract, (0, 1, 3, 2))
 
         ### considering ROI ###
-        if self.is_consider_roi_rdr:
+        if self.is_consider_roi_rdr and path_tesseract.endswith('.npz'):
+            idx_r_0, idx_r_1, idx_a_0, idx_a_1, \
+                idx_e_0, idx_e_1 = self.list_roi_idx
+            arr_tesseract = arr_tesseract[:,:,idx_a_0:idx_a_1+1,idx_e_0:idx_e_1+1]
+        elif self.is_consider_roi_rdr:
             # print(self.list_roi_idx)
             idx_r_0, idx_r_1, idx_a_0, idx_a_1, \
                 idx_e_0, idx_e_1 = self.list_roi_idx
@@ -366,6 +417,12 @@ class KRadarDataset_v2_1(Dataset):
         '''
         arr_cube = np.flip(loadmat(path_cube)['arr_zyx'], axis=0) # z-axis is flipped
 
+        return self.process_cube(arr_cube, is_in_log, mode)
+
+    def process_cube(self, arr_cube, is_in_log=False, mode=0):
+        '''
+        * arr_cube: flipped arr_zyx (-1 for invalid)
+        '''
         # print(arr_cube.shape)
         # print(np.count_nonzero(arr_cube==-1.))
 
@@ -419,6 +476,9 @@ class KRadarDataset_v2_1(Dataset):
         arr_cube = np.flip(loadmat(path_cube_doppler)['arr_zyx'], axis=0)
         # print(np.count_nonzero(arr_cube==-1.)) # no value -1. in doppler cube
 
+        return self.process_cube_doppler(arr_cube, dummy_value)
+
+    def process_cube_doppler(self, arr_cube, dummy_value=0.):
         ### Change -1. to -10. in server ###
         arr_cube[np.where(arr_cube==-10.)] = dummy_value
 
@@ -430,6 +490,18 @@ class KRadarDataset_v2_1(Dataset):
 
         return arr_cube
 
+    def get_cube_fused(self, path_cube_fused, is_in_log=False, mode=0, dummy_value=0.):
+        '''
+        * one (4, Z, Y, X) file from utils.util_tesseract.get_fused_doppler_cube
+        *   (mean_power, max_power, mean_doppler, argmax_doppler) instead of cube & doppler cube
+        * returns the outputs of get_cube & get_cube_doppler
+        '''
+        arr_fused = np.flip(np.load(path_cube_fused), axis=1) # z-axis is flipped
+        ret_cube = self.process_cube(arr_fused[0].astype(np.float64), is_in_log, mode)
+        arr_cube_doppler = self.process_cube_doppler(arr_fused[3].astype(np.float64), dummy_value)
+
+        return ret_cube, arr_cube_doppler
+
     def get_pc_lidar(self, path_lidar, calib_info=None):
         pc_lidar = []
         with open(path_lidar, 'r') as f:
@@ -455,6 +527,9 @@ class KRadarDataset_v2_1(Dataset):
     def get_gen_conf_label(self, path_label):
         # label dir, exp name, sequence, file name
         file_name = path_label.split('/')[-1].split('.')[0]
+        path_gen = osp.join(self.pre_label_dir, path_label.split('/')[-3], f'{file_name}.npz')
+        if osp.exists(path_gen): # float16 store (dataset_utils/data_converter/gen_conf_labels.py)
+            return load_conf_label(path_gen)
         path_gen = osp.join(self.pre_label_dir, path_label.split('/')[-3], f'{file_name}.bin')
         with open(path_gen, 'rb') as f:
             gen_conf_label = pickle.load(f)
@@ -573,6 +648,8 @@ class KRadarDataset_v2_1(Dataset):
             path_cam_front = '/'+os.path.join(*path_header, 'cam-front', 'cam-front_'+camf_idx+'.png')
             path_calib = '/'+os.path.join(*path_header, 'info_calib', 'calib_radar_lidar.txt')
             path_desc = '/'+os.path.join(*path_header, 'description.txt')
+            if self.cfg.DATASET.GET_ITEM['rdr_tesseract'] and (self.dir_tesseract_store is not None):
+                path_radar_tesseract = os.path.join(self.dir_tesseract_store, path_header[-1], 'rdr_'+radar_idx+'.npz')
             path_cube_doppler = None
             if self.is_get_cube_dop:
                 if self.is_dop_another_dir:
@@ -580,6 +657,10 @@ class KRadarDataset_v2_1(Dataset):
                 else:
                     path_cube_doppler = '/'+os.path.join(*path_header, 'radar_cube_doppler', 'radar_cube_doppler_'+radar_idx+'.mat')
 
+            path_cube_fused = None
+            if self.is_cube_fused:
+                path_cube_fused = os.path.join(self.dir_fused, path_header[-1], 'radar_cube_fused', 'cube_fused_'+radar_idx+'.npy')
+
             meta = {
                 'path_label': path_label,
                 'seq_id': seq_id,
@@ -595,6 +676,7 @@ class KRadarDataset_v2_1(Dataset):
                 'path_cam_front': path_cam_front,
                 'path_calib': path_calib,
                 'path_cube_doppler': path_cube_doppler,
+                'path_cube_fused': path_cube_fused,
                 'path_desc': path_desc
             }
 
@@ -623,12 +705,19 @@ class KRadarDataset_v2_1(Dataset):
 
                     dic['sparse_cube'] = sparse_cube[:11520] # 0.9 quantile so that we don't need to make new collate_fn
                     
+                elif self.is_cube_fused: # one file for power & doppler
+                    (rdr_cube, none_zero_mask, rdr_cube_cnt), rdr_cube_doppler = self.get_cube_fused(path_cube_fused, mode=0)
+                    dic['rdr_cube'] = rdr_cube
+                    dic['rdr_cube_mask'] = none_zero_mask
+                    dic['rdr_cube_cnt'] = rdr_cube_cnt
+                    if self.cfg.DATASET.GET_ITEM['rdr_cube_doppler']:
+                        dic['rdr_cube_doppler'] = rdr_cube_doppler
                 else:    
                     rdr_cube, none_zero_mask, rdr_cube_cnt = self.get_cube(dic['meta']['path_rdr_cube'], mode=0)
                     dic['rdr_cube'] = rdr_cube
                     dic['rdr_cube_mask'] = none_zero_mask
                     dic['rdr_cube_cnt'] = rdr_cube_cnt
-            if self.is_get_cube_dop:
+            if self.is_get_cube_dop and (not ('rdr_cube_doppler' in dic.keys())):
                 if self.cfg.DATASET.GET_ITEM['rdr_cube_doppler']:
                     path_cube_doppler = dic['meta']['path_cube_doppler']
                     dic['rdr_cube_doppler'] = self.get_cube_doppler(path_cube_doppler) if os.path.exists(path_cube_doppler) else None
@@ -665,9 +754,10 @@ class KRadarDataset_v2_1(Dataset):
 
             return None
     
-    def collate_fn(self, list_dict_batch):
+    def collate_fn(self, list_dict_batch, is_train=False):
         '''
         * list_dict_batch = list of item (__getitem__)
+        * is_train: augmentation (DATASET.AUGMENTATION) only for the train loader (collate_fn_train)
         '''
         if None in list_dict_batch:
             return None
@@ -711,11 +801,17 @@ class KRadarDataset_v2_1(Dataset):
                         pass    
         dict_batch['batch_size'] = batch_id+1
 
+        if is_train and (self.augmentor is not None):
+            dict_batch = self.augmentor(dict_batch)
+
         # t2 = time.time()
         # print(f"* d1: {t2 - t1:.5f} sec")
 
         return dict_batch
 
+    def collate_fn_train(self, list_dict_batch):
+        return self.collate_fn(list_dict_batch, is_train=True)
+
 if __name__ == '__main__':
     ### temp library ###
     import yaml
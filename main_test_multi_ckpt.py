@@ -0,0 +1,20 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+'''
+
+import os
+os.environ['CUDA_VISIBLE_DEVICES'] = '0'
+
+from pipelines.pipeline_v2_1 import Pipeline_v2_1
+
+### Here to change ###
+PATH_EXP = './logs/Rdr4DNet_12_2_12_17_6'
+LIST_EPOCH = [6, 7, 8, 9] # e.g., last N epochs
+### Here to change ###
+
+if __name__ == '__main__':
+    pline = Pipeline_v2_1('./configs/cfg_RTNH.yml', split='test', mode='train/val')
+    list_path_dict_model = [os.path.join(PATH_EXP, 'models', f'model_{epoch}.pt') for epoch in LIST_EPOCH]
+    pline.validate_kitti_multi_ckpt(list_path_dict_model, list_conf_thr = [0.3, 0.5, 0.7], is_subset=False)
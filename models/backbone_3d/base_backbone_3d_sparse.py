@@ -3,6 +3,46 @@ import torch.nn as nn
 import math
 
 import spconv.pytorch as spconv
+try:
+    from spconv.constants import FILTER_HWIO
+except:
+    FILTER_HWIO = True # spconv < 2.2: weight in (*kernel_size, in, out)
+
+__all__ = [ 'BaseBackbone3DSparse', \
+            'get_bev_from_sparse_tensor', ]
+
+def get_bev_from_sparse_tensor(sp_tensor, conv_bev, bn_bev, relu):
+    '''
+    * conv_bev (spconv.SparseConv3d with kernel (Z, 1, 1), z-collapsing) -> bn_bev -> relu -> .dense().squeeze(2)
+    *   without the rulebook of spconv & the dense tensor of the conv output:
+    *   voxels are grouped by bev sites (b, y, x) with torch.unique, z columns of each site -> one matmul
+    *   bn_bev (& statistics in training) on active sites only as spconv, inactive sites are zeros as .dense()
+    * out: (B, C, Y, X)
+    '''
+    z_shape, y_shape, x_shape = sp_tensor.spatial_shape
+    if FILTER_HWIO:
+        weight = conv_bev.weight[:, 0, 0] # (Z, in, out)
+    else:
+        weight = conv_bev.weight[:, :, 0, 0].permute(1, 2, 0) # (out, Z, in) -> (Z, in, out)
+    kz, in_channels, out_channels = weight.shape
+    if z_shape != kz:
+        raise AttributeError(f'* z of the sparse tensor ({z_shape}) should be the z kernel of conv_bev ({kz})')
+
+    indices = sp_tensor.indices.long() # (N, 4) b, z, y, x
+    features = sp_tensor.features
+    idx_site = (indices[:, 0]*y_shape + indices[:, 2])*x_shape + indices[:, 3]
+    idx_site, idx_inverse = torch.unique(idx_site, return_inverse=True)
+
+    cols = features.new_zeros((len(idx_site), kz, in_channels))
+    cols[idx_inverse, indices[:, 1]] = features
+    features_bev = torch.matmul(cols.view(-1, kz*in_channels), weight.reshape(kz*in_channels, out_channels))
+    if conv_bev.bias is not None:
+        features_bev = features_bev + conv_bev.bias
+    features_bev = relu(bn_bev(features_bev))
+
+    bev = features_bev.new_zeros((sp_tensor.batch_size*y_shape*x_shape, out_channels))
+    bev[idx_site] = features_bev
+    return bev.view(sp_tensor.batch_size, y_shape, x_shape, out_channels).permute(0, 3, 1, 2).contiguous()
 
 class BaseBackbone3DSparse(nn.Module):
     def __init__(self, cfg):
@@ -41,6 +81,8 @@ class BaseBackbone3DSparse(nn.Module):
         self.bnBEV3 = nn.BatchNorm1d(256)
 
         self.relu = nn.ReLU()
+        # False: spconv z-collapsing conv & .dense() (same output, for checking)
+        self.is_scatter_bev = self.cfg.MODEL.BACKBONE.get('IS_SCATTER_BEV', True)
 
         self.convtrans2d_1 = nn.ConvTranspose2d(in_channels=64, out_channels=256, kernel_size=3, stride=1)
         self.bnt1 = nn.BatchNorm2d(256)
@@ -89,9 +131,12 @@ class BaseBackbone3DSparse(nn.Module):
         x = self.subm1b(x)
         x = x.replace_feature(self.bn1b(x.features))
         x = x.replace_feature(self.relu(x.features))
-        bev_1 = self.toBEV1(x)
-        bev_1 = bev_1.replace_feature(self.bnBEV1(bev_1.features))
-        bev_1 = bev_1.replace_feature(self.relu(bev_1.features))
+        if self.is_scatter_bev:
+            bev_1 = get_bev_from_sparse_tensor(x, self.toBEV1, self.bnBEV1, self.relu)
+        else:
+            bev_1 = self.toBEV1(x)
+            bev_1 = bev_1.replace_feature(self.bnBEV1(bev_1.features))
+            bev_1 = bev_1.replace_feature(self.relu(bev_1.features)).dense().squeeze(2)
 
 
 
@@ -104,9 +149,12 @@ class BaseBackbone3DSparse(nn.Module):
         x = self.subm2b(x)
         x = x.replace_feature(self.bn2b(x.features))
         x = x.replace_feature(self.relu(x.features))
-        bev_2 = self.toBEV2(x)
-        bev_2 = bev_2.replace_feature(self.bnBEV2(bev_2.features))
-        bev_2 = bev_2.replace_feature(self.relu(bev_2.features))
+        if self.is_scatter_bev:
+            bev_2 = get_bev_from_sparse_tensor(x, self.toBEV2, self.bnBEV2, self.relu)
+        else:
+            bev_2 = self.toBEV2(x)
+            bev_2 = bev_2.replace_feature(self.bnBEV2(bev_2.features))
+            bev_2 = bev_2.replace_feature(self.relu(bev_2.features)).dense().squeeze(2)
 
 
 
@@ -119,19 +167,22 @@ class BaseBackbone3DSparse(nn.Module):
         x = self.subm3b(x)
         x = x.replace_feature(self.bn3b(x.features))
         x = x.replace_feature(self.relu(x.features))
-        bev_3 = self.toBEV3(x)
-        bev_3 = bev_3.replace_feature(self.bnBEV3(bev_3.features))
-        bev_3 = bev_3.replace_feature(self.relu(bev_3.features))
+        if self.is_scatter_bev:
+            bev_3 = get_bev_from_sparse_tensor(x, self.toBEV3, self.bnBEV3, self.relu)
+        else:
+            bev_3 = self.toBEV3(x)
+            bev_3 = bev_3.replace_feature(self.bnBEV3(bev_3.features))
+            bev_3 = bev_3.replace_feature(self.relu(bev_3.features)).dense().squeeze(2)
         
-        bev_1 = self.convtrans2d_1(bev_1.dense().squeeze(2)) # B, C, X, Y
+        bev_1 = self.convtrans2d_1(bev_1) # B, C, X, Y
         bev_1 = self.bnt1(bev_1)
         bev_1 = self.relu(bev_1)
 
-        bev_2 = self.convtrans2d_2(bev_2.dense().squeeze(2)) # B, C, X, Y
+        bev_2 = self.convtrans2d_2(bev_2) # B, C, X, Y
         bev_2 = self.bnt2(bev_2)
         bev_2 = self.relu(bev_2)
 
-        bev_3 = self.convtrans2d_3(bev_3.dense().squeeze(2)) # B, C, X, Y
+        bev_3 = self.convtrans2d_3(bev_3) # B, C, X, Y
         bev_3 = self.bnt3(bev_3)
         bev_3 = self.relu(bev_3)
 
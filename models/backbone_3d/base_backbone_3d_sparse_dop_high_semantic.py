@@ -2,6 +2,7 @@ import torch
 import torch.nn as nn
 
 import spconv.pytorch as spconv
+from .base_backbone_3d_sparse import get_bev_from_sparse_tensor
 
 class BaseBackbone3DSparseModule(nn.Module):
     def __init__(self, cfg):
@@ -40,6 +41,8 @@ class BaseBackbone3DSparseModule(nn.Module):
         self.bnBEV3 = nn.BatchNorm1d(256)
 
         self.relu = nn.ReLU()
+        # False: spconv z-collapsing conv & .dense() (same output, for checking)
+        self.is_scatter_bev = self.cfg.MODEL.BACKBONE.get('IS_SCATTER_BEV', True)
 
     def forward(self, input_sp_tensor):
         x = self.input_conv(input_sp_tensor)
@@ -53,9 +56,12 @@ class BaseBackbone3DSparseModule(nn.Module):
         x = self.subm1b(x)
         x = x.replace_feature(self.bn1b(x.features))
         x = x.replace_feature(self.relu(x.features))
-        bev_1 = self.toBEV1(x)
-        bev_1 = bev_1.replace_feature(self.bnBEV1(bev_1.features))
-        bev_1 = bev_1.replace_feature(self.relu(bev_1.features))
+        if self.is_scatter_bev:
+            bev_1 = get_bev_from_sparse_tensor(x, self.toBEV1, self.bnBEV1, self.relu)
+        else:
+            bev_1 = self.toBEV1(x)
+            bev_1 = bev_1.replace_feature(self.bnBEV1(bev_1.features))
+            bev_1 = bev_1.replace_feature(self.relu(bev_1.features)).dense().squeeze(2)
 
         x = self.spconv2(x)
         x = x.replace_feature(self.bn2(x.features))
@@ -66,9 +72,12 @@ class BaseBackbone3DSparseModule(nn.Module):
         x = self.subm2b(x)
         x = x.replace_feature(self.bn2b(x.features))
         x = x.replace_feature(self.relu(x.features))
-        bev_2 = self.toBEV2(x)
-        bev_2 = bev_2.replace_feature(self.bnBEV2(bev_2.features))
-        bev_2 = bev_2.replace_feature(self.relu(bev_2.features))
+        if self.is_scatter_bev:
+            bev_2 = get_bev_from_sparse_tensor(x, self.toBEV2, self.bnBEV2, self.relu)
+        else:
+            bev_2 = self.toBEV2(x)
+            bev_2 = bev_2.replace_feature(self.bnBEV2(bev_2.features))
+            bev_2 = bev_2.replace_feature(self.relu(bev_2.features)).dense().squeeze(2)
 
         x = self.spconv3(x)
         x = x.replace_feature(self.bn3(x.features))
@@ -79,11 +88,14 @@ class BaseBackbone3DSparseModule(nn.Module):
         x = self.subm3b(x)
         x = x.replace_feature(self.bn3b(x.features))
         x = x.replace_feature(self.relu(x.features))
-        bev_3 = self.toBEV3(x)
-        bev_3 = bev_3.replace_feature(self.bnBEV3(bev_3.features))
-        bev_3 = bev_3.replace_feature(self.relu(bev_3.features))
+        if self.is_scatter_bev:
+            bev_3 = get_bev_from_sparse_tensor(x, self.toBEV3, self.bnBEV3, self.relu)
+        else:
+            bev_3 = self.toBEV3(x)
+            bev_3 = bev_3.replace_feature(self.bnBEV3(bev_3.features))
+            bev_3 = bev_3.replace_feature(self.relu(bev_3.features)).dense().squeeze(2)
         
-        return [bev_1.dense().squeeze(2), bev_2.dense().squeeze(2), bev_3.dense().squeeze(2)]
+        return [bev_1, bev_2, bev_3]
 
 import math
 
@@ -279,8 +279,9 @@ class PointPillarHead(nn.Module):
         return total_loss
 
     def logging_dict_loss(self, loss, name_key):
+        # detached tensor, copied to the host at the flush of the pipeline (no sync per iteration)
         try:
-            log_loss = loss.cpu().detach().item()
+            log_loss = loss.detach()
         except:
             log_loss = loss
         
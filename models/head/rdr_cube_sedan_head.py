@@ -10,6 +10,7 @@ import nms
 
 from utils.Rotated_IoU.oriented_iou_loss import cal_iou
 from utils.util_geometry import Object3D
+from utils.util_profiler import get_profiler
 
 class FocalLoss(nn.Module):
     def __init__(self, weight=None, 
@@ -81,6 +82,7 @@ class RdrCubeSedanHead(nn.Module):
         self.bg_weight = cfg.MODEL.HEAD.BG_WEIGHT
         self.categorical_focal_loss = FocalLoss()
         self.is_logging = cfg.GENERAL.LOGGING.IS_LOGGING
+        self.nms_overlap_thresh = cfg.MODEL.HEAD.get('NMS_OVERLAP_THRESH', 0.3)
 
     def forward(self, data_dic):
         spatial_features_2d = data_dic['out_feat']
@@ -104,14 +106,19 @@ class RdrCubeSedanHead(nn.Module):
         return data_dic
 
     def loss(self, data_dic):
+        '''
+        * anchor decoding, cal_iou & focal loss in float32 (outside the autocast of the pipeline)
+        '''
+        with torch.autocast(device_type=data_dic['preds']['cls_preds'].device.type, enabled=False):
+            return self.get_loss_fp32(data_dic)
+
+    def get_loss_fp32(self, data_dic):
         # import time
         # start_time = time.time()
 
-        dtype, device = data_dic['preds']['cls_preds'].dtype, data_dic['preds']['cls_preds'].device 
-
-        anchor_maps = data_dic['anchor_maps'] # B x Num_Anc * C x W x H --> xc,yc,zc,...,cos,sin,xc,yc,...
-        cls_preds = data_dic['preds']['cls_preds'] # B x Num_Anc * C x W x H
-        box_preds = data_dic['preds']['box_preds'] # B x Num_Anc * C x W x H
+        anchor_maps = data_dic['anchor_maps'].float() # B x Num_Anc * C x W x H --> xc,yc,zc,...,cos,sin,xc,yc,...
+        cls_preds = data_dic['preds']['cls_preds'].float() # B x Num_Anc * C x W x H
+        box_preds = data_dic['preds']['box_preds'].float() # B x Num_Anc * C x W x H
 
         box_preds = anchor_maps + box_preds # change prediction into residuals
         
@@ -136,6 +143,8 @@ class RdrCubeSedanHead(nn.Module):
 
         is_label_valid = False
 
+        profiler = get_profiler() # stages of the loss (GENERAL.PROFILE)
+        profiler.start('loss/target_assignment')
         for batch_id, batch_labels in enumerate(data_dic['labels']):
             # print('* labels: ',batch_labels)
 
@@ -226,6 +235,7 @@ class RdrCubeSedanHead(nn.Module):
                         cls_targets[batch_id, W_target, H_target] = temp_id
                         pos_box_preds.append(box_preds[batch_id:batch_id+1, temp_id-1, :, W_target, H_target])
                         pos_box_targets.append(torch.tensor([[xc, yc, zc, xl, yl, zl, np.cos(rz).item(), np.sin(rz).item()]], dtype = dtype, device = device))
+        profiler.stop('loss/target_assignment')
                     
         # start_loss_calc = time.time()
 
@@ -244,15 +254,19 @@ class RdrCubeSedanHead(nn.Module):
 
             cls_weights = torch.ones(self.num_anchors_per_location + 1, device = device)
 
+            profiler.start('loss/regression')
             pos_box_preds = torch.cat(pos_box_preds)
             pos_box_targets = torch.cat(pos_box_targets)
             loss_reg = torch.nn.functional.smooth_l1_loss(pos_box_preds, pos_box_targets)
+            profiler.stop('loss/regression')
             
             # default 100
             cls_weights[0] = min(self.bg_weight/neg_ious_ind.shape[0], 1) # weights for background class
         
+            profiler.start('loss/focal')
             self.categorical_focal_loss.weight = cls_weights
             focal_loss_cls = self.categorical_focal_loss(cls_preds_counted, cls_targets_counted.long())
+            profiler.stop('loss/focal')
 
         total_loss = focal_loss_cls + loss_reg
 
@@ -265,8 +279,9 @@ class RdrCubeSedanHead(nn.Module):
         return total_loss
 
     def logging_dict_loss(self, loss, name_key):
+        # detached tensor, copied to the host at the flush of the pipeline (no sync per iteration)
         try:
-            log_loss = loss.cpu().detach().item()
+            log_loss = loss.detach()
         except:
             log_loss = loss
         
@@ -282,7 +297,8 @@ class RdrCubeSedanHead(nn.Module):
         x_max = x_max + self.cfg.DATASET.RDR_CUBE.GRID_SIZE
         y_max = y_max + self.cfg.DATASET.RDR_CUBE.GRID_SIZE
         B, _, y_grid_range, x_grid_range = data_dic['preds']['cls_preds'].shape
-        dtype, device = data_dic['preds']['cls_preds'].dtype, data_dic['preds']['cls_preds'].device
+        device = data_dic['preds']['cls_preds'].device
+        dtype = torch.promote_types(data_dic['preds']['cls_preds'].dtype, torch.float32) # anchors in float32 with autocast
         x_grid_size, y_grid_size = (x_max - x_min) / x_grid_range, (y_max - y_min) / y_grid_range
 
         # print(x_grid_size, y_grid_size)
@@ -305,74 +321,69 @@ class RdrCubeSedanHead(nn.Module):
 
         return batch_anchor_map
 
+    def get_pred_boxes_for_single_datum(self, dict_out, conf_thr):
+        '''
+        * Decoded boxes before nms, None if no box is over conf_thr
+        *   cared_boxes_with_scores: N_proposals x 8 (scores, xc, yc, zc, xl, yl, zl, angle)
+        *   cls_ids: N_proposals
+        * Assume batch size = 1
+        '''
+        anchors = self.create_anchors(dict_out)[0]
+        cls_preds, box_preds = dict_out['preds']['cls_preds'][0].float(), dict_out['preds']['box_preds'][0].float() # decoding in float32
+
+        cls_preds, box_preds, anchors = cls_preds.view(cls_preds.shape[0], -1), box_preds.view(box_preds.shape[0], -1), anchors.view(anchors.shape[0], -1)
+        cared_idx = torch.where((torch.argmax(cls_preds, dim = 0) > 0) & (torch.max(torch.softmax(cls_preds, dim = 0), dim=0)[0] > conf_thr))
+        cls_preds = torch.softmax(cls_preds, dim = 0)
+
+        cared_cls_preds, cared_box_preds, cared_anchors = cls_preds[:, cared_idx[0]],  box_preds[:, cared_idx[0]], anchors[:, cared_idx[0]] # Remove background predictions
+        cared_cls_preds_id = torch.argmax(cared_cls_preds, dim = 0)
+
+        cared_boxes = []
+        cared_boxes_with_scores = []
+        cls_ids = []
+        for i, cls_id in enumerate(cared_cls_preds_id):
+            score = cared_cls_preds[cls_id][i:i+1]
+            start_id = (cls_id - 1)*8 # len(self.cfg.DATASET.BOX_CODE)
+            residuals = cared_box_preds[start_id:start_id+8, i]
+            anchor = cared_anchors[start_id:start_id+8, i]
+            pred_cos_sin = residuals + anchor
+
+            ### Check atan2 or atan ###
+            angle = torch.atan2(pred_cos_sin[-1], pred_cos_sin[-2]).unsqueeze(0)
+            pred = torch.concat((pred_cos_sin[:-2], angle))
+            cared_boxes.append(pred)
+    
+            pred_with_scores = torch.concat((score, pred_cos_sin[:-2], angle))
+            cared_boxes_with_scores.append(pred_with_scores)
+            cls_ids.append(cls_id)
+
+        if len(cared_boxes) == 0:
+            # empty prediction
+            return None, None
+        
+        cared_boxes_with_scores = torch.stack(cared_boxes_with_scores) # N_proposals x 8 (scores, xc, yc, zc, xl, yl, zl, angle)
+        cls_ids = torch.stack(cls_ids)
+
+        return cared_boxes_with_scores, cls_ids
+
     def get_pred_boxes_nms_for_single_datum(self, dict_out, conf_thr):
         '''
         * Assume batch size = 1
+        * dict_out can be reused for several conf_thr (boxes of the previous conf_thr are removed if empty)
         '''
         try:
-            anchors = self.create_anchors(dict_out)[0]
-            cls_preds, box_preds = dict_out['preds']['cls_preds'][0], dict_out['preds']['box_preds'][0]
-
-            cls_preds, box_preds, anchors = cls_preds.view(cls_preds.shape[0], -1), box_preds.view(box_preds.shape[0], -1), anchors.view(anchors.shape[0], -1)
-            cared_idx = torch.where((torch.argmax(cls_preds, dim = 0) > 0) & (torch.max(torch.softmax(cls_preds, dim = 0), dim=0)[0] > conf_thr))
-            cls_preds = torch.softmax(cls_preds, dim = 0)
-
-            cared_cls_preds, cared_box_preds, cared_anchors = cls_preds[:, cared_idx[0]],  box_preds[:, cared_idx[0]], anchors[:, cared_idx[0]] # Remove background predictions
-            cared_cls_preds_id = torch.argmax(cared_cls_preds, dim = 0)
-
-            cared_boxes = []
-            cared_boxes_with_scores = []
-            cls_ids = []
-            for i, cls_id in enumerate(cared_cls_preds_id):
-                score = cared_cls_preds[cls_id][i:i+1]
-                start_id = (cls_id - 1)*8 # len(self.cfg.DATASET.BOX_CODE)
-                residuals = cared_box_preds[start_id:start_id+8, i]
-                anchor = cared_anchors[start_id:start_id+8, i]
-                pred_cos_sin = residuals + anchor
-
-                ### Check atan2 or atan ###
-                angle = torch.atan2(pred_cos_sin[-1], pred_cos_sin[-2]).unsqueeze(0)
-                pred = torch.concat((pred_cos_sin[:-2], angle))
-                cared_boxes.append(pred)
-        
-                pred_with_scores = torch.concat((score, pred_cos_sin[:-2], angle))
-                cared_boxes_with_scores.append(pred_with_scores)
-                cls_ids.append(cls_id)
+            cared_boxes_with_scores, cls_ids = self.get_pred_boxes_for_single_datum(dict_out, conf_thr)
 
-            if len(cared_boxes) == 0:
+            if cared_boxes_with_scores is None:
                 # empty prediction
-                pass
+                dict_out.pop('pred_boxes_nms', None)
+                dict_out.pop('pred_cls_ids', None)
+                dict_out['desc'][0].update({'is_nms': True})
+                dict_out['pred_desc'] = dict_out['desc'][0]
             else:
-                cared_boxes = torch.stack(cared_boxes)
-                cared_boxes_with_scores = torch.stack(cared_boxes_with_scores) # N_proposals x 8 (scores, xc, yc, zc, xl, yl, zl, angle)
-                cls_ids = torch.stack(cls_ids)
-
-                scores = cared_boxes_with_scores[:, 0:1].cpu().detach().numpy()
-                xc_tensor, yc_tensor = cared_boxes_with_scores[:, 1:2], cared_boxes_with_scores[:, 2:3]
-                xl_tensor, yl_tensor = cared_boxes_with_scores[:, 4:5], cared_boxes_with_scores[:, 5:6]
-                angle_tensor = cared_boxes_with_scores[:, 7:8] 
-
-                c_array = torch.cat((xc_tensor, yc_tensor), dim = 1).cpu().detach().numpy()
-                dim_array = torch.cat((xl_tensor, yl_tensor), dim = 1).cpu().detach().numpy()
-                angle_array = angle_tensor.cpu().detach().numpy()
-
-                c_list = list(map(tuple, c_array))
-                dim_list = list(map(tuple, dim_array))
-                angle_list = list(map(float, angle_array))
-
-                boxes = [[a, b , c] for (a, b, c) in zip(c_list, dim_list, angle_list)]
-
-                nms_overlap_thresh = 0.3
-                ### If NMS error, do not calculate nms ###
-                try:
-                    keep_indices = nms.rboxes(boxes, scores, nms_threshold=nms_overlap_thresh)
-                    cared_boxes_with_scores = cared_boxes_with_scores[keep_indices]
-                    cls_ids = cls_ids[keep_indices]
-                    dict_out['desc'][0].update({'is_nms': True})
-                except:
-                    dict_out['desc'][0].update({'is_nms': False})
-                    pass
-                ### If NMS error, do not calculate nms ###
+                cared_boxes_with_scores, cls_ids, is_nms = get_nms_pred_boxes(cared_boxes_with_scores, cls_ids, \
+                                                                self.nms_overlap_thresh)
+                dict_out['desc'][0].update({'is_nms': is_nms})
 
                 dict_out['pred_boxes_nms'] = cared_boxes_with_scores
                 dict_out['pred_cls_ids'] = cls_ids
@@ -384,3 +395,40 @@ class RdrCubeSedanHead(nn.Module):
             # dict_out[]
             # print('* Error happens in head')
             return None
+
+def get_nms_pred_boxes(cared_boxes_with_scores, cls_ids, nms_overlap_thresh=0.3, max_num_proposals=None):
+    '''
+    * in : outputs of RdrCubeSedanHead.get_pred_boxes_for_single_datum
+    * out: boxes & cls ids after rotated nms, is_nms (False if nms error)
+    * max_num_proposals: keep top-k scores before nms (None: keep all)
+    '''
+    if max_num_proposals is not None:
+        idx_top_k = torch.argsort(cared_boxes_with_scores[:, 0], descending=True)[:max_num_proposals]
+        cared_boxes_with_scores, cls_ids = cared_boxes_with_scores[idx_top_k], cls_ids[idx_top_k]
+
+    scores = cared_boxes_with_scores[:, 0:1].cpu().detach().numpy()
+    xc_tensor, yc_tensor = cared_boxes_with_scores[:, 1:2], cared_boxes_with_scores[:, 2:3]
+    xl_tensor, yl_tensor = cared_boxes_with_scores[:, 4:5], cared_boxes_with_scores[:, 5:6]
+    angle_tensor = cared_boxes_with_scores[:, 7:8] 
+
+    c_array = torch.cat((xc_tensor, yc_tensor), dim = 1).cpu().detach().numpy()
+    dim_array = torch.cat((xl_tensor, yl_tensor), dim = 1).cpu().detach().numpy()
+    angle_array = angle_tensor.cpu().detach().numpy()
+
+    c_list = list(map(tuple, c_array))
+    dim_list = list(map(tuple, dim_array))
+    angle_list = list(map(float, angle_array))
+
+    boxes = [[a, b , c] for (a, b, c) in zip(c_list, dim_list, angle_list)]
+
+    ### If NMS error, do not calculate nms ###
+    try:
+        keep_indices = nms.rboxes(boxes, scores, nms_threshold=nms_overlap_thresh)
+        cared_boxes_with_scores = cared_boxes_with_scores[keep_indices]
+        cls_ids = cls_ids[keep_indices]
+        is_nms = True
+    except:
+        is_nms = False
+    ### If NMS error, do not calculate nms ###
+
+    return cared_boxes_with_scores, cls_ids, is_nms
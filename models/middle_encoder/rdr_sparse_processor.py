@@ -9,6 +9,7 @@ from numpy import single
 import torch
 import torch.nn as nn
 from spconv.pytorch.utils import PointToVoxel
+from utils.util_profiler import get_profiler
 
 class RadarSparseProcessor(nn.Module):
     def __init__(self, cfg):
@@ -27,15 +28,21 @@ class RadarSparseProcessor(nn.Module):
             max_num_voxels=40000,
             max_num_points_per_voxel=5
         )
+        # device of the network (moved by .to()) for the inputs, not in the state dict
+        self.register_buffer('device_ref', torch.zeros(0), persistent=False)
 
     def forward(self, dict_datum):
+        profiler = get_profiler() # host to device (GENERAL.PROFILE)
+        device = self.device_ref.device
         if self.cfg.DATASET.RDR_CUBE.USE_PREPROCESSED_CUBE:
-            sparse_rdr_cube = dict_datum['sparse_cube'].cuda()
+            profiler.start('h2d')
+            sparse_rdr_cube = dict_datum['sparse_cube'].to(device)
+            profiler.stop('h2d')
 
             B, N, C = sparse_rdr_cube.shape
             batch_indices_list = []
             for batch_idx in range(B):
-                batch_indices = torch.full((N,1), batch_idx, dtype = torch.long).cuda()
+                batch_indices = torch.full((N,1), batch_idx, dtype = torch.long, device = device)
                 batch_indices_list.append(batch_indices)
             batch_indices_list = torch.cat(batch_indices_list)
             sparse_rdr_cube = sparse_rdr_cube.view(B*N, C)
@@ -52,11 +59,16 @@ class RadarSparseProcessor(nn.Module):
             x_ind = torch.floor((x_coord-x_min) / grid_size).long()
 
             batch_indices_list = torch.cat((batch_indices_list, z_ind, y_ind, x_ind), dim = -1)
+            if 'sparse_cube_mask' in dict_datum.keys(): # augmentation (utils.util_augment)
+                is_valid = dict_datum['sparse_cube_mask'].view(B*N).to(device)
+                sparse_rdr_cube, batch_indices_list = sparse_rdr_cube[is_valid], batch_indices_list[is_valid]
             dict_datum['sparse_features'] = sparse_rdr_cube
             dict_datum['sparse_indices'] = batch_indices_list
         else:
-            rdr_cube = dict_datum['rdr_cube'].cuda()
-            rdr_cube_cnt = dict_datum['rdr_cube_cnt'].cuda()
+            profiler.start('h2d')
+            rdr_cube = dict_datum['rdr_cube'].to(device)
+            rdr_cube_cnt = dict_datum['rdr_cube_cnt'].to(device)
+            profiler.stop('h2d')
 
             # For Head Loss
             rdr_cube_bev = torch.div(torch.sum(rdr_cube, dim=1), rdr_cube_cnt)
@@ -7,7 +7,6 @@
 import torch
 import numpy as np
 import matplotlib.pyplot as plt
-import open3d as o3d
 import os
 from tqdm import tqdm
 import shutil
@@ -23,39 +22,43 @@ import logging
 numba_logger = logging.getLogger('numba')
 numba_logger.setLevel(logging.ERROR)
 
-from torch.utils.tensorboard import SummaryWriter
 
 from utils.util_pipeline import *
 from utils.util_point_cloud import *
 from utils.util_config import cfg, cfg_from_yaml_file
 
-import nms
 from utils.util_point_cloud import Object3D
 import utils.kitti_eval.kitti_common as kitti
-from utils.kitti_eval.eval import get_official_eval_result
+from utils.util_pred_cache import *
+from utils.util_train import *
+from utils.util_checkpoint import *
+from utils.util_logger import AsyncScalarWriter
+from utils.util_dist import *
+from utils.util_profiler import *
+from torch.nn.parallel import DistributedDataParallel
 
 class Pipeline_v2_1():
     def __init__(self, path_cfg=None, split='train', mode='train/val'):
         '''
         * split = 'train' or 'test'
         * mode = 'train', 'train/val', 'val', 'test'
+        * datasets, network, optimizer & scheduler are built on first use (see __getattr__)
         '''
-        if (mode=='val') or (mode=='train/val'):
-            self.cfg = cfg_from_yaml_file(path_cfg, cfg)
-            self.modify_cfg(mode)
-            self.dataset_val = build_dataset(self, 'test')
-
         self.cfg = cfg_from_yaml_file(path_cfg, cfg)
         self.modify_cfg(mode)
+        self.split = split
+        self.dict_datasets = dict() # split: dataset (dataset & dataset_val share the 'test' split)
 
+        # ddp with torchrun (WORLD_SIZE > 1), GENERAL.DIST_BACKEND: None ('nccl' with cuda, else 'gloo')
+        dist_backend = self.cfg.GENERAL.get('DIST_BACKEND', None)
+        if (dist_backend is None) and (self.cfg.GENERAL.get('DEVICE', 'gpu') == 'cpu'):
+            dist_backend = 'gloo' # cpu tensors
+        self.rank, self.world_size, self.local_rank = init_dist(dist_backend)
 
         if self.cfg.GENERAL.SEED is not None:
-            set_random_seed(cfg.GENERAL.SEED)
-        
-        self.dataset = build_dataset(self, split=split)
-        self.cfg.DATASET.NUM = len(self.dataset)
+            set_random_seed(cfg.GENERAL.SEED + self.rank) # same weights on every rank (broadcast of ddp)
         
-        # cube or tesseract, pick just one
+        # cube or tesseract, pick just one (physical values without loading a sample or the label paths)
         if (self.cfg.DATASET.GET_ITEM['rdr_cube']):
             self.get_physical_values(dtype='cube')
             self.update_cfg(dtype='cube')
@@ -63,29 +66,95 @@ class Pipeline_v2_1():
             self.get_physical_values(dtype='tesseract')
             self.update_cfg(dtype='tesseract')
 
-        self.network = build_network(self).cuda()
+        # opt-in mixed precision (GENERAL.AMP), grad scaler is enabled only for float16
+        self.amp_dtype = get_amp_dtype(self.cfg.GENERAL.get('AMP', None))
 
         self.epoch_start = 0
-        
-        self.optimizer = build_optimizer(self, self.network)
-        self.scheduler = build_scheduler(self, self.optimizer)
 
         if self.cfg.GENERAL.IS_TRAIN and \
-            self.cfg.GENERAL.LOGGING.IS_LOGGING:
+            self.cfg.GENERAL.LOGGING.IS_LOGGING and (self.rank == 0): # logging & checkpoints on rank 0
             self.set_logging(path_cfg)
         else:
             self.is_logging = False
+            self.is_save_model = False
 
         if self.cfg.VAL.IS_VALIDATE:
             self.set_validate()
         else:
             self.is_validate = False
+
+        self.set_profiling()
         
         if self.cfg.GENERAL.RESUME.IS_RESUME:
             self.resume_network()
         
         # self.pline_description()
 
+    ### Built on first use (once) ###
+    LIST_LAZY_ATTRS = ['dataset', 'dataset_val', 'train_sampler', 'device', 'network', 'network_train', \
+                       'device_type', 'grad_scaler', 'optimizer', 'scheduler']
+
+    def __getattr__(self, name):
+        '''
+        * called only for the attributes not set yet, e.g., an eval script does not build the optimizer
+        '''
+        if not (name in Pipeline_v2_1.LIST_LAZY_ATTRS):
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        value = getattr(self, f'init_{name}')()
+        setattr(self, name, value)
+        return value
+
+    def get_dataset(self, split):
+        if not (split in self.dict_datasets.keys()):
+            self.dict_datasets[split] = build_dataset(self, split=split)
+        return self.dict_datasets[split]
+
+    def init_dataset(self):
+        return self.get_dataset(self.split)
+
+    def init_dataset_val(self):
+        return self.get_dataset('test')
+
+    def init_train_sampler(self):
+        # frames of a sequence on the same rank (ddp)
+        return SequenceDistributedSampler( \
+            [path_label.split('/')[-3] for path_label in self.dataset.label_paths], \
+            num_replicas=self.world_size, rank=self.rank, seed=0 if self.cfg.GENERAL.SEED is None else self.cfg.GENERAL.SEED)
+
+    def init_device(self):
+        # GENERAL.DEVICE: 'gpu' (cuda if available, else cpu) or 'cpu', the current cuda device of the rank (init_dist)
+        if (self.cfg.GENERAL.get('DEVICE', 'gpu') == 'gpu') and torch.cuda.is_available():
+            return torch.device('cuda', torch.cuda.current_device())
+        return torch.device('cpu')
+
+    def init_network(self):
+        network = build_network(self).to(self.device)
+        self.profiler.attach_modules(network.list_modules) # stage per module (if profiling)
+        return network
+
+    def init_network_train(self):
+        # forward of training (all-reduce of gradients), self.network for the others (e.g., head & state dict)
+        if self.world_size > 1:
+            return DistributedDataParallel(self.network, \
+                device_ids=[torch.cuda.current_device()] if self.device_type == 'cuda' else None, \
+                find_unused_parameters=self.cfg.GENERAL.get('DIST_FIND_UNUSED_PARAMETERS', False))
+        return self.network
+
+    def init_device_type(self):
+        return self.device.type
+
+    def init_grad_scaler(self):
+        return build_grad_scaler(self.device_type, self.amp_dtype)
+
+    def init_optimizer(self):
+        return build_optimizer(self, self.network)
+
+    def init_scheduler(self):
+        # DATASET.NUM: frames per rank for ddp
+        self.cfg.DATASET.NUM = len(self.train_sampler) if self.world_size > 1 else len(self.dataset)
+        return build_scheduler(self, self.optimizer)
+    ### Built on first use (once) ###
+
     def modify_cfg(self, mode):
         if mode == 'test':
             self.cfg.GENERAL.LOGGING.IS_LOGGING = False
@@ -100,7 +169,7 @@ class Pipeline_v2_1():
             self.cfg.DATASET.RDR_CUBE.ARR_X = self.arr_x_cb.copy()
         elif dtype == 'tesseract':
             len_doppler, len_range, len_azimuth, len_elevation = \
-                                    self.dataset[0]['rdr_tesseract'].shape
+                                    self.dataset.get_tesseract_shape() # without loading a sample
             self.cfg.MODEL.DRAE_SIZE = \
                     [len_doppler, len_range, len_azimuth, len_elevation]
 
@@ -119,7 +188,49 @@ class Pipeline_v2_1():
         self.list_val_conf_thr = self.cfg.VAL.LIST_VAL_CONF_THR
         self.list_care_cls_idx = self.cfg.VAL.LIST_CLS_CARE
         self.val_iou_mode = self.cfg.VAL.VAL_IOU_MODE
+        try:
+            self.is_streaming_val = self.cfg.VAL.STREAMING.IS_STREAMING
+            self.val_streaming_num_bins = self.cfg.VAL.STREAMING.NUM_BINS
+            self.val_streaming_log_per_frames = self.cfg.VAL.STREAMING.LOG_PER_FRAMES
+        except:
+            self.is_streaming_val = False
+        try:
+            self.is_pred_cache = self.cfg.VAL.PRED_CACHE.IS_CACHE
+            self.pred_cache_dir = self.cfg.VAL.PRED_CACHE.DIR
+            self.pred_cache_min_conf_thr = self.cfg.VAL.PRED_CACHE.MIN_CONF_THR
+        except:
+            self.is_pred_cache = False
     
+    def set_profiling(self):
+        '''
+        * GENERAL.PROFILE: stages of train_network & validate_kitti, report per epoch (report_profile)
+        *   models get the profiler with utils.util_profiler.get_profiler()
+        '''
+        cfg_profile = self.cfg.GENERAL.get('PROFILE', None)
+        self.is_profiling = (cfg_profile is not None) and cfg_profile.get('IS_PROFILE', False)
+        self.profiler = StageProfiler(is_enabled=self.is_profiling)
+        set_profiler(self.profiler)
+        self.profile_dir = None
+        if self.is_profiling:
+            if cfg_profile.get('DIR', None) is not None:
+                self.profile_dir = cfg_profile.DIR
+            elif self.is_logging:
+                self.profile_dir = os.path.join(self.path_log, 'profile')
+
+    def report_profile(self, epoch, dict_info=None):
+        '''
+        * console & <profile_dir>/epoch_<epoch>.json on rank 0, stages are reset for the next epoch
+        '''
+        if not self.is_profiling:
+            return
+        dict_summary = self.profiler.get_summary()
+        if self.rank == 0:
+            print(self.profiler.get_report_str(dict_summary, header=f'* Profile of epoch {epoch}'))
+            if self.profile_dir is not None:
+                dict_info = {'epoch': epoch, 'world_size': self.world_size} if dict_info is None else dict_info
+                self.profiler.save_json(os.path.join(self.profile_dir, f'epoch_{epoch}.json'), dict_info, dict_summary)
+        self.profiler.reset()
+
     def pline_description(self):
         print('* newtork (description start) -------')
         print(self.network)
@@ -170,9 +281,16 @@ class Pipeline_v2_1():
             os.makedirs(self.path_log)
 
         self.list_key_logging = self.cfg.GENERAL.LOGGING.LIST_KEY_LOGGING
-        self.log_train_iter = SummaryWriter(os.path.join(self.path_log, 'train_iter'), comment='train_iter')
-        self.log_train_epoch = SummaryWriter(os.path.join(self.path_log, 'train_epoch'), comment='train_epoch')
-        self.log_val = SummaryWriter(os.path.join(self.path_log, 'val'), comment='val')
+        # written in a background thread every FLUSH_SECS (& at exit), 'csv' or 'memory' for headless runs
+        log_backend = self.cfg.GENERAL.LOGGING.get('BACKEND', 'tensorboard')
+        log_flush_secs = self.cfg.GENERAL.LOGGING.get('FLUSH_SECS', 10.)
+        kwargs_backend = lambda x: {'comment': x} if log_backend == 'tensorboard' else dict()
+        self.log_train_iter = AsyncScalarWriter(os.path.join(self.path_log, 'train_iter'), \
+                                log_backend, log_flush_secs, **kwargs_backend('train_iter'))
+        self.log_train_epoch = AsyncScalarWriter(os.path.join(self.path_log, 'train_epoch'), \
+                                log_backend, log_flush_secs, **kwargs_backend('train_epoch'))
+        self.log_val = AsyncScalarWriter(os.path.join(self.path_log, 'val'), \
+                                log_backend, log_flush_secs, **kwargs_backend('val'))
         self.log_iter_start = None
 
         # graph loading (TBD) # https://www.youtube.com/watch?v=74aSImrIEbQ
@@ -181,6 +299,12 @@ class Pipeline_v2_1():
         if self.is_save_model:
             os.makedirs(os.path.join(self.path_log, 'models'))
             os.makedirs(os.path.join(self.path_log, 'utils'))
+            # written in a background thread, None: keep all
+            cfg_logging = self.cfg.GENERAL.LOGGING
+            self.ckpt_manager = CheckpointManager(self.path_log, \
+                num_keep_last_model=cfg_logging.get('NUM_KEEP_LAST_MODEL', None), \
+                num_keep_top_model=cfg_logging.get('NUM_KEEP_TOP_MODEL', 0), \
+                num_keep_util=cfg_logging.get('NUM_KEEP_UTIL', None))
 
         # cfg backup (same files, just for identification)
         name_file_origin = path_cfg.split('/')[-1] # original cfg file name
@@ -192,13 +316,20 @@ class Pipeline_v2_1():
         path_exp = self.cfg.GENERAL.RESUME.PATH_EXP
         path_state_dict = os.path.join(path_exp, 'utils')
         epoch = self.cfg.GENERAL.RESUME.START_EP
-        list_epochs = sorted(list(map(lambda x: int(x.split('.')[0].split('_')[1]), os.listdir(path_state_dict))))
+        list_epochs = sorted(list(map(lambda x: int(x.split('.')[0].split('_')[1]), \
+            filter(lambda x: x.endswith('.pt'), os.listdir(path_state_dict)))))
         # print(list_epochs)
         epoch = list_epochs[-1] if epoch is None else epoch
 
         path_state_dict = os.path.join(path_state_dict, f'util_{epoch}.pt')
         print('* Start resume, path_state_dict =  ', path_state_dict)
-        state_dict = torch.load(path_state_dict)
+        dict_manifest = load_checkpoint_manifest(path_exp) # sha256 (None for logs without the manifest)
+        check_checkpoint_sha256(path_exp, path_state_dict, dict_manifest)
+        state_dict = torch.load(path_state_dict, map_location=self.device)
+        if not ('model_state_dict' in state_dict.keys()): # CheckpointManager: weights only in models/
+            path_dict_model = os.path.join(path_exp, state_dict['path_dict_model'])
+            check_checkpoint_sha256(path_exp, path_dict_model, dict_manifest)
+            state_dict['model_state_dict'] = torch.load(path_dict_model, map_location=self.device)
 
         try:
             self.epoch_start = epoch + 1
@@ -215,6 +346,9 @@ class Pipeline_v2_1():
         else:
             print('* Scheduler is started from vanilla ...')
 
+        if ('grad_scaler_state_dict' in state_dict.keys()) and self.grad_scaler.is_enabled():
+            self.grad_scaler.load_state_dict(state_dict['grad_scaler_state_dict'])
+
         ### Copy tree logging! ###
         list_copy_dirs = ['train_epoch', 'train_iter', 'val', 'val_kitti']
         if (self.cfg.GENERAL.RESUME.IS_COPY_LOGS) and (self.is_logging):
@@ -233,15 +367,22 @@ class Pipeline_v2_1():
     
 
     def train_network(self, is_shuffle=True):
-        self.network.train()
+        self.network_train.train()
+        _ = self.scheduler # built (on first use) before the first optimizer step
         # t1 = time.time()
+        # ddp: BATCH_SIZE per rank
+        sampler_train = self.train_sampler if self.world_size > 1 else None
+        if sampler_train is not None:
+            is_shuffle = False # shuffled in the sampler
         if cfg.OPTIMIZER.BATCH_SIZE == 1:
+            if self.dataset.augmentor is not None: # augmentor works on batches of collate_fn
+                print('* Warning: DATASET.AUGMENTATION is not applied with OPTIMIZER.BATCH_SIZE = 1')
             data_loader_train = torch.utils.data.DataLoader(self.dataset, \
-                batch_size = self.cfg.OPTIMIZER.BATCH_SIZE, shuffle = is_shuffle)
+                batch_size = self.cfg.OPTIMIZER.BATCH_SIZE, shuffle = is_shuffle, sampler = sampler_train)
         else:
             data_loader_train = torch.utils.data.DataLoader(self.dataset, \
-                batch_size = self.cfg.OPTIMIZER.BATCH_SIZE, shuffle = is_shuffle, \
-                collate_fn = self.dataset.collate_fn, num_workers = self.cfg.OPTIMIZER.NUM_WORKERS)
+                batch_size = self.cfg.OPTIMIZER.BATCH_SIZE, shuffle = is_shuffle, sampler = sampler_train, \
+                collate_fn = self.dataset.collate_fn_train, num_workers = self.cfg.OPTIMIZER.NUM_WORKERS)
         # t2 = time.time()
         # print(f"* 4: {t2 - t1:.5f} sec")
 
@@ -256,17 +397,32 @@ class Pipeline_v2_1():
         ##########################################
         if self.is_logging:
             idx_log_iter = 0 if self.log_iter_start is None else self.log_iter_start
+        else:
+            idx_log_iter = 0
+        # logging values stay on the device & are copied to the host every PER_ITER_FLUSH iterations
+        metric_acc = MetricAccumulator(self.cfg.GENERAL.LOGGING.get('PER_ITER_FLUSH', 1))
+        # optimizer step every GRAD_ACCUMULATIONS iterations (effective batch = BATCH_SIZE x GRAD_ACCUMULATIONS)
+        num_grad_acc = self.cfg.OPTIMIZER.get('GRAD_ACCUMULATIONS', 1)
+        per_epoch_model = self.cfg.GENERAL.LOGGING.get('PER_EPOCH_MODEL', 1)
+        per_epoch_util = self.cfg.GENERAL.LOGGING.get('PER_EPOCH_UTIL', 1)
 
         for epoch in range(epoch_start, epoch_end):
             print(f'* Training epoch = {epoch}/{epoch_end-1}')
             if self.is_logging:
                 print(f'* Logging path = {self.path_log}')
-            self.network.train()
+            if sampler_train is not None:
+                sampler_train.set_epoch(epoch)
+            self.network_train.train()
             self.network.training = True
+            self.profiler.scope = 'train'
             idx_fails = []
             num_fails = 0
-            avg_loss = []
-            for idx_iter, dict_datum in enumerate(tqdm(data_loader_train)):
+            metric_acc.reset()
+            dict_info_iter = dict() # meta & labels until the flush (for non-finite loss)
+            is_finite_window = None
+            self.optimizer.zero_grad()
+            for idx_iter, dict_datum in enumerate(tqdm(self.profiler.iter_stage(data_loader_train), \
+                                                        total=len(data_loader_train), disable=(self.rank != 0))):
                 ### Debug ###
                 # if idx_iter < 35:
                 #     continue
@@ -283,59 +439,83 @@ class Pipeline_v2_1():
                     # print(dict_datum['meta'][0])
 
                     # t1 = time.time()
-                    dict_net = self.network(dict_datum)
+                    num_window, is_step = get_grad_window(idx_iter, len(data_loader_train), num_grad_acc)
+                    set_grad_sync(self.network_train, is_step) # ddp: all-reduce only at the optimizer step
+                    with get_autocast_context(self.device_type, self.amp_dtype):
+                        self.profiler.start('forward')
+                        dict_net = self.network_train(dict_datum)
+                        self.profiler.stop('forward')
 
-                    # t2 = time.time()
-                    # print(f"* network: {t2 - t1:.5f} sec")
+                        # t2 = time.time()
+                        # print(f"* network: {t2 - t1:.5f} sec")
 
-                    # t1 = time.time()
-                    loss = self.network.head.loss(dict_net)
+                        # t1 = time.time()
+                        self.profiler.start('loss')
+                        loss = self.network.head.loss(dict_net)
 
-                    if hasattr(self.network, 'point_head'): # PVRCNN_PP
-                        point_loss = self.network.point_head.loss(dict_net)
-                        loss += point_loss
+                        if hasattr(self.network, 'point_head'): # PVRCNN_PP
+                            point_loss = self.network.point_head.loss(dict_net)
+                            loss += point_loss
 
-                    if hasattr(self.network, 'roi_head'): # PVRCNN_PP
-                        roi_loss = self.network.roi_head.loss(dict_net)
-                        loss += roi_loss
+                        if hasattr(self.network, 'roi_head'): # PVRCNN_PP
+                            roi_loss = self.network.roi_head.loss(dict_net)
+                            loss += roi_loss
+                        self.profiler.stop('loss')
 
                     # t2 = time.time()
                     # print(f"* loss calculation: {t2 - t1:.5f} sec")
-                    
-                    try:
-                        log_avg_loss = loss.cpu().detach().item()
-                    except:
-                        log_avg_loss = loss
-                    avg_loss.append(log_avg_loss)
 
                     # t1 = time.time()
-                    if loss == 0.:
+                    # device-side flag, checked at the flush (no sync per iteration)
+                    is_finite = get_finite_flag(loss)
+                    is_finite_window = is_finite if is_finite_window is None else (is_finite_window & is_finite)
+                    self.profiler.start('backward')
+                    if not torch.is_tensor(loss):
                         print('loss is 0.') # no label
-                    elif torch.isfinite(loss):
-                        loss.backward()
+                        if self.world_size > 1: # zero gradients, every rank joins the all-reduce
+                            self.grad_scaler.scale(sum([p.sum() for p in self.network.parameters()])*0.).backward()
                     else:
-                        # raise TypeError('Nan or inf loss happend !')
-                        print('>>> Nan or inf loss happend !')
-                        print(dict_datum['meta'])
-                        print(dict_datum['labels'])
-                    self.optimizer.step()
-                    if not (self.scheduler is None):
-                        self.scheduler.step()
-                    self.optimizer.zero_grad()
+                        # mean over the window (the last window can be shorter)
+                        self.grad_scaler.scale(loss/num_window).backward()
+                    self.profiler.stop('backward')
+                    if is_step:
+                        self.profiler.start('optimizer_step')
+                        # gradients in the scale of the loss before the check (identity without float16)
+                        self.grad_scaler.unscale_(self.optimizer)
+                        # the same decision on every rank (gradients are averaged over ranks)
+                        is_finite_window = get_all_finite_flag(is_finite_window)
+                        # a window with a non-finite loss is not applied (zero gradients)
+                        zero_grads_if_not_finite(self.network.parameters(), is_finite_window)
+                        is_finite_window = None
+                        # float16: skipped for overflowed gradients & the scale is updated
+                        self.grad_scaler.step(self.optimizer)
+                        self.grad_scaler.update()
+                        if not (self.scheduler is None):
+                            self.scheduler.step()
+                        self.optimizer.zero_grad()
+                        self.profiler.stop('optimizer_step')
                     # t2 = time.time()
                     # print(f"* optimization: {t2 - t1:.5f} sec")
 
                     # t1 = time.time()
+                    dict_values = {'_loss': loss, '_is_finite': is_finite}
                     if self.is_logging:
                         for key_logging in self.list_key_logging:
                             dict_temp = dict_net[key_logging]
                             idx_log_iter +=1
 
                             for k, v in dict_temp.items():
-                                self.log_train_iter.add_scalar(f'{key_logging}/{k}', v, idx_log_iter)
+                                dict_values[f'{key_logging}/{k}'] = v
                         if not (self.scheduler is None):
                             lr = self.scheduler.get_last_lr()
-                            self.log_train_iter.add_scalar(f'train/learning_rate', lr[0], idx_log_iter)
+                            dict_values['train/learning_rate'] = lr[0]
+                    dict_values['_idx_log_iter'] = idx_log_iter
+                    metric_acc.add(idx_iter, dict_values)
+                    dict_info_iter[idx_iter] = (dict_datum['meta'], dict_datum['labels'])
+
+                    if metric_acc.is_flush() or (idx_iter == len(data_loader_train)-1):
+                        self.flush_train_metrics(metric_acc, dict_info_iter)
+                        dict_info_iter = dict()
                         
                 # t2 = time.time()
                 # print(f"* logging: {t2 - t1:.5f} sec")
@@ -346,21 +526,24 @@ class Pipeline_v2_1():
                 # # #     num_fails += 1
 
             if self.is_save_model:
-                path_dict_model = os.path.join(self.path_log, 'models', f'model_{epoch}.pt')
-                path_dict_util = os.path.join(self.path_log, 'utils', f'util_{epoch}.pt')
-                torch.save(self.network.state_dict(), path_dict_model)
-                dict_util = {
-                    'epoch': epoch,
-                    'model_state_dict': self.network.state_dict(),
-                    'optimizer_state_dict': self.optimizer.state_dict(),
-                    'idx_log_iter': idx_log_iter, 
-                }
-                if not (self.scheduler is None):
-                    dict_util.update({'scheduler_state_dict': self.scheduler.state_dict()})
-                torch.save(dict_util, path_dict_util)
+                # model every PER_EPOCH_MODEL, optimizer & scheduler every PER_EPOCH_UTIL (& the last epoch)
+                is_last_epoch = (epoch == epoch_end-1)
+                is_save_util = (((epoch + 1) % per_epoch_util) == 0) or is_last_epoch
+                if (((epoch + 1) % per_epoch_model) == 0) or is_save_util:
+                    dict_util = None
+                    if is_save_util:
+                        dict_util = {
+                            'optimizer_state_dict': self.optimizer.state_dict(),
+                            'idx_log_iter': idx_log_iter, 
+                        }
+                        if not (self.scheduler is None):
+                            dict_util.update({'scheduler_state_dict': self.scheduler.state_dict()})
+                        if self.grad_scaler.is_enabled():
+                            dict_util.update({'grad_scaler_state_dict': self.grad_scaler.state_dict()})
+                    self.ckpt_manager.save(epoch, self.network.state_dict(), dict_util, score=metric_acc.get_mean('_loss'))
 
             if self.is_logging:
-                self.log_train_epoch.add_scalar(f'train/avg_loss', np.mean(avg_loss), epoch)
+                self.log_train_epoch.add_scalar(f'train/avg_loss', metric_acc.get_mean('_loss'), epoch)
             
             # print('Average loss: ', np.mean(avg_loss))
             # print('Fails: ', num_fails, ' times')
@@ -374,11 +557,37 @@ class Pipeline_v2_1():
                 if ((epoch + 1) % self.val_per_epoch_full) == 0:
                     self.validate_kitti(epoch, list_conf_thr=self.list_val_conf_thr)
 
+            self.report_profile(epoch)
+
+        if self.is_save_model:
+            self.ckpt_manager.close() # wait for the last checkpoint
+        if self.is_logging:
+            for log_writer in [self.log_train_iter, self.log_train_epoch, self.log_val]:
+                log_writer.flush()
+
+    def flush_train_metrics(self, metric_acc, dict_info_iter):
+        '''
+        * values of the iterations since the last flush -> host (one sync) -> tensorboard
+        '''
+        for idx_iter, dict_values in metric_acc.flush():
+            if not dict_values['_is_finite']:
+                # raise TypeError('Nan or inf loss happend !')
+                print('>>> Nan or inf loss happend !')
+                meta, labels = dict_info_iter[idx_iter]
+                print(meta)
+                print(labels)
+            if self.is_logging:
+                for k, v in dict_values.items():
+                    if k.startswith('_'):
+                        continue
+                    self.log_train_iter.add_scalar(k, v, int(dict_values['_idx_log_iter']))
+
     def load_dict_model(self, path_dict_model, is_strict=False):
-        pt_dict_model = torch.load(path_dict_model)
+        pt_dict_model = torch.load(path_dict_model, map_location=self.device)
         self.network.load_state_dict(pt_dict_model, strict=is_strict)
 
     def vis_infer_cube(self, sample_indices, conf_thr=0.1):
+        import open3d as o3d
         subset = Subset(self.dataset, sample_indices)
 
         data_loader = torch.utils.data.DataLoader(subset, \
@@ -386,7 +595,8 @@ class Pipeline_v2_1():
         
         ### Assume Batch size = 1 ###
         for dict_datum in data_loader:
-            dict_out = self.network(dict_datum)
+            with get_autocast_context(self.device_type, self.amp_dtype):
+                dict_out = self.network(dict_datum)
             dict_out = self.network.list_modules[-1].get_pred_boxes_nms_for_single_datum(dict_out, conf_thr)
 
             pc_lidar = dict_datum['ldr_pc_64']
@@ -454,21 +664,41 @@ class Pipeline_v2_1():
             o3d.visualization.draw_geometries([pcd] + line_sets_gt + line_sets_pred)
 
     def validate_kitti(self, epoch=None, list_conf_thr=None, is_subset=False):
+        from utils.kitti_eval.eval_stream import StreamingEvaluator # numba
+        from utils.kitti_eval.eval import get_official_eval_result, OverlapCache # numba
         self.network.eval()
+        self.profiler.scope = 'val'
+        # ddp: frames are sharded over ranks & the kitti lines are gathered to rank 0 in memory (files & eval on rank 0)
+        is_dist_val = (self.world_size > 1)
+        is_writer = (self.rank == 0)
 
         ### Check is_validate with small dataset ###
         if is_subset:
             is_shuffle = True
-            tqdm_bar = tqdm(total=self.val_num_subset, desc='val sub: ')
+            num_total = self.val_num_subset
             log_header = 'val_sub'
         else:
             is_shuffle = False
-            tqdm_bar = tqdm(total=len(self.dataset_val), desc='val tot: ')
+            num_total = len(self.dataset_val)
             log_header = 'val_tot'
 
-        data_loader = torch.utils.data.DataLoader(self.dataset_val, \
-                batch_size = 1, shuffle = is_shuffle, collate_fn = self.dataset.collate_fn, \
-                    num_workers = 1) # self.cfg.OPTIMIZER.NUM_WORKERS)
+        if is_dist_val:
+            list_indices = list(range(len(self.dataset_val)))
+            if is_shuffle: # the same subset on every rank
+                generator = torch.Generator()
+                generator.manual_seed(0 if epoch is None else epoch)
+                list_indices = torch.randperm(len(self.dataset_val), generator=generator).tolist()
+            if is_subset:
+                list_indices = list_indices[:self.val_num_subset]
+            list_idx_datum = list(range(len(list_indices)))[self.rank::self.world_size] # idx_name of the frames
+            data_loader = torch.utils.data.DataLoader(Subset(self.dataset_val, [list_indices[i] for i in list_idx_datum]), \
+                    batch_size = 1, shuffle = False, collate_fn = self.dataset_val.collate_fn, num_workers = 1)
+            num_total = len(list_idx_datum)
+        else:
+            data_loader = torch.utils.data.DataLoader(self.dataset_val, \
+                    batch_size = 1, shuffle = is_shuffle, collate_fn = self.dataset_val.collate_fn, \
+                        num_workers = 1) # self.cfg.OPTIMIZER.NUM_WORKERS)
+        tqdm_bar = tqdm(total=num_total, desc='val sub: ' if is_subset else 'val tot: ', disable=(not is_writer))
         
         if epoch is None:
             path_epoch = 'temp'
@@ -476,33 +706,61 @@ class Pipeline_v2_1():
             path_epoch = f'ep_{epoch}' if is_subset else f'ep_{epoch}_tot'
 
         if self.cfg.VAL.DIR is None:
-            path_dir = os.path.join(self.path_log, 'val_kitti', path_epoch)
+            path_dir = os.path.join(self.path_log, 'val_kitti', path_epoch) if is_writer else None
         else:
             path_dir = os.path.join(self.cfg.VAL.DIR, 'val_kitti', path_epoch)
         
-        for conf_thr in list_conf_thr:
-            os.makedirs(os.path.join(path_dir, f'{conf_thr}'), exist_ok=True)
-            with open(path_dir + f'/{conf_thr}/' + 'val.txt', 'w') as f:
-                f.write('')
+        if is_writer:
+            for conf_thr in list_conf_thr:
+                for name_dir in ['preds', 'gts', 'desc']:
+                    os.makedirs(os.path.join(path_dir, f'{conf_thr}', name_dir), exist_ok=True)
+                with open(path_dir + f'/{conf_thr}/' + 'val.txt', 'w') as f:
+                    f.write('')
 
-        for idx_datum, dict_datum in enumerate(data_loader):
+        ### Running AP per conf (frames are not kept in memory) ###
+        dict_evaluator = None
+        if self.is_streaming_val:
+            dict_evaluator = dict()
+            for conf_thr in list_conf_thr:
+                dict_evaluator[conf_thr] = StreamingEvaluator(self.list_care_cls_idx, \
+                                                num_bins=self.val_streaming_num_bins)
+
+        ### Decoded boxes before nms per checkpoint (see validate_kitti_from_pred_cache) ###
+        is_pred_cache = self.is_pred_cache
+        if is_pred_cache and is_dist_val:
+            is_pred_cache = False
+            if is_writer:
+                print('* Pred cache is not written in ddp')
+        if is_pred_cache:
+            str_hash = get_state_dict_hash(self.network)
+            dir_cache = os.path.join(path_dir, 'pred_cache') if self.pred_cache_dir is None else self.pred_cache_dir
+            path_cache = os.path.join(dir_cache, f'{str_hash}_{log_header}')
+            pred_cache_writer = PredCacheWriter(path_cache, self.pred_cache_min_conf_thr, \
+                                                dict_info={'hash': str_hash, 'epoch': epoch})
+            print(f'* Pred cache path = {path_cache}')
+
+        list_kitti_frames = [] # ddp: (idx_name, conf_thr, kitti_labels, kitti_desc, kitti_preds)
+        for idx_datum, dict_datum in enumerate(self.profiler.iter_stage(data_loader)):
+            if is_dist_val:
+                idx_datum = list_idx_datum[idx_datum]
             if is_subset & (idx_datum >= self.val_num_subset):
                 break
             
             try:
-                dict_out = self.network(dict_datum)
+                with get_autocast_context(self.device_type, self.amp_dtype):
+                    self.profiler.start('forward')
+                    dict_out = self.network(dict_datum)
+                    self.profiler.stop('forward')
                 idx_name = str(idx_datum).zfill(6)
 
+                if is_pred_cache:
+                    pred_boxes, cls_ids = self.network.list_modules[-1].get_pred_boxes_for_single_datum( \
+                                                                dict_out, self.pred_cache_min_conf_thr)
+                    pred_cache_writer.write(idx_datum, pred_boxes, cls_ids, dict_out['labels'], dict_out['desc'][0])
+
                 ### for every conf in list_conf_thr ###
+                self.profiler.start('post_processing') # nms & kitti lines
                 for conf_thr in list_conf_thr:
-                    preds_dir = os.path.join(path_dir, f'{conf_thr}', 'preds')
-                    labels_dir = os.path.join(path_dir, f'{conf_thr}', 'gts')
-                    desc_dir = os.path.join(path_dir, f'{conf_thr}', 'desc')
-                    list_dir = [preds_dir, labels_dir, desc_dir]
-                    split_path = path_dir + f'/{conf_thr}/' + 'val.txt'
-                    for temp_dir in list_dir:
-                        os.makedirs(temp_dir, exist_ok=True)
-
                     dict_out = self.network.list_modules[-1].get_pred_boxes_nms_for_single_datum(dict_out, conf_thr)
                     if dict_out is None:
                         continue
@@ -510,46 +768,44 @@ class Pipeline_v2_1():
                     dict_out = dict_datum_to_kitti(self, dict_out)
 
                     if len(dict_out['kitti_labels']) == 0: # not eval emptry label
-                        # with open(labels_dir + '/' + idx_name + '.txt', mode) as f:
-                        #     f.write('\n')
-                        pass
-                    else:
-                        for idx_label, label in enumerate(dict_out['kitti_labels']):
-                            if idx_label == 0:
-                                mode = 'w'
-                            else:
-                                mode = 'a'
-
-                            with open(labels_dir + '/' + idx_name + '.txt', mode) as f:
-                                f.write(label+'\n')
-
-                        ### Process description ###
-                        with open(desc_dir + '/' + idx_name + '.txt', 'w') as f:
-                            f.write(dict_out['kitti_desc'])
-                        ### Process description ###
-
-                        if len(dict_out['kitti_preds']) == 0:
-                            with open(preds_dir + '/' + idx_name + '.txt', mode) as f:
-                                f.write('\n')
-                        else:
-                            for idx_pred, pred in enumerate(dict_out['kitti_preds']):
-                                if idx_pred == 0:
-                                    mode = 'w'
-                                else:
-                                    mode = 'a'
-
-                                with open(preds_dir + '/' + idx_name + '.txt', mode) as f:
-                                    f.write(pred+'\n')
+                        continue
 
-                        str_log = idx_name + '\n'
-                        with open(split_path, 'a') as f:
-                            f.write(str_log)
+                    kitti_frame = (idx_name, conf_thr, \
+                        dict_out['kitti_labels'], dict_out['kitti_desc'], dict_out['kitti_preds'])
+                    if is_dist_val:
+                        list_kitti_frames.append(kitti_frame)
+                    else:
+                        self.write_kitti_frame(path_dir, *kitti_frame, dict_evaluator=dict_evaluator)
+                self.profiler.stop('post_processing')
                 tqdm_bar.update(1)
 
+                if self.is_streaming_val and (not is_dist_val) and \
+                    (((idx_datum + 1) % self.val_streaming_log_per_frames) == 0):
+                    dict_running_ap = dict()
+                    for conf_thr in list_conf_thr:
+                        try:
+                            dict_metrics, _ = dict_evaluator[conf_thr].get_eval_result( \
+                                                self.list_care_cls_idx[0], iou_mode='mod', is_return_with_dict=True)
+                            dict_running_ap[f'bev_{conf_thr}'] = f"{dict_metrics['bev'][0]:.2f}"
+                        except:
+                            pass
+                    tqdm_bar.set_postfix(dict_running_ap)
+
             except Exception as e:
                 print(e)
 
         tqdm_bar.close()
+        if is_pred_cache:
+            pred_cache_writer.close()
+
+        if is_dist_val:
+            list_kitti_frames_ranks = gather_objects(list_kitti_frames)
+            if not is_writer:
+                barrier() # until the evaluation of rank 0
+                return
+            list_kitti_frames = sorted(sum(list_kitti_frames_ranks, []), key=lambda x: x[0]) # stable: conf order
+            for kitti_frame in list_kitti_frames:
+                self.write_kitti_frame(path_dir, *kitti_frame, dict_evaluator=dict_evaluator)
 
         ### Validate per conf ###
         for conf_thr in list_conf_thr:
@@ -558,15 +814,22 @@ class Pipeline_v2_1():
             desc_dir = os.path.join(path_dir, f'{conf_thr}', 'desc')
             split_path = path_dir + f'/{conf_thr}/' + 'val.txt'
 
-            dt_annos = kitti.get_label_annos(preds_dir)
-            val_ids = read_imageset_file(split_path)
-            gt_annos = kitti.get_label_annos(labels_dir, val_ids)
+            if self.is_streaming_val:
+                get_eval_result = dict_evaluator[conf_thr].get_eval_result
+            else:
+                dt_annos = kitti.get_label_annos(preds_dir)
+                val_ids = read_imageset_file(split_path)
+                gt_annos = kitti.get_label_annos_cached(labels_dir, val_ids, \
+                    path_cache=os.path.join(path_dir, 'gts_cache.npz')) # same gts for every conf
+                overlap_cache = OverlapCache() # shared for all classes & iou modes
+                get_eval_result = lambda current_classes, **kwargs: get_official_eval_result( \
+                    gt_annos, dt_annos, current_classes, overlap_cache=overlap_cache, frame_ids=val_ids, **kwargs)
             if self.val_iou_mode == 'all':
                 list_metrics = []
                 list_results = []
                 for idx_cls_val in self.list_care_cls_idx:
                     try:
-                        dict_metrics, result = get_official_eval_result(gt_annos, dt_annos, idx_cls_val, is_return_with_dict=True)
+                        dict_metrics, result = get_eval_result(idx_cls_val, is_return_with_dict=True)
                     except:
                         dic_cls_val = self.cfg.VAL.DIC_CLASS_VAL
                         cls_name = dic_cls_val[list(dic_cls_val.keys())[idx_cls_val]]
@@ -604,8 +867,8 @@ class Pipeline_v2_1():
                     log_result = ''
                     for idx_mode, iou_mode in enumerate(list_iou_mode):
                         try:
-                            dict_metrics, result = get_official_eval_result(gt_annos, dt_annos, idx_cls_val, \
-                                                                                iou_mode=iou_mode, is_return_with_dict=True)
+                            dict_metrics, result = get_eval_result(idx_cls_val, \
+                                                                    iou_mode=iou_mode, is_return_with_dict=True)
                         except:
                             dic_cls_val = self.cfg.VAL.DIC_CLASS_VAL
                             cls_name = dic_cls_val[list(dic_cls_val.keys())[idx_cls_val]]
@@ -632,9 +895,185 @@ class Pipeline_v2_1():
                         log_result += result
                     self.log_val.add_text(f'{log_header}/conf_{conf_thr}_{cls_name}', log_result, epoch)
         ### Validate per conf ###
+        barrier() # ranks != 0 wait for the evaluation
+
+    def write_kitti_frame(self, path_dir, idx_name, conf_thr, kitti_labels, kitti_desc, kitti_preds, dict_evaluator=None):
+        '''
+        * gts, desc, preds & val.txt of a frame with labels (validate_kitti)
+        * dict_evaluator: streaming evaluators per conf (None without streaming)
+        '''
+        preds_dir = os.path.join(path_dir, f'{conf_thr}', 'preds')
+        labels_dir = os.path.join(path_dir, f'{conf_thr}', 'gts')
+        desc_dir = os.path.join(path_dir, f'{conf_thr}', 'desc')
+        split_path = path_dir + f'/{conf_thr}/' + 'val.txt'
+
+        for idx_label, label in enumerate(kitti_labels):
+            if idx_label == 0:
+                mode = 'w'
+            else:
+                mode = 'a'
+
+            with open(labels_dir + '/' + idx_name + '.txt', mode) as f:
+                f.write(label+'\n')
+
+        ### Process description ###
+        with open(desc_dir + '/' + idx_name + '.txt', 'w') as f:
+            f.write(kitti_desc)
+        ### Process description ###
+
+        if len(kitti_preds) == 0:
+            with open(preds_dir + '/' + idx_name + '.txt', mode) as f:
+                f.write('\n')
+        else:
+            for idx_pred, pred in enumerate(kitti_preds):
+                if idx_pred == 0:
+                    mode = 'w'
+                else:
+                    mode = 'a'
+
+                with open(preds_dir + '/' + idx_name + '.txt', mode) as f:
+                    f.write(pred+'\n')
+
+        str_log = idx_name + '\n'
+        with open(split_path, 'a') as f:
+            f.write(str_log)
+
+        if dict_evaluator is not None:
+            dict_evaluator[conf_thr].update( \
+                kitti.get_label_anno_from_lines(kitti_labels), \
+                kitti.get_label_anno_from_lines(kitti_preds))
+
+
+    def validate_kitti_multi_ckpt(self, list_path_dict_model, list_conf_thr=None, is_subset=False, is_strict=False):
+        '''
+        * Evaluate several checkpoints (e.g., last N epochs) with one pass over dataset_val
+        *   each batch is loaded once and given to every model (eval mode) in turn
+        *   results are accumulated per model & conf_thr with StreamingEvaluator
+        * returns {path_dict_model: {conf_thr: [dict_metrics per cared cls]}}
+        '''
+        from utils.kitti_eval.eval_stream import StreamingEvaluator # numba
+        list_conf_thr = self.list_val_conf_thr if list_conf_thr is None else list_conf_thr
+
+        list_network = []
+        dict_evaluator = dict()
+        for path_dict_model in list_path_dict_model:
+            network = build_network(self).to(self.device)
+            network.load_state_dict(torch.load(path_dict_model, map_location=self.device), strict=is_strict)
+            network.eval()
+            list_network.append(network)
+            for conf_thr in list_conf_thr:
+                dict_evaluator[(path_dict_model, conf_thr)] = StreamingEvaluator(self.list_care_cls_idx)
+
+        is_shuffle = True if is_subset else False
+        num_total = self.val_num_subset if is_subset else len(self.dataset_val)
+        data_loader = torch.utils.data.DataLoader(self.dataset_val, \
+                batch_size = 1, shuffle = is_shuffle, collate_fn = self.dataset_val.collate_fn, \
+                    num_workers = self.cfg.OPTIMIZER.NUM_WORKERS)
+
+        with torch.no_grad():
+            for idx_datum, dict_datum in enumerate(tqdm(data_loader, total=num_total, desc=f'val {len(list_network)} ckpts: ')):
+                if is_subset & (idx_datum >= self.val_num_subset):
+                    break
+                if dict_datum is None:
+                    continue
+
+                for path_dict_model, network in zip(list_path_dict_model, list_network):
+                    try:
+                        with get_autocast_context(self.device_type, self.amp_dtype):
+                            dict_out = network(dict(dict_datum)) # shallow copy, modules only add keys
+                    except Exception as e:
+                        print(e)
+                        continue
+
+                    for conf_thr in list_conf_thr:
+                        dict_out = network.list_modules[-1].get_pred_boxes_nms_for_single_datum(dict_out, conf_thr)
+                        if dict_out is None:
+                            break
+                        dict_out = dict_datum_to_kitti(self, dict_out)
+                        if len(dict_out['kitti_labels']) == 0: # not eval emptry label
+                            continue
+                        dict_evaluator[(path_dict_model, conf_thr)].update( \
+                            kitti.get_label_anno_from_lines(dict_out['kitti_labels']), \
+                            kitti.get_label_anno_from_lines(dict_out['kitti_preds']))
+
+        dict_results = dict()
+        for path_dict_model in list_path_dict_model:
+            dict_results[path_dict_model] = dict()
+            print(f'* Checkpoint = {path_dict_model}')
+            for conf_thr in list_conf_thr:
+                dict_results[path_dict_model][conf_thr] = []
+                for idx_cls_val in self.list_care_cls_idx:
+                    try:
+                        dict_metrics, result = dict_evaluator[(path_dict_model, conf_thr)].get_eval_result( \
+                                                                    idx_cls_val, is_return_with_dict=True)
+                    except Exception as e:
+                        print(e)
+                        continue
+                    print(f'* conf_thr = {conf_thr}')
+                    print(result)
+                    dict_results[path_dict_model][conf_thr].append(dict_metrics)
 
+        return dict_results
+
+    def validate_kitti_from_pred_cache(self, path_cache, list_conf_thr=None, nms_overlap_thresh=None, max_num_proposals=None):
+        '''
+        * Re-evaluate with other conf / nms thresholds from a cache of validate_kitti (VAL.PRED_CACHE)
+        *   no radar tensor loading and no network forward (cpu only)
+        * conf_thr lower than min_conf_thr of the cache is not possible
+        * nms_overlap_thresh: None for MODEL.HEAD.NMS_OVERLAP_THRESH (as the head)
+        '''
+        from utils.kitti_eval.eval_stream import StreamingEvaluator # numba
+        from models.head.rdr_cube_sedan_head import get_nms_pred_boxes
+        pred_cache_reader = PredCacheReader(path_cache)
+        list_conf_thr = self.list_val_conf_thr if list_conf_thr is None else list_conf_thr
+        if nms_overlap_thresh is None:
+            nms_overlap_thresh = self.cfg.MODEL.HEAD.get('NMS_OVERLAP_THRESH', 0.3)
+        if min(list_conf_thr) < pred_cache_reader.min_conf_thr:
+            raise ValueError(f'* conf_thr should be >= {pred_cache_reader.min_conf_thr} (min_conf_thr of the cache)')
+
+        dict_evaluator = dict()
+        for conf_thr in list_conf_thr:
+            dict_evaluator[conf_thr] = StreamingEvaluator(self.list_care_cls_idx)
+
+        for idx_frame in tqdm(range(len(pred_cache_reader)), desc='val cache: '):
+            pred_boxes, cls_ids, labels, desc, _ = pred_cache_reader[idx_frame]
+            pred_boxes, cls_ids = torch.from_numpy(pred_boxes), torch.from_numpy(cls_ids)
+
+            for conf_thr in list_conf_thr:
+                dict_out = {'labels': labels, 'pred_desc': dict(desc)}
+                idx_cared = torch.where(pred_boxes[:, 0] > conf_thr)[0]
+                if len(idx_cared) > 0:
+                    pred_boxes_nms, cls_ids_nms, is_nms = get_nms_pred_boxes(pred_boxes[idx_cared], cls_ids[idx_cared], \
+                                                                nms_overlap_thresh, max_num_proposals)
+                    dict_out['pred_desc'].update({'is_nms': is_nms})
+                    dict_out['pred_boxes_nms'] = pred_boxes_nms
+                    dict_out['pred_cls_ids'] = cls_ids_nms
+                else:
+                    dict_out['pred_desc'].update({'is_nms': True})
+                
+                dict_out = dict_datum_to_kitti(self, dict_out)
+                if len(dict_out['kitti_labels']) == 0: # not eval emptry label
+                    continue
+                dict_evaluator[conf_thr].update(kitti.get_label_anno_from_lines(dict_out['kitti_labels']), \
+                                                kitti.get_label_anno_from_lines(dict_out['kitti_preds']))
+
+        dict_results = dict()
+        for conf_thr in list_conf_thr:
+            dict_results[conf_thr] = []
+            for idx_cls_val in self.list_care_cls_idx:
+                try:
+                    dict_metrics, result = dict_evaluator[conf_thr].get_eval_result(idx_cls_val, is_return_with_dict=True)
+                except Exception as e:
+                    print(e)
+                    continue
+                print(f'* conf_thr = {conf_thr}, nms_overlap_thresh = {nms_overlap_thresh}')
+                print(result)
+                dict_results[conf_thr].append(dict_metrics)
+
+        return dict_results
 
     def validate_kitti_conditional(self, epoch=None, list_conf_thr=None, is_subset=False, is_print_memory=False):
+            from utils.kitti_eval.eval import get_official_eval_result, OverlapCache # numba
             self.network.eval()
             road_cond_list = ['urban', 'highway', 'countryside', 'alleyway', 'parkinglots', 'shoulder', 'mountain', 'university']
             time_cond_list = ['day', 'night']
@@ -651,7 +1090,7 @@ class Pipeline_v2_1():
                 log_header = 'val_tot'
 
             data_loader = torch.utils.data.DataLoader(self.dataset_val, \
-                    batch_size = 1, shuffle = is_shuffle, collate_fn = self.dataset.collate_fn, \
+                    batch_size = 1, shuffle = is_shuffle, collate_fn = self.dataset_val.collate_fn, \
                         num_workers = 1) # self.cfg.OPTIMIZER.NUM_WORKERS)
             
             if epoch is None:
@@ -766,12 +1205,13 @@ class Pipeline_v2_1():
                 if is_subset & (idx_datum >= self.val_num_subset):
                     break
                 try:
-                    dict_out = self.network(dict_datum)
+                    with get_autocast_context(self.device_type, self.amp_dtype):
+                        dict_out = self.network(dict_datum)
                 except:
                     print(f'error happens in {idx_datum}')
                     continue
 
-                if is_print_memory:
+                if is_print_memory and (self.device_type == 'cuda'):
                     print('max_memory: ', torch.cuda.max_memory_allocated(device=None))
                     
                 idx_name = str(idx_datum).zfill(6)
@@ -893,6 +1333,8 @@ class Pipeline_v2_1():
             ### Validate per conf ###
             all_condition_list = ['all'] + road_cond_list + time_cond_list + weather_cond_list
             for conf_thr in list_conf_thr:
+                # conditions are subsets of 'all' with the same frame ids
+                overlap_cache = OverlapCache()
                 for condition in all_condition_list:
                     try:
                         preds_dir = os.path.join(path_dir, f'{conf_thr}', condition, 'preds')
@@ -902,13 +1344,15 @@ class Pipeline_v2_1():
 
                         dt_annos = kitti.get_label_annos(preds_dir)
                         val_ids = read_imageset_file(split_path)
-                        gt_annos = kitti.get_label_annos(labels_dir, val_ids)
+                        gt_annos = kitti.get_label_annos_cached(labels_dir, val_ids, \
+                            path_cache=os.path.join(path_dir, f'gts_cache_{condition}.npz')) # same gts for every conf
                         if self.val_iou_mode == 'all':
                             list_metrics = []
                             list_results = []
                             for idx_cls_val in self.list_care_cls_idx:
                                 try:
-                                    dict_metrics, result = get_official_eval_result(gt_annos, dt_annos, idx_cls_val, is_return_with_dict=True)
+                                    dict_metrics, result = get_official_eval_result(gt_annos, dt_annos, idx_cls_val, is_return_with_dict=True, \
+                                                                                    overlap_cache=overlap_cache, frame_ids=val_ids)
                                 except Exception as e:
                                     print(e)
 
@@ -949,7 +1393,8 @@ class Pipeline_v2_1():
                                 for idx_mode, iou_mode in enumerate(list_iou_mode):
                                     try:
                                         dict_metrics, result = get_official_eval_result(gt_annos, dt_annos, idx_cls_val, \
-                                                                                            iou_mode=iou_mode, is_return_with_dict=True)
+                                                                                            iou_mode=iou_mode, is_return_with_dict=True, \
+                                                                                            overlap_cache=overlap_cache, frame_ids=val_ids)
                                     except Exception as e:
                                         print(e)
                                         dic_cls_val = self.cfg.VAL.DIC_CLASS_VAL
@@ -450,6 +450,81 @@ def calculate_iou_partly(gt_annos,
     return overlaps, parted_overlaps, total_gt_num, total_dt_num
 
 
+class OverlapCache():
+    """per-frame overlap matrices shared between eval calls.
+    The pairwise overlaps of a frame do not depend on class, difficulty or
+    min overlap, so they are computed once per metric and reused for every
+    get_official_eval_result call that is given the same cache.
+    Frames are keyed by frame_ids (e.g. the ids in val.txt), which lets
+    conditional subsets (road / time / weather) of the same split reuse the
+    matrices computed for 'all'. Without frame_ids the anno dicts themselves
+    are the key, which covers repeated calls on the same annos.
+    """
+    def __init__(self):
+        self.dict_overlaps = dict()
+        self.list_keep_alive = [] # keep annos alive so that id() is unique
+
+    def _get_frame_keys(self, annos, annos_other, frame_ids):
+        if frame_ids is not None:
+            assert len(frame_ids) == len(annos)
+            return list(frame_ids)
+        self.list_keep_alive.append((annos, annos_other))
+        return [(id(a), id(b)) for a, b in zip(annos, annos_other)]
+
+    def get_overlaps(self,
+                     gt_annos,
+                     dt_annos,
+                     metric,
+                     frame_ids=None,
+                     num_parts=10,
+                     z_axis=1,
+                     z_center=1.0):
+        """same args and returns as calculate_iou_partly.
+        """
+        assert len(gt_annos) == len(dt_annos)
+        dict_metric = self.dict_overlaps.setdefault(
+            (metric, z_axis, z_center), dict())
+        frame_keys = self._get_frame_keys(gt_annos, dt_annos, frame_ids)
+
+        ### Compute only frames not in cache ###
+        list_idx_new = [i for i, key in enumerate(frame_keys)
+                        if key not in dict_metric]
+        if len(list_idx_new) > 0:
+            overlaps_new, _, _, _ = calculate_iou_partly(
+                [gt_annos[i] for i in list_idx_new],
+                [dt_annos[i] for i in list_idx_new],
+                metric,
+                num_parts,
+                z_axis=z_axis,
+                z_center=z_center)
+            for i, overlap in zip(list_idx_new, overlaps_new):
+                dict_metric[frame_keys[i]] = overlap
+        ### Compute only frames not in cache ###
+
+        overlaps = [dict_metric[key] for key in frame_keys]
+        total_gt_num = np.array([len(a["name"]) for a in gt_annos], dtype=np.int64)
+        total_dt_num = np.array([len(a["name"]) for a in dt_annos], dtype=np.int64)
+
+        # fused_compute_statistics only reads the per-frame diagonal blocks
+        parted_overlaps = []
+        example_idx = 0
+        for num_part in get_split_parts(len(gt_annos), num_parts):
+            gt_nums = total_gt_num[example_idx:example_idx + num_part]
+            dt_nums = total_dt_num[example_idx:example_idx + num_part]
+            overlap_part = np.zeros((np.sum(gt_nums), np.sum(dt_nums)), dtype=np.float64)
+            gt_num_idx, dt_num_idx = 0, 0
+            for i in range(num_part):
+                overlap_part[gt_num_idx:gt_num_idx + gt_nums[i],
+                             dt_num_idx:dt_num_idx + dt_nums[i]] = \
+                                overlaps[example_idx + i]
+                gt_num_idx += gt_nums[i]
+                dt_num_idx += dt_nums[i]
+            parted_overlaps.append(overlap_part)
+            example_idx += num_part
+
+        return overlaps, parted_overlaps, total_gt_num, total_dt_num
+
+
 def _prepare_data(gt_annos, dt_annos, current_class, difficulty):
     gt_datas_list = []
     dt_datas_list = []
@@ -490,7 +565,9 @@ def eval_class(gt_annos,
                   compute_aos=False,
                   z_axis=1,
                   z_center=1.0,
-                  num_parts=10):
+                  num_parts=10,
+                  overlap_cache=None,
+                  frame_ids=None):
     """Kitti eval. support 2d/bev/3d/aos eval. support 0.5:0.05:0.95 coco AP.
     Args:
         gt_annos: dict, must from get_label_annos() in kitti_common.py
@@ -502,6 +579,8 @@ def eval_class(gt_annos,
             [[0.7, 0.5, 0.5], [0.7, 0.5, 0.5], [0.7, 0.5, 0.5]] 
             format: [metric, class]. choose one from matrix above.
         num_parts: int. a parameter for fast calculate algorithm
+        overlap_cache: OverlapCache or None. reuse overlaps between calls
+        frame_ids: list of frame ids used as cache keys (optional)
 
     Returns:
         dict of recall, precision and aos
@@ -510,13 +589,23 @@ def eval_class(gt_annos,
     num_examples = len(gt_annos)
     split_parts = get_split_parts(num_examples, num_parts)
 
-    rets = calculate_iou_partly(
-        dt_annos,
-        gt_annos,
-        metric,
-        num_parts,
-        z_axis=z_axis,
-        z_center=z_center)
+    if overlap_cache is None:
+        rets = calculate_iou_partly(
+            dt_annos,
+            gt_annos,
+            metric,
+            num_parts,
+            z_axis=z_axis,
+            z_center=z_center)
+    else:
+        rets = overlap_cache.get_overlaps(
+            dt_annos,
+            gt_annos,
+            metric,
+            frame_ids,
+            num_parts,
+            z_axis=z_axis,
+            z_center=z_center)
     overlaps, parted_overlaps, total_dt_num, total_gt_num = rets
     N_SAMPLE_PTS = 41
     num_minoverlap = len(min_overlaps)
@@ -616,7 +705,9 @@ def do_eval_v2(gt_annos,
                compute_aos=False,
                difficultys=(0, 1, 2),
                z_axis=1,
-               z_center=1.0):
+               z_center=1.0,
+               overlap_cache=None,
+               frame_ids=None):
     # min_overlaps: [num_minoverlap, metric, num_class]
     ret = eval_class(
         gt_annos,
@@ -627,7 +718,9 @@ def do_eval_v2(gt_annos,
         min_overlaps,
         compute_aos,
         z_axis=z_axis,
-        z_center=z_center)
+        z_center=z_center,
+        overlap_cache=overlap_cache,
+        frame_ids=frame_ids)
     # ret: [num_class, num_diff, num_minoverlap, num_sample_points]
     mAP_bbox = get_mAP_v2(ret["precision"])
     mAP_aos = None
@@ -641,7 +734,9 @@ def do_eval_v2(gt_annos,
         1,
         min_overlaps,
         z_axis=z_axis,
-        z_center=z_center)
+        z_center=z_center,
+        overlap_cache=overlap_cache,
+        frame_ids=frame_ids)
     mAP_bev = get_mAP_v2(ret["precision"])
     ret = eval_class(
         gt_annos,
@@ -651,7 +746,9 @@ def do_eval_v2(gt_annos,
         2,
         min_overlaps,
         z_axis=z_axis,
-        z_center=z_center)
+        z_center=z_center,
+        overlap_cache=overlap_cache,
+        frame_ids=frame_ids)
     mAP_3d = get_mAP_v2(ret["precision"])
     return mAP_bbox, mAP_bev, mAP_3d, mAP_aos
 
@@ -662,7 +759,9 @@ def do_eval_v3(gt_annos,
                compute_aos=False,
                difficultys=(0, 1, 2),
                z_axis=1,
-               z_center=1.0):
+               z_center=1.0,
+               overlap_cache=None,
+               frame_ids=None):
     # min_overlaps: [num_minoverlap, metric, num_class]
     types = ["bbox", "bev", "3d"]
     metrics = {}
@@ -676,7 +775,9 @@ def do_eval_v3(gt_annos,
             min_overlaps,
             compute_aos,
             z_axis=z_axis,
-            z_center=z_center)
+            z_center=z_center,
+            overlap_cache=overlap_cache,
+            frame_ids=frame_ids)
         metrics[types[i]] = ret
     return metrics
 
@@ -718,17 +819,31 @@ def print_str(value, *arg, sstream=None):
     print(value, *arg, file=sstream)
     return sstream.getvalue()
 
-def get_official_eval_result(gt_annos,
-                             dt_annos,
-                             current_classes,
-                             difficultys=[0, 1, 2],
-                             z_axis=1,
-                             z_center=1.0,
-                             iou_mode='all', # 'hard', 'mod', 'easy', 'all'
-                             is_return_with_dict=False):
+CLASS_TO_NAME = {
+    0: 'sed',
+    1: 'bus',
+    2: 'mot',
+    3: 'bic',
+    4: 'big',
+    5: 'ped',
+    6: 'peg',
+    7: 'bg',
+}
+# CLASS_TO_NAME = {
+#     0: 'Car',
+#     1: 'Pedestrian',
+#     2: 'Cyclist',
+#     3: 'Van',
+#     4: 'Person_sitting',
+#     5: 'car',
+#     6: 'tractor',
+#     7: 'trailer',
+# }
+
+def get_official_min_overlaps(iou_mode='all'):
     """
-        gt_annos and dt_annos must contains following keys:
-        [bbox, location, dimensions, rotation_y, score]
+        returns min_overlaps: [num_minoverlap, metric, num_class]
+        iou_mode: 'hard', 'mod', 'easy', 'all'
     """
     # overlap_mod = np.array([[0.7, 0.5, 0.5, 0.7, 0.5, 0.7, 0.7, 0.7],
     #                         [0.7, 0.5, 0.5, 0.7, 0.5, 0.7, 0.7, 0.7],
@@ -754,36 +869,10 @@ def get_official_eval_result(gt_annos,
         'easy': [overlap_easy]
     }
 
-    min_overlaps = np.stack(dict_ious[iou_mode], axis=0)  # [2, 3, 5]
-    class_to_name = {
-        0: 'sed',
-        1: 'bus',
-        2: 'mot',
-        3: 'bic',
-        4: 'big',
-        5: 'ped',
-        6: 'peg',
-        7: 'bg',
-    }
-    # class_to_name = {
-    #     0: 'Car',
-    #     1: 'Pedestrian',
-    #     2: 'Cyclist',
-    #     3: 'Van',
-    #     4: 'Person_sitting',
-    #     5: 'car',
-    #     6: 'tractor',
-    #     7: 'trailer',
-    # }
-    dict_metrics = {
-        'cls': None,
-        'iou': [],
-        'bbox': [],
-        'bev': [],
-        '3d': [],
-    }
+    return np.stack(dict_ious[iou_mode], axis=0)  # [2, 3, 5]
 
-    name_to_class = {v: n for n, v in class_to_name.items()}
+def get_current_classes_int(current_classes):
+    name_to_class = {v: n for n, v in CLASS_TO_NAME.items()}
     if not isinstance(current_classes, (list, tuple)):
         current_classes = [current_classes]
     current_classes_int = []
@@ -792,25 +881,25 @@ def get_official_eval_result(gt_annos,
             current_classes_int.append(name_to_class[curcls])
         else:
             current_classes_int.append(curcls)
-    current_classes = current_classes_int
-    min_overlaps = min_overlaps[:, :, current_classes]
+    return current_classes_int
+
+def get_official_result_from_metrics(metrics,
+                                     current_classes,
+                                     min_overlaps,
+                                     compute_aos=False,
+                                     is_return_with_dict=False):
+    """
+        metrics: {'bbox', 'bev', '3d'} of eval_class outputs
+        min_overlaps: [num_minoverlap, metric, num_class] of current_classes
+    """
+    dict_metrics = {
+        'cls': None,
+        'iou': [],
+        'bbox': [],
+        'bev': [],
+        '3d': [],
+    }
     result = ''
-    # check whether alpha is valid
-    compute_aos = False
-    for anno in dt_annos:
-        if anno['alpha'].shape[0] != 0:
-            if anno['alpha'][0] != -10:
-                compute_aos = True
-            break
-    metrics = do_eval_v3(
-        gt_annos,
-        dt_annos,
-        current_classes,
-        min_overlaps,
-        compute_aos,
-        difficultys,
-        z_axis=z_axis,
-        z_center=z_center)
     for j, curcls in enumerate(current_classes):
         # mAP threshold array: [num_minoverlap, metric, class]
         # mAP result: [num_class, num_diff, num_minoverlap]
@@ -825,7 +914,7 @@ def get_official_eval_result(gt_annos,
             log_3d = mAP3d[0]
             mAP3d = ", ".join(f"{v:.2f}" for v in mAP3d)
             result += print_str(
-                (f"{class_to_name[curcls]} "
+                (f"{CLASS_TO_NAME[curcls]} "
                  "AP(Average Precision)@{:.2f}, {:.2f}, {:.2f}:".format(*min_overlaps[i, :, j])))
             result += print_str(f"bbox AP:{mAPbbox}")
             result += print_str(f"bev  AP:{mAPbev}")
@@ -836,7 +925,7 @@ def get_official_eval_result(gt_annos,
                 result += print_str(f"aos  AP:{mAPaos}")
             
             ### Only logging once ###
-            dict_metrics['cls'] = f"{class_to_name[curcls]}"
+            dict_metrics['cls'] = f"{CLASS_TO_NAME[curcls]}"
             dict_metrics['iou'].append(min_overlaps[i, :, j][0])
             dict_metrics['bbox'].append(log_bbox)
             dict_metrics['bev'].append(log_bev)
@@ -846,3 +935,44 @@ def get_official_eval_result(gt_annos,
         return dict_metrics, result
     else:
         return result
+
+def get_official_eval_result(gt_annos,
+                             dt_annos,
+                             current_classes,
+                             difficultys=[0, 1, 2],
+                             z_axis=1,
+                             z_center=1.0,
+                             iou_mode='all', # 'hard', 'mod', 'easy', 'all'
+                             is_return_with_dict=False,
+                             overlap_cache=None,
+                             frame_ids=None):
+    """
+        gt_annos and dt_annos must contains following keys:
+        [bbox, location, dimensions, rotation_y, score]
+        overlap_cache (OverlapCache) is shared between calls on the same annos
+        (other classes, iou_mode, conditional subsets keyed by frame_ids)
+    """
+    min_overlaps = get_official_min_overlaps(iou_mode)
+    current_classes = get_current_classes_int(current_classes)
+    min_overlaps = min_overlaps[:, :, current_classes]
+    # check whether alpha is valid
+    compute_aos = False
+    for anno in dt_annos:
+        if anno['alpha'].shape[0] != 0:
+            if anno['alpha'][0] != -10:
+                compute_aos = True
+            break
+    metrics = do_eval_v3(
+        gt_annos,
+        dt_annos,
+        current_classes,
+        min_overlaps,
+        compute_aos,
+        difficultys,
+        z_axis=z_axis,
+        z_center=z_center,
+        overlap_cache=overlap_cache,
+        frame_ids=frame_ids)
+
+    return get_official_result_from_metrics(metrics, current_classes, \
+                    min_overlaps, compute_aos, is_return_with_dict)
@@ -0,0 +1,180 @@
+import numpy as np
+
+try:
+    from eval import get_thresholds, compute_statistics_jit, calculate_iou_partly, \
+        _prepare_data, get_official_min_overlaps, get_current_classes_int, \
+        get_official_result_from_metrics
+except:
+    from utils.kitti_eval.eval import get_thresholds, compute_statistics_jit, calculate_iou_partly, \
+        _prepare_data, get_official_min_overlaps, get_current_classes_int, \
+        get_official_result_from_metrics
+
+N_SAMPLE_PTS = 41
+METRIC_TYPES = ["bbox", "bev", "3d"]
+
+
+class StreamingEvaluator():
+    """incremental version of get_official_eval_result.
+    Frames are given one by one with update(gt_anno, dt_anno) and are not kept.
+    For every (metric, class, difficulty, min_overlap) the evaluator keeps
+        1. the scores of true positives (for get_thresholds)
+        2. the change of (tp, fp, fn) of each frame when the score threshold
+           passes one of the frame's detection scores
+    so the PR curve at any threshold is a suffix sum over the score events.
+    With num_bins=None the events keep the exact scores and the final AP is
+    the same as get_official_eval_result on the written kitti files. With
+    num_bins, scores are floored to 1/num_bins and the memory is fixed.
+    aos is not accumulated (orientation is not logged for K-Radar).
+    """
+    def __init__(self,
+                 current_classes,
+                 difficultys=[0, 1, 2],
+                 num_bins=None,
+                 z_axis=1,
+                 z_center=1.0):
+        self.current_classes = get_current_classes_int(current_classes)
+        self.difficultys = list(difficultys)
+        self.min_overlaps = get_official_min_overlaps('all')[:, :, self.current_classes]
+        self.num_bins = num_bins
+        self.z_axis = z_axis
+        self.z_center = z_center
+
+        num_class = len(self.current_classes)
+        num_difficulty = len(self.difficultys)
+        num_minoverlap = self.min_overlaps.shape[0]
+        shape_keys = (len(METRIC_TYPES), num_class, num_difficulty, num_minoverlap)
+
+        self.num_frames = 0
+        self.num_valid_gt = np.zeros((num_class, num_difficulty), dtype=np.int64)
+        self.pr_base = np.zeros((*shape_keys, 3), dtype=np.int64) # (tp, fp, fn) with no detection
+        if num_bins is None:
+            self.list_tp_scores = np.empty(shape_keys, dtype=object)
+            self.list_event_scores = np.empty(shape_keys, dtype=object)
+            self.list_event_deltas = np.empty(shape_keys, dtype=object)
+            for idx in np.ndindex(*shape_keys):
+                self.list_tp_scores[idx] = []
+                self.list_event_scores[idx] = []
+                self.list_event_deltas[idx] = []
+        else:
+            self.hist_tp = np.zeros((*shape_keys, num_bins), dtype=np.int64)
+            self.hist_event = np.zeros((*shape_keys, num_bins, 3), dtype=np.int64)
+
+    def _score_to_bin(self, scores):
+        return np.clip(np.floor(scores*self.num_bins).astype(np.int64), 0, self.num_bins-1)
+
+    def update(self, gt_anno, dt_anno):
+        """
+            gt_anno, dt_anno: annos of a frame from kitti_common.get_label_anno(_from_lines)
+        """
+        list_overlaps = []
+        for metric in range(len(METRIC_TYPES)):
+            overlaps, _, _, _ = calculate_iou_partly([dt_anno], [gt_anno], metric, 1, \
+                                    z_axis=self.z_axis, z_center=self.z_center)
+            list_overlaps.append(overlaps[0])
+
+        for m, current_class in enumerate(self.current_classes):
+            for l, difficulty in enumerate(self.difficultys):
+                rets = _prepare_data([gt_anno], [dt_anno], current_class, difficulty)
+                (gt_datas_list, dt_datas_list, ignored_gts, ignored_dets,
+                 dontcares, _, num_valid_gt) = rets
+                self.num_valid_gt[m, l] += num_valid_gt
+                gt_datas, dt_datas = gt_datas_list[0], dt_datas_list[0]
+                ignored_gt, ignored_det, dontcare = ignored_gts[0], ignored_dets[0], dontcares[0]
+                scores_desc = np.unique(dt_datas[:, -1])[::-1]
+
+                for metric, overlap in enumerate(list_overlaps):
+                    for k, min_overlap in enumerate(self.min_overlaps[:, metric, m]):
+                        idx = (metric, m, l, k)
+                        get_stats = lambda thresh, compute_fp: compute_statistics_jit(
+                            overlap, gt_datas, dt_datas, ignored_gt, ignored_det, dontcare,
+                            metric, min_overlap=min_overlap, thresh=thresh, compute_fp=compute_fp)
+
+                        tp_scores = get_stats(0.0, False)[4]
+
+                        # (tp, fp, fn) only changes at the scores of the detections
+                        tp, fp, fn, _, _ = get_stats(np.inf, True)
+                        stats_prev = np.array([tp, fp, fn], dtype=np.int64)
+                        self.pr_base[idx] += stats_prev
+                        list_scores, list_deltas = [], []
+                        for score in scores_desc:
+                            tp, fp, fn, _, _ = get_stats(score, True)
+                            stats = np.array([tp, fp, fn], dtype=np.int64)
+                            if np.any(stats != stats_prev):
+                                list_scores.append(score)
+                                list_deltas.append(stats - stats_prev)
+                            stats_prev = stats
+
+                        if self.num_bins is None:
+                            if len(tp_scores) > 0:
+                                self.list_tp_scores[idx].append(tp_scores)
+                            if len(list_scores) > 0:
+                                self.list_event_scores[idx].append(np.array(list_scores))
+                                self.list_event_deltas[idx].append(np.stack(list_deltas, 0))
+                        else:
+                            np.add.at(self.hist_tp[idx], self._score_to_bin(tp_scores), 1)
+                            if len(list_scores) > 0:
+                                np.add.at(self.hist_event[idx], \
+                                    self._score_to_bin(np.array(list_scores)), np.stack(list_deltas, 0))
+        self.num_frames += 1
+
+    def _get_scores_and_events(self, idx):
+        """
+            returns tp scores, event scores (ascending) and event deltas
+        """
+        if self.num_bins is None:
+            tp_scores = np.concatenate(self.list_tp_scores[idx]) \
+                if len(self.list_tp_scores[idx]) > 0 else np.zeros((0,))
+            if len(self.list_event_scores[idx]) > 0:
+                event_scores = np.concatenate(self.list_event_scores[idx])
+                event_deltas = np.concatenate(self.list_event_deltas[idx], 0)
+                idx_sort = np.argsort(event_scores, kind='stable')
+                event_scores, event_deltas = event_scores[idx_sort], event_deltas[idx_sort]
+            else:
+                event_scores = np.zeros((0,))
+                event_deltas = np.zeros((0, 3), dtype=np.int64)
+        else:
+            bin_edges = np.arange(self.num_bins)/self.num_bins
+            tp_scores = np.repeat(bin_edges, self.hist_tp[idx])
+            event_scores = bin_edges
+            event_deltas = self.hist_event[idx]
+        return tp_scores, event_scores, event_deltas
+
+    def _get_precision(self):
+        num_metric, num_class, num_difficulty, num_minoverlap = self.pr_base.shape[:4]
+        precision = np.zeros([num_metric, num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS])
+        for idx in np.ndindex(num_metric, num_class, num_difficulty, num_minoverlap):
+            _, m, l, _ = idx
+            tp_scores, event_scores, event_deltas = self._get_scores_and_events(idx)
+            if (len(tp_scores) == 0) or (self.num_valid_gt[m, l] == 0):
+                continue # AP = 0
+            thresholds = np.array(get_thresholds(tp_scores.astype(np.float64), self.num_valid_gt[m, l]))
+
+            # pr(thresh) = base + sum of deltas of events with score >= thresh
+            suffix_deltas = np.concatenate([np.cumsum(event_deltas[::-1], axis=0)[::-1], \
+                                            np.zeros((1, 3), dtype=np.int64)], 0)
+            pr = self.pr_base[idx] + suffix_deltas[np.searchsorted(event_scores, thresholds, side='left')]
+
+            prec = precision[idx]
+            prec[:len(thresholds)] = pr[:, 0] / (pr[:, 0] + pr[:, 1])
+            for i in range(len(thresholds)):
+                prec[i] = np.max(prec[i:], axis=-1)
+        return precision
+
+    def get_eval_result(self,
+                        current_classes,
+                        iou_mode='all', # 'hard', 'mod', 'easy', 'all'
+                        is_return_with_dict=False):
+        """same returns as get_official_eval_result for frames given until now.
+        """
+        current_classes = get_current_classes_int(current_classes)
+        list_idx_cls = [self.current_classes.index(curcls) for curcls in current_classes]
+        list_idx_iou = {'all': [0, 1, 2], 'hard': [0], 'mod': [1], 'easy': [2]}[iou_mode]
+
+        precision = self._get_precision()[:, list_idx_cls][:, :, :, list_idx_iou]
+        metrics = dict()
+        for metric, type_metric in enumerate(METRIC_TYPES):
+            metrics[type_metric] = {'precision': precision[metric]}
+        min_overlaps = self.min_overlaps[list_idx_iou][:, :, list_idx_cls]
+
+        return get_official_result_from_metrics(metrics, current_classes, \
+                        min_overlaps, False, is_return_with_dict)
@@ -2,6 +2,7 @@ import concurrent.futures as futures
 import os
 import pathlib
 import re
+import zlib
 from collections import OrderedDict
 
 import numpy as np
@@ -291,6 +292,14 @@ def add_difficulty_to_annos(info):
 
 
 def get_label_anno(label_path):
+    with open(label_path, 'r') as f:
+        lines = f.readlines()
+    return get_label_anno_from_lines(lines)
+
+def get_label_anno_from_lines(lines):
+    """same as get_label_anno, but parses kitti lines already in memory
+    (e.g. kitti_preds / kitti_labels from dict_datum_to_kitti).
+    """
     annotations = {}
     annotations.update({
         'name': [],
@@ -302,8 +311,6 @@ def get_label_anno(label_path):
         'location': [],
         'rotation_y': []
     })
-    with open(label_path, 'r') as f:
-        lines = f.readlines()
     # if len(lines) == 0 or len(lines[0]) < 15:
     #     content = []
     # else:
@@ -345,6 +352,126 @@ def get_label_annos(label_folder, image_ids=None):
         annos.append(get_label_anno(label_filename))
     return annos
 
+KITTI_COLUMNAR_FIELDS = ['name', 'truncated', 'occluded', 'alpha', 'bbox',
+                         'dimensions', 'location', 'rotation_y', 'score']
+
+
+def _get_label_image_ids(label_folder, image_ids=None):
+    if image_ids is None:
+        filepaths = pathlib.Path(label_folder).glob('*.txt')
+        prog = re.compile(r'^\d{6}.txt$')
+        filepaths = filter(lambda f: prog.match(f.name), filepaths)
+        image_ids = [int(p.stem) for p in filepaths]
+        image_ids = sorted(image_ids)
+    if not isinstance(image_ids, list):
+        image_ids = list(range(image_ids))
+    return image_ids
+
+
+def _read_label_bytes(label_folder, image_ids):
+    label_folder = str(label_folder)
+    list_bytes = []
+    for idx in image_ids:
+        with open(os.path.join(label_folder, get_image_index_str(idx) + '.txt'), 'rb') as f:
+            list_bytes.append(f.read())
+    return list_bytes
+
+
+def _get_columnar_from_bytes(list_bytes, image_ids):
+    list_lines = [[line for line in b.decode().splitlines() if line.strip() != '']
+                  for b in list_bytes]
+    offsets = np.zeros((len(list_lines) + 1, ), dtype=np.int64)
+    offsets[1:] = np.cumsum([len(lines) for lines in list_lines])
+
+    names = []
+    tokens = [] # 15 values per object (score 0 if not exists)
+    for lines in list_lines:
+        for line in lines:
+            x = line.split()
+            if len(x) not in (15, 16):
+                raise ValueError("kitti label line with {} values".format(len(x)))
+            names.append(x[0])
+            tokens.extend(x[1:])
+            if len(x) == 15:
+                tokens.append('0')
+    values = np.array(tokens, dtype=np.float64).reshape(-1, 15)
+
+    columnar = {
+        'offsets': offsets,
+        'image_ids': np.array(image_ids, dtype=np.int64),
+    }
+    columnar['name'] = np.array(names, dtype=str)
+    columnar['truncated'] = values[:, 0]
+    columnar['occluded'] = values[:, 1].astype(np.int64)
+    columnar['alpha'] = values[:, 2]
+    columnar['bbox'] = values[:, 3:7]
+    # dimensions will convert hwl format to standard lhw(camera) format.
+    columnar['dimensions'] = values[:, 7:10][:, [2, 0, 1]]
+    columnar['location'] = values[:, 10:13]
+    columnar['rotation_y'] = values[:, 13]
+    columnar['score'] = values[:, 14]
+    return columnar
+
+
+def get_label_annos_columnar(label_folder, image_ids=None):
+    """parses all label files of a folder in one pass into columns.
+    Returns a dict with the fields of get_label_anno over all frames
+    (concatenated) and 'offsets' (num_frames+1), so that frame i is
+    rows offsets[i]:offsets[i+1]. 'image_ids' keeps the frame order.
+    The numbers of all files are converted with one numpy cast instead of
+    float() per token.
+    """
+    image_ids = _get_label_image_ids(label_folder, image_ids)
+    return _get_columnar_from_bytes(_read_label_bytes(label_folder, image_ids), image_ids)
+
+
+def save_label_annos_columnar(path, columnar):
+    """single binary file (npz without pickle) for repeated evaluations.
+    """
+    path = str(path)
+    path_tmp = path + '.tmp.npz'
+    np.savez(path_tmp, **columnar)
+    os.replace(path_tmp, path)
+
+
+def load_label_annos_columnar(path):
+    with np.load(str(path), allow_pickle=False) as data:
+        return {k: data[k] for k in data.files}
+
+
+def get_annos_from_columnar(columnar):
+    """list of annos (same keys as get_label_anno), fields are views of the columns.
+    """
+    offsets = columnar['offsets']
+    annos = []
+    for i in range(len(offsets) - 1):
+        annos.append({k: columnar[k][offsets[i]:offsets[i + 1]]
+                      for k in KITTI_COLUMNAR_FIELDS})
+    return annos
+
+
+def get_label_annos_cached(label_folder, image_ids=None, path_cache=None):
+    """same returns as get_label_annos. With path_cache, the parsed columns
+    are loaded from the file if it has the same image_ids and the same
+    contents of the label files (crc32 per file, checked at every call),
+    otherwise they are parsed and saved there. Since the check is on the
+    contents, one cache can be shared by folders with the same labels
+    (e.g., gts of each conf_thr).
+    """
+    image_ids = _get_label_image_ids(label_folder, image_ids)
+    list_bytes = _read_label_bytes(label_folder, image_ids)
+    crcs = np.array([zlib.crc32(b) for b in list_bytes], dtype=np.int64)
+    if (path_cache is not None) and os.path.exists(str(path_cache)):
+        columnar = load_label_annos_columnar(path_cache)
+        if np.array_equal(columnar['image_ids'], np.array(image_ids, dtype=np.int64)) and \
+                np.array_equal(columnar.get('crcs'), crcs):
+            return get_annos_from_columnar(columnar)
+    columnar = _get_columnar_from_bytes(list_bytes, image_ids)
+    if path_cache is not None:
+        columnar['crcs'] = crcs
+        save_label_annos_columnar(path_cache, columnar)
+    return get_annos_from_columnar(columnar)
+
 def area(boxes, add1=False):
     """Computes area of boxes.
 
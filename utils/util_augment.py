@@ -0,0 +1,217 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: augmentation of sparse radar points ('sparse_cube') & label boxes per batch (collate_fn_train of the train loader)
+*   torch ops over the whole batch (no loop over points or boxes), torch rng (different per loader worker)
+*   'gt_sampling': objects (points in the box) of the other frames in the batch at their positions
+*   'flip_y': y -> -y, 'rotation': global yaw around the radar, 'scaling': global scale of xyz & box sizes
+*   out: 'sparse_cube' (B, N', C) with 'sparse_cube_mask' (B, N') for the middle encoder
+*       False for padded, removed (in a pasted box), out-of-roi & duplicated (same voxel) points
+'''
+
+import math
+import torch
+
+__all__ = [ 'SparseCubeAugmentor', \
+            'get_points_in_boxes', ]
+
+def get_points_in_boxes(points, boxes):
+    '''
+    * points: (B, N, >=3), boxes: (K, 7) x, y, z, theta, l, w, h
+    * out: (B, K, N) bool, points of every frame in every box
+    '''
+    boxes = boxes.to(points.dtype)[None, :, :, None] # 1, K, 7, 1
+    dx, dy, dz = [points[:, None, :, idx] - boxes[:, :, idx] for idx in range(3)] # B, K, N
+    cos_th, sin_th = torch.cos(boxes[:, :, 3]), torch.sin(boxes[:, :, 3])
+    return (torch.abs(dz) < boxes[:, :, 6]/2.) & \
+        (torch.abs(dx*cos_th + dy*sin_th) < boxes[:, :, 4]/2.) & \
+        (torch.abs(-dx*sin_th + dy*cos_th) < boxes[:, :, 5]/2.)
+
+class SparseCubeAugmentor():
+    def __init__(self, cfg, roi_label, max_azimuth_rad=None):
+        '''
+        * roi_label: [x_min, y_min, z_min, x_max, y_max, z_max] for the boxes after augmentation (as get_tuple_object)
+        * max_azimuth_rad: [min, max] of the bev corners of boxes (None: no check)
+        '''
+        cfg_aug = cfg.DATASET.AUGMENTATION
+        self.list_aug = cfg_aug.LIST_AUG
+        self.flip_y_prob = cfg_aug.get('FLIP_Y_PROB', 0.5)
+        self.rot_range = [v*math.pi/180. for v in cfg_aug.get('ROT_RANGE_DEG', [-5., 5.])]
+        self.scale_range = cfg_aug.get('SCALE_RANGE', [0.95, 1.05])
+        cfg_gt_sampling = cfg_aug.get('GT_SAMPLING', dict())
+        self.gt_sampling_prob = cfg_gt_sampling.get('PROB', 0.5)
+        self.gt_sampling_max_num = cfg_gt_sampling.get('MAX_NUM', 3)
+
+        self.roi_label = roi_label
+        self.max_azimuth_rad = max_azimuth_rad
+
+        ### Voxel grid of the middle encoder (RadarSparseProcessor & BaseBackbone3DSparse) ###
+        roi = cfg.DATASET.RDR_CUBE.RDR_CB_ROI
+        self.grid_size = cfg.DATASET.RDR_CUBE.GRID_SIZE
+        self.roi_min = [roi['x'][0], roi['y'][0], roi['z'][0]]
+        self.grid_shape = [ int(math.ceil((roi['x'][1] - roi['x'][0]) / self.grid_size + 1)), \
+                            int(math.ceil((roi['y'][1] - roi['y'][0]) / self.grid_size)), \
+                            int(math.ceil((roi['z'][1] - roi['z'][0]) / self.grid_size + 1)) ]
+        ### Voxel grid of the middle encoder (RadarSparseProcessor & BaseBackbone3DSparse) ###
+
+    def __call__(self, dict_batch):
+        if not ('sparse_cube' in dict_batch.keys()):
+            return dict_batch
+        points = dict_batch['sparse_cube'].clone()
+        B, N, _ = points.shape
+        is_valid = torch.ones((B, N), dtype=torch.bool)
+
+        list_meta_obj = [] # (cls_name, idx_cls, idx_obj)
+        list_boxes = []
+        list_batch_ids = []
+        for batch_id, list_objects in enumerate(dict_batch['labels']):
+            for cls_name, idx_cls, box, idx_obj in list_objects:
+                list_meta_obj.append((cls_name, idx_cls, idx_obj))
+                list_boxes.append(box)
+                list_batch_ids.append(batch_id)
+        boxes = torch.tensor(list_boxes, dtype=torch.float64).view(-1, 7) # x, y, z, theta, l, w, h (labels as python floats)
+        box_batch_ids = torch.tensor(list_batch_ids, dtype=torch.long)
+        box_meta_ids = torch.arange(len(list_meta_obj))
+
+        for name_aug in self.list_aug:
+            if name_aug == 'gt_sampling':
+                points, is_valid, boxes, box_batch_ids, box_meta_ids = \
+                    self.gt_sampling(points, is_valid, boxes, box_batch_ids, box_meta_ids)
+            elif name_aug == 'flip_y':
+                is_flip = torch.rand(B) < self.flip_y_prob
+                sign = 1. - 2.*is_flip.to(points.dtype)
+                points[:, :, 1] = points[:, :, 1]*sign[:, None]
+                boxes[:, 1] = boxes[:, 1]*sign[box_batch_ids]
+                boxes[:, 3] = boxes[:, 3]*sign[box_batch_ids]
+            elif name_aug == 'rotation':
+                angle = torch.rand(B)*(self.rot_range[1]-self.rot_range[0]) + self.rot_range[0]
+                points[:, :, :2] = self.rotate_xy(points[:, :, :2], angle[:, None])
+                boxes[:, :2] = self.rotate_xy(boxes[:, :2], angle[box_batch_ids])
+                boxes[:, 3] = boxes[:, 3] + angle[box_batch_ids]
+            elif name_aug == 'scaling':
+                scale = torch.rand(B)*(self.scale_range[1]-self.scale_range[0]) + self.scale_range[0]
+                points[:, :, :3] = points[:, :, :3]*scale[:, None, None]
+                boxes[:, [0, 1, 2, 4, 5, 6]] = boxes[:, [0, 1, 2, 4, 5, 6]]*scale[box_batch_ids, None]
+            else:
+                raise AttributeError(f'* check augmentation name: {name_aug}')
+
+        dict_batch['sparse_cube'] = points
+        dict_batch['sparse_cube_mask'] = self.get_valid_voxel_mask(points, is_valid)
+
+        ### Labels (boxes in roi) ###
+        is_in_roi = self.get_boxes_in_roi_mask(boxes)
+        list_labels = [[] for _ in range(B)]
+        for box, batch_id, meta_id in zip(boxes[is_in_roi].tolist(), box_batch_ids[is_in_roi].tolist(), \
+                                          box_meta_ids[is_in_roi].tolist()):
+            cls_name, idx_cls, idx_obj = list_meta_obj[meta_id]
+            list_labels[batch_id].append((cls_name, idx_cls, box, idx_obj))
+        dict_batch['labels'] = list_labels
+        dict_batch['num_objects'] = [len(list_objects) for list_objects in list_labels]
+        for meta, list_objects in zip(dict_batch['meta'], list_labels):
+            meta['label'] = list_objects
+        ### Labels (boxes in roi) ###
+
+        return dict_batch
+
+    def rotate_xy(self, xy, angle):
+        cos_a, sin_a = torch.cos(angle), torch.sin(angle)
+        return torch.stack((xy[..., 0]*cos_a - xy[..., 1]*sin_a, xy[..., 0]*sin_a + xy[..., 1]*cos_a), dim=-1)
+
+    def gt_sampling(self, points, is_valid, boxes, box_batch_ids, box_meta_ids):
+        '''
+        * up to MAX_NUM objects of the other frames (each with PROB) per frame, greedy without bev overlap
+        *   bev overlap: circles of the half diagonals (conservative & without rotated iou)
+        *   points of the target frame in the pasted box are removed
+        '''
+        B, N, C = points.shape
+        K = len(boxes)
+        if K == 0:
+            return points, is_valid, boxes, box_batch_ids, box_meta_ids
+
+        in_boxes = get_points_in_boxes(points, boxes) & is_valid[:, None, :] # B, K, N
+        in_boxes_src = in_boxes[box_batch_ids, torch.arange(K)] # K, N (points of each object in its frame)
+
+        dist = torch.cdist(boxes[:, :2], boxes[:, :2]) # K, K
+        radius = torch.sqrt(boxes[:, 4]**2 + boxes[:, 5]**2)/2.
+        is_overlap = dist < (radius[:, None] + radius[None, :])
+
+        is_occupied = (box_batch_ids[None, :] == torch.arange(B)[:, None]) # B, K (boxes in the frame)
+        is_cand = (~is_occupied) & (torch.rand(B, K) < self.gt_sampling_prob)
+        is_cand = is_cand & (~(is_occupied.float() @ is_overlap.float()).bool())
+        is_cand = is_cand & in_boxes_src.any(dim=1)[None, :] # objects with points
+        is_sel = torch.zeros((B, K), dtype=torch.bool)
+        score = torch.rand(B, K)
+        for _ in range(self.gt_sampling_max_num):
+            score_cand = torch.where(is_cand, score, torch.full_like(score, -1.))
+            val_max, idx_max = torch.max(score_cand, dim=1)
+            is_new = val_max >= 0.
+            is_sel[is_new, idx_max[is_new]] = True
+            is_cand = is_cand & (~is_overlap[idx_max])
+            is_cand[~is_new] = False
+            if not is_new.any():
+                break
+        if not is_sel.any():
+            return points, is_valid, boxes, box_batch_ids, box_meta_ids
+
+        ### Removing points in the pasted boxes ###
+        is_valid = is_valid & (~(is_sel[:, :, None] & in_boxes).any(dim=1))
+
+        ### Pasting points ###
+        is_paste = is_sel[:, :, None] & in_boxes_src[None, :, :] # B, K, N
+        idx_tgt, idx_box, idx_pt = torch.nonzero(is_paste, as_tuple=True) # sorted by the target frame
+        num_paste = torch.bincount(idx_tgt, minlength=B)
+        idx_start = torch.cumsum(num_paste, dim=0) - num_paste
+        idx_rank = torch.arange(len(idx_tgt)) - idx_start[idx_tgt]
+
+        points_paste = points.new_zeros((B, int(num_paste.max()), C))
+        points_paste[idx_tgt, idx_rank] = points[box_batch_ids[idx_box], idx_pt]
+        is_valid_paste = torch.zeros((B, points_paste.shape[1]), dtype=torch.bool)
+        is_valid_paste[idx_tgt, idx_rank] = True
+
+        points = torch.cat((points, points_paste), dim=1)
+        is_valid = torch.cat((is_valid, is_valid_paste), dim=1)
+
+        ### Pasted boxes ###
+        idx_tgt_box, idx_src_box = torch.nonzero(is_sel, as_tuple=True)
+        boxes = torch.cat((boxes, boxes[idx_src_box]), dim=0)
+        box_batch_ids = torch.cat((box_batch_ids, idx_tgt_box), dim=0)
+        box_meta_ids = torch.cat((box_meta_ids, box_meta_ids[idx_src_box]), dim=0)
+
+        return points, is_valid, boxes, box_batch_ids, box_meta_ids
+
+    def get_valid_voxel_mask(self, points, is_valid):
+        '''
+        * points in the voxel grid, the first point for a voxel of several points (unique indices for spconv)
+        '''
+        B, N, _ = points.shape
+        idx_xyz = torch.floor((points[:, :, :3] - points.new_tensor(self.roi_min)) / self.grid_size).long()
+        grid_shape = torch.tensor(self.grid_shape)
+        is_valid = is_valid & ((idx_xyz >= 0) & (idx_xyz < grid_shape)).all(dim=-1)
+
+        idx_flat = ((torch.arange(B)[:, None]*grid_shape[2] + idx_xyz[:, :, 2])*grid_shape[1] + \
+                    idx_xyz[:, :, 1])*grid_shape[0] + idx_xyz[:, :, 0] # B, N
+        idx_valid = torch.nonzero(is_valid.view(-1), as_tuple=True)[0]
+        _, idx_inverse, counts = torch.unique(idx_flat.view(-1)[idx_valid], return_inverse=True, return_counts=True)
+        _, idx_order = torch.sort(idx_inverse, stable=True)
+        idx_first = idx_valid[idx_order[torch.cumsum(counts, dim=0) - counts]]
+
+        is_unique = torch.zeros(B*N, dtype=torch.bool)
+        is_unique[idx_first] = True
+        return is_unique.view(B, N)
+
+    def get_boxes_in_roi_mask(self, boxes):
+        x_min, y_min, z_min, x_max, y_max, z_max = self.roi_label
+        is_in_roi = (boxes[:, 0] > x_min) & (boxes[:, 0] < x_max) & \
+                    (boxes[:, 1] > y_min) & (boxes[:, 1] < y_max) & \
+                    (boxes[:, 2] > z_min) & (boxes[:, 2] < z_max)
+        if self.max_azimuth_rad is not None:
+            cos_th, sin_th = torch.cos(boxes[:, 3:4]), torch.sin(boxes[:, 3:4])
+            dx = boxes[:, 4:5]/2.*boxes.new_tensor([[1., 1., -1., -1.]])
+            dy = boxes[:, 5:6]/2.*boxes.new_tensor([[1., -1., -1., 1.]])
+            x_corners = boxes[:, 0:1] + dx*cos_th - dy*sin_th
+            y_corners = boxes[:, 1:2] + dx*sin_th + dy*cos_th
+            azimuth_corners = torch.atan2(-y_corners, x_corners) # as get_tuple_object
+            is_in_roi = is_in_roi & ((azimuth_corners >= self.max_azimuth_rad[0]) & \
+                                     (azimuth_corners <= self.max_azimuth_rad[1])).all(dim=1)
+        return is_in_roi
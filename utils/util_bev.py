@@ -0,0 +1,162 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: bev rasters from point clouds & radar cubes (scatter with bincount, no loop over points)
+*   raster: (C, num_x, num_y) float32, [idx_x, idx_y] as get_projection_image_from_pointclouds
+*   roi: [min, bin, max] [m] as utils.util_geometry
+*   channels:
+*       'max_height': max z in the cell (nan for empty cells)
+*       'density': # of points in the cell
+*       'intensity': mean of the value (idx_value) in the cell (nan for empty cells)
+*       'power': same as 'intensity', for radar points (mean power, as gen_4_get_bev_img.m)
+'''
+
+import numpy as np
+import cv2
+
+__all__ = [ 'LIST_BEV_CHANNELS', \
+            'get_bev_indices', \
+            'get_bev_from_points', \
+            'get_points_from_cube', \
+            'get_bev_from_cube', \
+            'get_bev_img', ]
+
+LIST_BEV_CHANNELS = ['max_height', 'density', 'intensity', 'power']
+
+def get_bev_indices(arr_x, arr_y, roi_x, roi_y):
+    '''
+    * out: flattened indices (idx_x*num_y+idx_y) of valid points, mask of valid points, (num_x, num_y)
+    '''
+    min_x, bin_x, max_x = roi_x
+    min_y, bin_y, max_y = roi_y
+    num_x = int(np.around((max_x-min_x)/bin_x))
+    num_y = int(np.around((max_y-min_y)/bin_y))
+
+    idx_x = np.floor((arr_x-min_x)/bin_x).astype(np.int64)
+    idx_y = np.floor((arr_y-min_y)/bin_y).astype(np.int64)
+    is_valid = (idx_x >= 0) & (idx_x < num_x) & (idx_y >= 0) & (idx_y < num_y)
+
+    return idx_x[is_valid]*num_y+idx_y[is_valid], is_valid, (num_x, num_y)
+
+def get_bev_from_points(points, roi_x, roi_y, roi_z=None, \
+                        list_channels=['max_height', 'density', 'intensity'], idx_value=3):
+    '''
+    * points: (N, >=3) x, y, z, (value)
+    * roi_z: [min, max] [m] (None: without z filtering)
+    * out: (C, num_x, num_y) float32
+    '''
+    if roi_z is not None:
+        points = points[(points[:,2] >= roi_z[0]) & (points[:,2] <= roi_z[1])]
+
+    idx_flat, is_valid, (num_x, num_y) = get_bev_indices(points[:,0], points[:,1], roi_x, roi_y)
+    num_cells = num_x*num_y
+    points = points[is_valid]
+
+    arr_count = np.bincount(idx_flat, minlength=num_cells).astype(np.float64)
+    is_empty = arr_count == 0
+
+    list_bev = []
+    for name_ch in list_channels:
+        if name_ch == 'max_height':
+            arr_bev = np.full(num_cells, -np.inf)
+            np.maximum.at(arr_bev, idx_flat, points[:,2])
+            arr_bev[is_empty] = np.nan
+        elif name_ch == 'density':
+            arr_bev = arr_count
+        elif name_ch in ['intensity', 'power']:
+            arr_sum = np.bincount(idx_flat, weights=points[:,idx_value], minlength=num_cells)
+            arr_bev = np.full(num_cells, np.nan)
+            arr_bev[~is_empty] = arr_sum[~is_empty]/arr_count[~is_empty]
+        else:
+            raise AttributeError(f'* check channel name: {name_ch} (in {LIST_BEV_CHANNELS})')
+        list_bev.append(arr_bev.reshape(num_x, num_y))
+
+    return np.stack(list_bev, axis=0).astype(np.float32)
+
+def get_points_from_cube(arr_cube, arr_z, arr_y, arr_x):
+    '''
+    * arr_cube: (Z, Y, X), negative (e.g., -1) for invalid cells
+    * out: (N, 4) x, y, z, power of valid cells
+    '''
+    idx_z, idx_y, idx_x = np.where(arr_cube >= 0.)
+    return np.stack([arr_x[idx_x], arr_y[idx_y], arr_z[idx_z], arr_cube[idx_z, idx_y, idx_x]], axis=1)
+
+def get_bev_from_cube(arr_cube, arr_z, arr_y, arr_x, roi_x, roi_y, roi_z=None, is_in_log=True):
+    '''
+    * mean power of valid cells along z (gen_4_get_bev_img.m) in any resolution
+    *   coarser than the cube: mean of valid cells in each pixel (scatter)
+    *   finer than the cube: cube cell nearest to the pixel center (gather, no holes)
+    * out: (num_x, num_y) float32 [dB if is_in_log] (nan for pixels without valid power)
+    '''
+    if roi_z is not None:
+        is_z = (arr_z >= roi_z[0]) & (arr_z <= roi_z[1])
+        arr_cube = arr_cube[is_z]
+    is_valid = arr_cube >= 0.
+    arr_sum = np.sum(np.where(is_valid, arr_cube, 0.), axis=0) # (Y, X)
+    arr_cnt = np.count_nonzero(is_valid, axis=0).astype(np.float64)
+
+    min_x, bin_x, max_x = roi_x
+    min_y, bin_y, max_y = roi_y
+    bin_x_cube = arr_x[1]-arr_x[0]
+    bin_y_cube = arr_y[1]-arr_y[0]
+
+    if (bin_x >= bin_x_cube) and (bin_y >= bin_y_cube):
+        grid_y, grid_x = np.meshgrid(arr_y, arr_x, indexing='ij')
+        idx_flat, is_in, (num_x, num_y) = get_bev_indices(grid_x.reshape(-1), grid_y.reshape(-1), roi_x, roi_y)
+        arr_sum = np.bincount(idx_flat, weights=arr_sum.reshape(-1)[is_in], minlength=num_x*num_y).reshape(num_x, num_y)
+        arr_cnt = np.bincount(idx_flat, weights=arr_cnt.reshape(-1)[is_in], minlength=num_x*num_y).reshape(num_x, num_y)
+    else:
+        num_x = int(np.around((max_x-min_x)/bin_x))
+        num_y = int(np.around((max_y-min_y)/bin_y))
+        idx_x = np.around((min_x+(np.arange(num_x)+0.5)*bin_x-arr_x[0])/bin_x_cube).astype(np.int64)
+        idx_y = np.around((min_y+(np.arange(num_y)+0.5)*bin_y-arr_y[0])/bin_y_cube).astype(np.int64)
+        is_in_x = (idx_x >= 0) & (idx_x < len(arr_x))
+        is_in_y = (idx_y >= 0) & (idx_y < len(arr_y))
+        arr_sum = arr_sum[np.clip(idx_y, 0, len(arr_y)-1)][:,np.clip(idx_x, 0, len(arr_x)-1)].T
+        arr_cnt = arr_cnt[np.clip(idx_y, 0, len(arr_y)-1)][:,np.clip(idx_x, 0, len(arr_x)-1)].T
+        arr_cnt[~is_in_x,:] = 0.
+        arr_cnt[:,~is_in_y] = 0.
+
+    arr_bev = np.full((num_x, num_y), np.nan)
+    is_filled = arr_cnt > 0
+    arr_bev[is_filled] = arr_sum[is_filled]/arr_cnt[is_filled]
+    if is_in_log:
+        with np.errstate(divide='ignore'):
+            arr_bev = 10*np.log10(arr_bev)
+        arr_bev[~np.isfinite(arr_bev)] = np.nan
+    return arr_bev.astype(np.float32)
+
+def get_bev_img(arr_bev, list_range, colormap=None, is_forward_up=True):
+    '''
+    * arr_bev: (num_x, num_y) or (C, num_x, num_y), nan for empty cells
+    * list_range: [v_min, v_max] or a list of them for channels
+    * colormap: e.g., cv2.COLORMAP_JET (only for a single channel)
+    * out: uint8 (num_x, num_y, 3) image (forward up & left is +y as lidar_bev_image if is_forward_up)
+    '''
+    if arr_bev.ndim == 2:
+        arr_bev = arr_bev[np.newaxis,:,:]
+        list_range = [list_range]
+
+    list_img = []
+    for arr_ch, (v_min, v_max) in zip(arr_bev, list_range):
+        is_empty = np.isnan(arr_ch)
+        arr_ch = (np.clip(np.nan_to_num(arr_ch, nan=v_min), v_min, v_max)-v_min)/(v_max-v_min)
+        arr_ch = (arr_ch*255.).astype(np.uint8)
+        if colormap is not None:
+            arr_ch = cv2.applyColorMap(arr_ch, colormap)
+        arr_ch[is_empty] = 0
+        list_img.append(arr_ch)
+
+    if colormap is not None:
+        img = list_img[0]
+    elif len(list_img) == 1:
+        img = np.repeat(list_img[0][:,:,np.newaxis], 3, axis=2)
+    else:
+        list_img = list_img[:3] + [np.zeros_like(list_img[0])]*(3-len(list_img))
+        img = np.stack(list_img[::-1], axis=2) # channels in rgb order -> bgr (cv2)
+
+    if is_forward_up:
+        img = np.flip(img, axis=(0,1))
+
+    return np.ascontiguousarray(img)
@@ -0,0 +1,110 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: cell averaging cfar with summed-area tables (integral volume)
+*   for any dimension (1D range, 2D RA, 3D ZYX, 4D DREA tensors)
+'''
+
+import numpy as np
+
+__all__ = [ 'get_box_sum', \
+            'get_train_sum', \
+            'get_symmetric_offsets', \
+            'get_ca_cfar_alpha', \
+            'get_ca_cfar_threshold', \
+            'get_ca_cfar_mask', \
+            ]
+
+def get_box_sum(x, offsets, mode='constant', dtype=np.float32, len_chunk=None):
+    '''
+    * out[i] = sum of x over the box [i+lo, i+hi] (inclusive, per axis) for every cell i
+    * offsets: [(lo, hi), ...] per axis, (0, 0) for the axes not summed
+    * mode: values outside x, 'constant' (zeros) or 'mirror' (d c b | a b c d | c b a, as ndimage)
+    * a summed-area table is built along each axis in turn (separable),
+    *   so the cost per cell does not depend on the box size
+    * sums are accumulated in float64 and returned in dtype
+    * len_chunk: # of cells along axis 0 processed at once (None: all), to bound the memory
+    '''
+    x = np.asarray(x)
+    assert len(offsets) == x.ndim, '* offsets for every axis'
+    offsets = [(int(lo), int(hi)) for lo, hi in offsets]
+    for lo, hi in offsets:
+        assert lo <= hi, '* lo <= hi'
+
+    pad_width = [(max(0, -lo), max(0, hi)) for lo, hi in offsets]
+    if mode == 'constant':
+        x_pad = np.pad(x, pad_width, mode='constant')
+    elif mode == 'mirror':
+        x_pad = np.pad(x, pad_width, mode='reflect')
+    else:
+        raise ValueError(f'* mode {mode} is not supported')
+
+    n_0 = x.shape[0]
+    len_chunk = n_0 if len_chunk is None else len_chunk
+    (lo_0, hi_0), (pad_lo_0, _) = offsets[0], pad_width[0]
+    out = np.empty(x.shape, dtype=dtype)
+    for idx_start in range(0, n_0, len_chunk):
+        idx_end = min(idx_start+len_chunk, n_0)
+        # the chunk (with halo) starts at the box start of idx_start
+        chunk = x_pad[idx_start+pad_lo_0+lo_0:idx_end+pad_lo_0+hi_0]
+
+        for axis, ((lo, hi), (pad_lo, _)) in enumerate(zip(offsets, pad_width)):
+            n_out = (idx_end-idx_start) if axis == 0 else x.shape[axis]
+            if (lo == 0) and (hi == 0) and (chunk.shape[axis] == n_out):
+                continue
+            base = 0 if axis == 0 else pad_lo+lo
+
+            shape_zero = list(chunk.shape)
+            shape_zero[axis] = 1
+            table = np.concatenate([np.zeros(shape_zero, dtype=np.float64), \
+                np.cumsum(chunk, axis=axis, dtype=np.float64)], axis=axis)
+
+            sl_hi = [slice(None)]*chunk.ndim
+            sl_lo = [slice(None)]*chunk.ndim
+            sl_hi[axis] = slice(base+hi-lo+1, base+hi-lo+1+n_out)
+            sl_lo[axis] = slice(base, base+n_out)
+            chunk = table[tuple(sl_hi)] - table[tuple(sl_lo)]
+
+        out[idx_start:idx_end] = chunk
+
+    return out
+
+def get_train_sum(x, offsets_outer, offsets_guard=None, mode='constant', dtype=np.float32, len_chunk=None):
+    '''
+    * sum of the training cells = sum of the outer box - sum of the guard box
+    '''
+    train_sum = get_box_sum(x, offsets_outer, mode, dtype, len_chunk)
+    if offsets_guard is not None:
+        train_sum -= get_box_sum(x, offsets_guard, mode, dtype, len_chunk)
+    return train_sum
+
+def get_symmetric_offsets(n_half_guard, n_half_train):
+    '''
+    * n_half_guard, n_half_train: per axis (0 for the axes not used)
+    * returns offsets_outer, offsets_guard, # of training cells
+    '''
+    offsets_outer = [(-(nh_g+nh_t), nh_g+nh_t) for nh_g, nh_t in zip(n_half_guard, n_half_train)]
+    offsets_guard = [(-nh_g, nh_g) for nh_g in n_half_guard]
+    num_train_cells = int(np.prod([2*(nh_g+nh_t)+1 for nh_g, nh_t in zip(n_half_guard, n_half_train)]) \
+                        - np.prod([2*nh_g+1 for nh_g in n_half_guard]))
+    return offsets_outer, offsets_guard, num_train_cells
+
+def get_ca_cfar_alpha(num_train_cells, rate_fa):
+    return num_train_cells * (rate_fa**(-1/num_train_cells)-1)
+
+def get_ca_cfar_threshold(x, n_half_guard, n_half_train, rate_fa, mode='constant', dtype=np.float32, len_chunk=None):
+    '''
+    * threshold of every cell = alpha * (mean of the training cells), with a guard box around the cell under test
+    * n_half_guard, n_half_train: per axis of x
+    '''
+    offsets_outer, offsets_guard, num_train_cells = get_symmetric_offsets(n_half_guard, n_half_train)
+    train_sum = get_train_sum(x, offsets_outer, offsets_guard, mode, dtype, len_chunk)
+    alpha = get_ca_cfar_alpha(num_train_cells, rate_fa)
+    return (alpha/num_train_cells)*train_sum
+
+def get_ca_cfar_mask(x, n_half_guard, n_half_train, rate_fa, mode='constant', dtype=np.float32, len_chunk=None):
+    '''
+    * x > get_ca_cfar_threshold
+    '''
+    return x > get_ca_cfar_threshold(x, n_half_guard, n_half_train, rate_fa, mode, dtype, len_chunk)
@@ -0,0 +1,165 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: checkpoints written from a background thread (training continues after the cpu snapshot)
+*   <path_log>/models/model_<epoch>.pt: state dict of the network
+*   <path_log>/utils/util_<epoch>.pt: optimizer, scheduler, ... & 'path_dict_model' (weights are not duplicated)
+*   <path_log>/checkpoints.json: sha256 & score of each file (checked in resume), written after every file
+*   atomic writes (.tmp -> os.replace), retention of the last n & top k (lowest score) models and the last n utils
+'''
+
+import os
+import os.path as osp
+import json
+import hashlib
+import threading
+import queue
+import torch
+
+__all__ = [ 'CheckpointManager', \
+            'get_cpu_copy', \
+            'get_file_sha256', \
+            'load_checkpoint_manifest', \
+            'check_checkpoint_sha256', ]
+
+NAME_MANIFEST = 'checkpoints.json'
+
+def get_cpu_copy(obj):
+    '''
+    * tensors in (nested) dicts, lists & tuples -> cpu copies (not shared with the training)
+    '''
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    elif isinstance(obj, dict):
+        return type(obj)((k, get_cpu_copy(v)) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        return type(obj)(get_cpu_copy(v) for v in obj)
+    return obj
+
+def get_file_sha256(path_file, size_chunk=1<<24):
+    sha256 = hashlib.sha256()
+    with open(path_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(size_chunk), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def load_checkpoint_manifest(path_log):
+    '''
+    * None for the logs without the manifest (before the checkpoint manager)
+    '''
+    path_manifest = osp.join(path_log, NAME_MANIFEST)
+    if not osp.exists(path_manifest):
+        return None
+    with open(path_manifest, 'r') as f:
+        return json.load(f)
+
+def check_checkpoint_sha256(path_log, path_file, dict_manifest=None):
+    '''
+    * raise if the file is different from the manifest (e.g., a partial copy), pass without the manifest
+    '''
+    dict_manifest = load_checkpoint_manifest(path_log) if dict_manifest is None else dict_manifest
+    if dict_manifest is None:
+        return
+    name_file = osp.relpath(path_file, path_log)
+    if not (name_file in dict_manifest['files'].keys()):
+        raise AttributeError(f'* {name_file} is not in {NAME_MANIFEST}')
+    if get_file_sha256(path_file) != dict_manifest['files'][name_file]['sha256']:
+        raise AttributeError(f'* sha256 of {name_file} is different from {NAME_MANIFEST}')
+
+class CheckpointManager():
+    '''
+    * save(): cpu snapshot on the calling thread, torch.save in the writer thread
+    *   one snapshot waits in the queue at most (save blocks while the writer is behind)
+    *   errors of the writer are raised at the next save() or close()
+    * num_keep_last_model, num_keep_top_model, num_keep_util: None to keep all
+    *   models of kept utils are always kept (for resume)
+    '''
+    def __init__(self, path_log, num_keep_last_model=None, num_keep_top_model=0, num_keep_util=None):
+        self.path_log = path_log
+        self.num_keep_last_model = num_keep_last_model
+        self.num_keep_top_model = num_keep_top_model
+        self.num_keep_util = num_keep_util
+        os.makedirs(osp.join(path_log, 'models'), exist_ok=True)
+        os.makedirs(osp.join(path_log, 'utils'), exist_ok=True)
+
+        self.dict_manifest = load_checkpoint_manifest(path_log)
+        if self.dict_manifest is None:
+            self.dict_manifest = {'files': dict()}
+
+        self.queue = queue.Queue(maxsize=1)
+        self.error = None
+        self.thread = threading.Thread(target=self.run_writer, daemon=True)
+        self.thread.start()
+
+    def save(self, epoch, state_dict_model, dict_util=None, score=None):
+        '''
+        * dict_util: optimizer, scheduler, ... state dicts (None: only the model)
+        * score: for top k (lower is better, e.g., average loss of the epoch)
+        '''
+        self.raise_if_error()
+        name_model = osp.join('models', f'model_{epoch}.pt')
+        list_items = [(name_model, get_cpu_copy(state_dict_model), epoch, score)]
+        if dict_util is not None:
+            dict_util = get_cpu_copy(dict_util)
+            dict_util.update({'epoch': epoch, 'path_dict_model': name_model})
+            list_items.append((osp.join('utils', f'util_{epoch}.pt'), dict_util, epoch, None))
+        self.queue.put(list_items)
+
+    def close(self):
+        '''
+        * wait for the writer (end of training)
+        '''
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.raise_if_error()
+
+    def raise_if_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError(f'* checkpoint writer failed: {error}')
+
+    def run_writer(self):
+        while True:
+            list_items = self.queue.get()
+            if list_items is None:
+                return
+            try:
+                for name_file, obj, epoch, score in list_items:
+                    path_file = osp.join(self.path_log, name_file)
+                    torch.save(obj, path_file + '.tmp')
+                    os.replace(path_file + '.tmp', path_file)
+                    self.dict_manifest['files'][name_file] = \
+                        {'epoch': epoch, 'score': score, 'sha256': get_file_sha256(path_file)}
+                self.apply_retention()
+                self.write_manifest()
+            except Exception as e:
+                self.error = e
+
+    def write_manifest(self):
+        path_manifest = osp.join(self.path_log, NAME_MANIFEST)
+        with open(path_manifest + '.tmp', 'w') as f:
+            json.dump(self.dict_manifest, f, indent=2)
+        os.replace(path_manifest + '.tmp', path_manifest)
+
+    def apply_retention(self):
+        dict_files = self.dict_manifest['files']
+        list_models = sorted([k for k in dict_files.keys() if k.startswith('models')], key=lambda k: dict_files[k]['epoch'])
+        list_utils = sorted([k for k in dict_files.keys() if k.startswith('utils')], key=lambda k: dict_files[k]['epoch'])
+
+        set_utils = set(list_utils if self.num_keep_util is None else list_utils[len(list_utils)-self.num_keep_util:])
+        if self.num_keep_last_model is None:
+            set_models = set(list_models)
+        else:
+            set_models = set(list_models[len(list_models)-self.num_keep_last_model:])
+            list_scored = [k for k in list_models if dict_files[k]['score'] is not None]
+            set_models.update(sorted(list_scored, key=lambda k: dict_files[k]['score'])[:self.num_keep_top_model])
+            set_models.update([osp.join('models', f'model_{dict_files[k]["epoch"]}.pt') for k in set_utils])
+
+        for name_file in list_models + list_utils:
+            if not ((name_file in set_models) or (name_file in set_utils)):
+                path_file = osp.join(self.path_log, name_file)
+                if osp.exists(path_file):
+                    os.remove(path_file)
+                del dict_files[name_file]
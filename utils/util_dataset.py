@@ -12,7 +12,6 @@ import numpy as np
 import cv2
 import matplotlib.pyplot as plt
 import os.path as osp
-import open3d as o3d
 import pickle
 import os
 
@@ -26,6 +25,8 @@ __all__ = [ 'func_show_radar_tensor_bev', \
             'func_show_gaussian_confidence_polar', \
             'func_show_heatmap_polar_with_bbox', \
             'func_generate_gaussian_conf_labels', \
+            'save_conf_label', \
+            'load_conf_label', \
             'func_show_radar_cube_bev', \
             'func_show_sliced_radar_cube', \
             'func_show_rdr_pc_cube', 
@@ -91,6 +92,7 @@ def func_show_radar_tensor_bev(p_pline, dict_item, bboxes=None, \
 
 def func_show_lidar_point_cloud(p_pline, dict_item, bboxes=None, \
         roi_x=[0, 100], roi_y=[-50, 50], roi_z=[-10, 10]):
+    import open3d as o3d
     pc_lidar = dict_item['ldr_pc_64']
     # ROI filtering
     pc_lidar = pc_lidar[
@@ -286,6 +288,28 @@ def func_generate_gaussian_conf_labels(p_pline, dir_gen, gen_type='polar', \
             else:
                 raise AttributeError('polar or cart')
 
+def save_conf_label(path_gen, arr_conf, roi_x=None, roi_y=None, dtype=np.float16):
+    '''
+    * compressed npz ('conf') of a confidence label, float16 in [0, 1] is enough for labels
+    * written to path_gen.tmp and renamed (no broken file when interrupted)
+    '''
+    dict_save = {'conf': arr_conf.astype(dtype)}
+    if roi_x is not None:
+        dict_save['roi_x'] = np.array(roi_x, dtype=np.float64)
+    if roi_y is not None:
+        dict_save['roi_y'] = np.array(roi_y, dtype=np.float64)
+    with open(path_gen + '.tmp', 'wb') as f:
+        np.savez_compressed(f, **dict_save)
+    os.replace(path_gen + '.tmp', path_gen)
+
+def load_conf_label(path_gen, dtype=np.float32):
+    '''
+    * nan to 0 (as the pickled .bin labels)
+    '''
+    with np.load(path_gen, allow_pickle=False) as store:
+        arr_conf = store['conf'].astype(dtype)
+    return np.nan_to_num(arr_conf, nan=0.0)
+
 def func_show_radar_cube_bev(p_pline, dict_item, bboxes=None, magnifying=4, is_with_doppler = False, is_with_log = False):
     rdr_cube, rdr_cube_mask, rdr_cube_cnt = p_pline.get_cube(dict_item['meta']['path_rdr_cube'], mode=0)
     if is_with_doppler:
@@ -529,6 +553,7 @@ def func_show_sliced_radar_cube(p_pline, dict_item, bboxes=None, magnifying=4, i
     plt.show()
 
 def func_show_rdr_pc_cube(p_pline, dict_item, bboxes=None, cfar_params = [25, 8, 0.01], axis='x', is_with_lidar=True):
+    import open3d as o3d
     rdr_cube, _, _ = p_pline.get_cube(dict_item['meta']['path_rdr_cube'], mode=0)
     rdr_pc = get_rdr_pc_from_cube(p_pline, rdr_cube, cfar_params[0], cfar_params[1], cfar_params[2], axis)        
     rdr_pcd = o3d.geometry.PointCloud()
@@ -569,6 +594,7 @@ def func_show_rdr_pc_cube(p_pline, dict_item, bboxes=None, cfar_params = [25, 8,
 
 def func_show_rdr_pc_tesseract(p_pline, dict_item, bboxes=None, cfar_params = [25, 8, 0.01], \
                                 roi_x=[0, 100], roi_y=[-50, 50], roi_z=[-10, 10], is_with_lidar=True):
+    import open3d as o3d
     num_train, num_guard, rate_fa = cfar_params
     pc_radar = get_rdr_pc_from_tesseract(p_pline, dict_item['rdr_tesseract'], num_train, num_guard, rate_fa)
     pc_radar = pc_radar[
@@ -0,0 +1,139 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: distributed data parallel (torchrun env, 'nccl' or 'gloo') without SharedArray (utils.common_utils)
+*   e.g., torchrun --nproc_per_node 2 main_train_dist.py
+*   SequenceDistributedSampler: frames of a sequence go to the same rank (equal # of samples per rank)
+*   gather_objects: picklable objects (e.g., kitti lines of validation) to rank 0 in memory (no tmpdir)
+'''
+
+import os
+import math
+import torch
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+__all__ = [ 'init_dist', \
+            'is_dist', \
+            'get_rank', \
+            'get_world_size', \
+            'barrier', \
+            'gather_objects', \
+            'get_all_finite_flag', \
+            'set_grad_sync', \
+            'SequenceDistributedSampler', ]
+
+def init_dist(backend=None):
+    '''
+    * backend: None ('nccl' with cuda, else 'gloo'), single process without torchrun (WORLD_SIZE <= 1)
+    * out: rank, world_size, local_rank
+    '''
+    world_size = int(os.environ.get('WORLD_SIZE', 1))
+    if world_size <= 1:
+        return 0, 1, 0
+    local_rank = int(os.environ.get('LOCAL_RANK', 0))
+    if backend is None:
+        backend = 'nccl' if torch.cuda.is_available() else 'gloo'
+    if torch.cuda.is_available():
+        torch.cuda.set_device(local_rank % torch.cuda.device_count())
+    if not dist.is_initialized():
+        dist.init_process_group(backend=backend)
+    return dist.get_rank(), dist.get_world_size(), local_rank
+
+def is_dist():
+    return dist.is_available() and dist.is_initialized() and (dist.get_world_size() > 1)
+
+def get_rank():
+    return dist.get_rank() if is_dist() else 0
+
+def get_world_size():
+    return dist.get_world_size() if is_dist() else 1
+
+def barrier():
+    if is_dist():
+        dist.barrier()
+
+def gather_objects(obj, dst=0):
+    '''
+    * out: list of obj (rank order) on dst, None on the others ([obj] without ddp)
+    '''
+    if not is_dist():
+        return [obj]
+    list_objs = [None]*dist.get_world_size() if (dist.get_rank() == dst) else None
+    dist.gather_object(obj, list_objs, dst=dst)
+    return list_objs
+
+def get_all_finite_flag(is_finite):
+    '''
+    * True if the flags of all ranks are True (same decision to apply a step on every rank)
+    '''
+    if not is_dist():
+        return is_finite
+    if torch.is_tensor(is_finite):
+        flag = is_finite.detach().to(torch.int32).reshape(1)
+    else:
+        device = torch.device('cuda', torch.cuda.current_device()) if dist.get_backend() == 'nccl' else torch.device('cpu')
+        flag = torch.tensor([int(bool(is_finite))], dtype=torch.int32, device=device)
+    dist.all_reduce(flag, op=dist.ReduceOp.MIN)
+    return flag[0] > 0
+
+def set_grad_sync(network, is_sync):
+    '''
+    * DistributedDataParallel: False for the iterations without the optimizer step (as no_sync()), pass otherwise
+    '''
+    if isinstance(network, torch.nn.parallel.DistributedDataParallel):
+        network.require_backward_grad_sync = is_sync
+
+class SequenceDistributedSampler(Sampler):
+    '''
+    * list_seq_ids: sequence of each index (e.g., label_paths -> '<seq>' of '<dir>/<seq>/info_label/<name>.txt')
+    * sequences are assigned to ranks (largest first to the rank with the least frames, shuffled ties per epoch)
+    *   the same assignment on every rank (seed + epoch), shorter ranks are padded with their own frames
+    * set_epoch(epoch) before each epoch for a new order
+    '''
+    def __init__(self, list_seq_ids, num_replicas=None, rank=None, shuffle=True, seed=0):
+        self.list_seq_ids = list(list_seq_ids)
+        self.num_replicas = get_world_size() if num_replicas is None else num_replicas
+        self.rank = get_rank() if rank is None else rank
+        self.shuffle = shuffle
+        self.seed = seed
+
+        self.dict_seq_indices = dict()
+        for idx, seq_id in enumerate(self.list_seq_ids):
+            self.dict_seq_indices.setdefault(seq_id, []).append(idx)
+        self.list_seqs = sorted(self.dict_seq_indices.keys())
+        self.set_epoch(0)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+        self.list_rank_indices = self.get_rank_indices(epoch)
+
+    def get_rank_indices(self, epoch):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + epoch)
+        list_seqs = self.list_seqs
+        if self.shuffle:
+            list_seqs = [list_seqs[i] for i in torch.randperm(len(list_seqs), generator=generator).tolist()]
+        list_seqs = sorted(list_seqs, key=lambda x: -len(self.dict_seq_indices[x])) # stable: shuffled ties
+
+        list_rank_indices = [[] for _ in range(self.num_replicas)]
+        for seq_id in list_seqs:
+            idx_rank = min(range(self.num_replicas), key=lambda x: len(list_rank_indices[x]))
+            list_rank_indices[idx_rank].extend(self.dict_seq_indices[seq_id])
+        return list_rank_indices
+
+    def __iter__(self):
+        num_samples = len(self)
+        indices = self.list_rank_indices[self.rank]
+        if self.shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + self.epoch + 1000*(self.rank + 1))
+            indices = [indices[i] for i in torch.randperm(len(indices), generator=generator).tolist()]
+        if len(indices) > 0:
+            indices = (indices*int(math.ceil(num_samples/len(indices))))[:num_samples]
+        return iter(indices)
+
+    def __len__(self):
+        # the same on every rank, can differ per epoch (assignment of sequences)
+        return max([len(v) for v in self.list_rank_indices])
@@ -0,0 +1,176 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: logging without serialization on the training thread
+*   AsyncScalarWriter: add_scalar, add_scalars & add_text of SummaryWriter (calls are queued with the wall time)
+*   a background thread writes the queue every flush_secs (or at flush() & close(), close() at exit)
+*   backends: 'tensorboard' (SummaryWriter), 'csv' (scalars.csv & texts.csv for headless runs), 'memory'
+'''
+
+import os
+import os.path as osp
+import csv
+import time
+import queue
+import atexit
+import threading
+
+__all__ = [ 'AsyncScalarWriter', \
+            'TensorBoardBackend', \
+            'CsvBackend', \
+            'MemoryBackend', \
+            'build_log_backend', ]
+
+class TensorBoardBackend():
+    def __init__(self, log_dir, **kwargs):
+        from torch.utils.tensorboard import SummaryWriter
+        self.writer = SummaryWriter(log_dir, **kwargs)
+
+    def write(self, name_func, args):
+        getattr(self.writer, name_func)(*args)
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+class CsvBackend():
+    '''
+    * scalars.csv: tag, step, value, wall_time (add_scalars: tag = main_tag/key)
+    * texts.csv: tag, step, text, wall_time
+    '''
+    def __init__(self, log_dir, **kwargs):
+        os.makedirs(log_dir, exist_ok=True)
+        self.dict_files = dict()
+        self.dict_writers = dict()
+        for name_csv in ['scalars', 'texts']:
+            path_csv = osp.join(log_dir, f'{name_csv}.csv')
+            is_new = not osp.exists(path_csv)
+            self.dict_files[name_csv] = open(path_csv, 'a', newline='')
+            self.dict_writers[name_csv] = csv.writer(self.dict_files[name_csv])
+            if is_new:
+                self.dict_writers[name_csv].writerow(['tag', 'step', 'value' if name_csv == 'scalars' else 'text', 'wall_time'])
+
+    def write(self, name_func, args):
+        if name_func == 'add_scalar':
+            tag, value, step, wall_time = args
+            self.dict_writers['scalars'].writerow([tag, step, float(value), wall_time])
+        elif name_func == 'add_scalars':
+            main_tag, dict_values, step, wall_time = args
+            for k, v in dict_values.items():
+                self.dict_writers['scalars'].writerow([f'{main_tag}/{k}', step, float(v), wall_time])
+        elif name_func == 'add_text':
+            tag, text, step, wall_time = args
+            self.dict_writers['texts'].writerow([tag, step, text, wall_time])
+        else:
+            raise AttributeError(f'* check log function: {name_func}')
+
+    def flush(self):
+        for f in self.dict_files.values():
+            f.flush()
+
+    def close(self):
+        for f in self.dict_files.values():
+            f.close()
+
+class MemoryBackend():
+    '''
+    * list_records: (name_func, args) e.g., for tests
+    '''
+    def __init__(self, log_dir=None, **kwargs):
+        self.list_records = []
+
+    def write(self, name_func, args):
+        self.list_records.append((name_func, args))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+def build_log_backend(log_dir, backend='tensorboard', **kwargs):
+    dict_backend = {'tensorboard': TensorBoardBackend, 'csv': CsvBackend, 'memory': MemoryBackend}
+    if not (backend in dict_backend.keys()):
+        raise AttributeError(f'* check log backend: {backend} (in {list(dict_backend.keys())})')
+    return dict_backend[backend](log_dir, **kwargs)
+
+class AsyncScalarWriter():
+    '''
+    * put blocks when max_queue calls are pending (the writer is behind)
+    * errors of the backend are printed (logging does not stop the training)
+    '''
+    def __init__(self, log_dir, backend='tensorboard', flush_secs=10., max_queue=100000, **kwargs):
+        self.backend = build_log_backend(log_dir, backend, **kwargs)
+        self.flush_secs = flush_secs
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.event_wake = threading.Event()
+        self.is_closed = False
+        self.thread = threading.Thread(target=self.run_writer, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def add_scalar(self, tag, scalar_value, global_step=None, walltime=None):
+        self.put('add_scalar', (tag, scalar_value, global_step, time.time() if walltime is None else walltime))
+
+    def add_scalars(self, main_tag, tag_scalar_dict, global_step=None, walltime=None):
+        self.put('add_scalars', (main_tag, dict(tag_scalar_dict), global_step, time.time() if walltime is None else walltime))
+
+    def add_text(self, tag, text_string, global_step=None, walltime=None):
+        self.put('add_text', (tag, text_string, global_step, time.time() if walltime is None else walltime))
+
+    def put(self, name_func, args):
+        if self.is_closed:
+            raise RuntimeError('* logging after close')
+        self.queue.put((name_func, args))
+
+    def flush(self):
+        '''
+        * blocks until the calls so far are written
+        '''
+        if self.is_closed:
+            return
+        event_done = threading.Event()
+        self.queue.put(('flush', event_done))
+        self.event_wake.set()
+        event_done.wait()
+
+    def close(self):
+        if self.is_closed:
+            return
+        self.is_closed = True
+        self.event_wake.set()
+        self.thread.join()
+
+    def run_writer(self):
+        while True:
+            self.event_wake.wait(self.flush_secs)
+            self.event_wake.clear()
+            is_closing = self.is_closed
+            self.write_pending()
+            if is_closing:
+                self.backend.close()
+                return
+
+    def write_pending(self):
+        list_events = []
+        while True:
+            try:
+                name_func, args = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if name_func == 'flush':
+                list_events.append(args)
+                continue
+            try:
+                self.backend.write(name_func, args)
+            except Exception as e:
+                print(f'* logging error ({name_func}, {args[0]}): {e}')
+        try:
+            self.backend.flush()
+        except Exception as e:
+            print(f'* logging error (flush): {e}')
+        for event_done in list_events:
+            event_done.set()
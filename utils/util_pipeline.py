@@ -15,11 +15,11 @@ import matplotlib.pyplot as plt
 import cv2
 import time
 
-from models.skeletons import build_skeleton
 import datasets
 from configs.config_general import IS_UBUNTU
 import configs.config_general as cnf
 from utils.util_geometry import *
+from utils.util_train import get_num_optimizer_steps
 
 __all__ = [ 'build_network', \
             'build_optimizer', \
@@ -34,6 +34,7 @@ __all__ = [ 'build_network', \
             ]
 
 def build_network(p_pline):
+    from models.skeletons import build_skeleton # spconv
     return build_skeleton(p_pline.cfg)
 
 def build_optimizer(p_pline, model):
@@ -65,10 +66,12 @@ def build_scheduler(p_pline, optimizer):
         print('No Min LR in Config')
         min_lr = 0
     # print(p_pline.cfg.DATASET.NUM)
+    # scheduler steps with the optimizer (once per GRAD_ACCUMULATIONS iterations)
+    num_grad_acc = p_pline.cfg.OPTIMIZER.get('GRAD_ACCUMULATIONS', 1)
     if type_total_iter == 'every':
-        total_iter = p_pline.cfg.DATASET.NUM // batch_size
+        total_iter = get_num_optimizer_steps(p_pline.cfg.DATASET.NUM // batch_size, num_grad_acc)
     else:
-        total_iter = (p_pline.cfg.DATASET.NUM // batch_size) * max_epoch
+        total_iter = get_num_optimizer_steps(p_pline.cfg.DATASET.NUM // batch_size, num_grad_acc) * max_epoch
     if p_pline.cfg.OPTIMIZER.SCHEDULER is None:
         return None
     elif p_pline.cfg.OPTIMIZER.SCHEDULER == 'CosineAnnealingLR':
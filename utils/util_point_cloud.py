@@ -12,14 +12,11 @@
 import os
 import numpy as np
 import cv2
-import open3d as o3d
 
 # User Library
 import configs.config_general as cnf
 import configs.config_ui as cnf_ui
 
-from utils.util_ui_labeling import get_list_dict_by_processing_plain_text
-
 __all__ = [ 'PointCloudOs64',
             'get_pc_os64_with_path',
             'filter_pc_os64_with_roi',
@@ -150,12 +147,11 @@ def append_image_index_to_pc_os64(pc_os64, list_roi_xy, list_grid_xy):
     x_min, _, y_min, _ = list_roi_xy
     x_grid, y_grid = list_grid_xy
 
-    list_xy_values = pc_os64['values'][:,:2].tolist()
-    list_xy_values = list(map(lambda xy: [int((xy[0]-x_min)/x_grid), \
-                                            int((xy[1]-y_min)/y_grid)], list_xy_values))
+    # int() of each value (truncation toward 0)
+    arr_xy_values = np.stack([(pc_os64['values'][:,0]-x_min)/x_grid, \
+                              (pc_os64['values'][:,1]-y_min)/y_grid], axis=1).astype(np.int64)
     
     # np.where convention
-    arr_xy_values = np.array(list_xy_values)
     tuple_xy = (arr_xy_values[:,0], arr_xy_values[:,1])
 
     pc_os64.update({'img_idx': arr_xy_values})
@@ -185,8 +181,8 @@ def get_projection_image_from_pointclouds(pc_os64, list_img_size_xy=[1152, 1152]
         temp_arr = (temp_arr-v_min)/(v_max-v_min)
         list_list_values.append(temp_arr)
 
-        for idx, xy in enumerate(pc_os64['img_idx']):
-            temp_img[xy[0], xy[1], channel_idx] = temp_arr[idx]
+        # the last point is kept for a pixel with several points, as the loop over points
+        temp_img[pc_os64['img_idx'][:,0], pc_os64['img_idx'][:,1], channel_idx] = temp_arr
 
     if is_flip:
         temp_img = np.flip(np.flip(temp_img, 0), 1).copy()
@@ -194,6 +190,7 @@ def get_projection_image_from_pointclouds(pc_os64, list_img_size_xy=[1152, 1152]
     return temp_img
 
 def get_filtered_point_cloud_from_plain_text(p_frame, is_with_list_infos=False):
+    from utils.util_ui_labeling import get_list_dict_by_processing_plain_text # PyQt5
     # path_pcd = os.path.join(cnf_ui.BASE_DIR, 'data', 'example', f'pc_{p_frame.str_time}.pcd')
     path_pcd = p_frame.dict_lidar['pc']
     
@@ -295,6 +292,7 @@ def get_front_beside_image_from_point_cloud(pc_os64, radius=1, color=(0,0,0)):
     return img_bev_f, img_bev_b
 
 def get_o3d_point_cloud(arr_pc, color=None):
+    import open3d as o3d
     pcd = o3d.geometry.PointCloud()
 
     pcd.points = o3d.utility.Vector3dVector(arr_pc[:,:3])
@@ -316,6 +314,7 @@ def filter_pc_with_roi_in_xyz(arr_pc, list_roi_xyz):
     return pc_filtered
 
 def get_o3d_line_set_from_tuple_bbox(tuple_bbox, is_with_arrow=True, length_arrow=1.0, length_tips=0.4, cfg=None):
+    import open3d as o3d
     name_cls, idx_cls, list_values, _ = tuple_bbox
     x, y, z, theta, l, w, h = list_values
 
@@ -448,6 +447,7 @@ def get_list_bboxes_tuples_from_inference(arr_rpn, bin_size, arr_reg, thr_rpn=0.
     return list_tuples
 
 def get_o3d_line_set_from_list_infos(list_infos, color = [0., 0., 0.], is_with_arrow=True, length_arrow=1.0, length_tips=0.4):
+    import open3d as o3d
     x, y, z, azi_deg, l_2, w_2, h_2 = list_infos
     theta = azi_deg*np.pi/180.
     l = l_2*2.
@@ -0,0 +1,111 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: cache of decoded boxes before nms, to sweep nms / conf thresholds
+*   without loading the radar tensors and running the network again
+'''
+
+import os
+import hashlib
+import pickle
+import numpy as np
+
+__all__ = [ 'get_state_dict_hash', \
+            'PredCacheWriter', \
+            'PredCacheReader', \
+            ]
+
+NAME_BIN = 'preds.bin'
+NAME_INDEX = 'index.pkl'
+LEN_ROW = 9 # score, xc, yc, zc, xl, yl, zl, angle, cls_id
+
+def get_state_dict_hash(network, len_hash=16):
+    '''
+    * sha1 of the network weights (same checkpoint -> same cache dir)
+    '''
+    sha = hashlib.sha1()
+    state_dict = network.state_dict()
+    for k in sorted(state_dict.keys()):
+        sha.update(k.encode())
+        sha.update(state_dict[k].detach().cpu().numpy().tobytes())
+    return sha.hexdigest()[:len_hash]
+
+class PredCacheWriter():
+    '''
+    * rows of all frames are appended to one float32 file (preds.bin)
+    * offsets, labels and desc per frame are written in index.pkl at close()
+    *   index.pkl is written last (tmp -> rename), so a cache without it is incomplete
+    '''
+    def __init__(self, path_cache, min_conf_thr, dict_info=None):
+        os.makedirs(path_cache, exist_ok=True)
+        self.path_cache = path_cache
+        self.min_conf_thr = min_conf_thr
+        self.dict_info = dict() if dict_info is None else dict_info
+
+        self.f_bin = open(os.path.join(path_cache, NAME_BIN), 'wb')
+        self.list_offsets = [0]
+        self.list_labels = []
+        self.list_desc = []
+        self.list_idx_datum = []
+
+    def write(self, idx_datum, pred_boxes, cls_ids, labels, desc):
+        '''
+        * pred_boxes: N x 8 (scores, xc, yc, zc, xl, yl, zl, angle) or None
+        * cls_ids: N or None
+        * labels, desc: dict_out['labels'], dict_out['desc'][0]
+        '''
+        if pred_boxes is None:
+            rows = np.zeros((0, LEN_ROW), dtype=np.float32)
+        else:
+            pred_boxes = pred_boxes.detach().cpu().numpy()
+            cls_ids = cls_ids.detach().cpu().numpy()
+            rows = np.concatenate([pred_boxes, cls_ids[:, np.newaxis]], axis=1).astype(np.float32)
+        self.f_bin.write(rows.tobytes())
+
+        self.list_offsets.append(self.list_offsets[-1] + len(rows))
+        self.list_labels.append(labels)
+        self.list_desc.append(dict(desc))
+        self.list_idx_datum.append(idx_datum)
+
+    def close(self):
+        self.f_bin.close()
+        dict_index = {
+            'offsets': np.array(self.list_offsets, dtype=np.int64),
+            'labels': self.list_labels,
+            'desc': self.list_desc,
+            'idx_datum': self.list_idx_datum,
+            'min_conf_thr': self.min_conf_thr,
+            'info': self.dict_info,
+        }
+        path_index = os.path.join(self.path_cache, NAME_INDEX)
+        with open(path_index + '.tmp', 'wb') as f:
+            pickle.dump(dict_index, f)
+        os.replace(path_index + '.tmp', path_index)
+
+class PredCacheReader():
+    '''
+    * reader[idx] = pred_boxes (N x 8), cls_ids (N), labels, desc, idx_datum
+    '''
+    def __init__(self, path_cache):
+        path_index = os.path.join(path_cache, NAME_INDEX)
+        if not os.path.exists(path_index):
+            raise FileNotFoundError(f'* incomplete pred cache: {path_cache}')
+        with open(path_index, 'rb') as f:
+            dict_index = pickle.load(f)
+        self.offsets = dict_index['offsets']
+        self.list_labels = dict_index['labels']
+        self.list_desc = dict_index['desc']
+        self.list_idx_datum = dict_index['idx_datum']
+        self.min_conf_thr = dict_index['min_conf_thr']
+        self.dict_info = dict_index['info']
+
+        self.rows = np.fromfile(os.path.join(path_cache, NAME_BIN), dtype=np.float32).reshape(-1, LEN_ROW)
+
+    def __len__(self):
+        return len(self.list_labels)
+
+    def __getitem__(self, idx):
+        rows = self.rows[self.offsets[idx]:self.offsets[idx+1]]
+        return rows[:, :8], rows[:, 8].astype(np.int64), \
+            self.list_labels[idx], self.list_desc[idx], self.list_idx_datum[idx]
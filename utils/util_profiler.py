@@ -0,0 +1,177 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: opt-in per-stage profiling (GENERAL.PROFILE) with a report per epoch
+*   stages: data wait, h2d, each module of RadarRoI.list_modules (forward hooks), loss parts, backward, ...
+*   report: count, mean, p50, p95, max & total time, peak cuda memory per stage (console & json)
+*   models get the active profiler with get_profiler() (disabled: start & stop return at once)
+'''
+
+import os
+import json
+import time
+import numpy as np
+import torch
+from contextlib import contextmanager
+
+__all__ = [ 'StageProfiler', \
+            'get_profiler', \
+            'set_profiler', ]
+
+class StageProfiler():
+    '''
+    * wall time of each stage, cuda is synchronized at every start & stop (exact stage times,
+    *   the stages do not overlap while profiling)
+    * stages can be nested, e.g., 'forward/RadarSparseProcessor' > 'h2d' (the time of the inner is in the outer)
+    * scope: prefix of the names, e.g., 'train' & 'val' for the same modules
+    * peak memory (incl. the inner stages), cuda only: the peak stats are not reset (not to affect the other users),
+    *   exact if the stage reaches a new peak of the process (max_memory_allocated),
+    *   else the max of memory_allocated at the starts & stops (a lower bound)
+    '''
+    def __init__(self, is_enabled=True):
+        self.is_enabled = is_enabled
+        self.is_cuda = is_enabled and torch.cuda.is_available()
+        self.scope = None
+        self.list_stack = [] # [name, time start, peak memory, peak of the process at start]
+        self.reset()
+
+    def reset(self):
+        self.dict_times = dict() # name: list of sec
+        self.dict_peak_mem = dict() # name: bytes
+
+    def get_name(self, name):
+        return name if self.scope is None else f'{self.scope}/{name}'
+
+    def start(self, name):
+        if not self.is_enabled:
+            return
+        mem, peak_mem_process = 0, 0
+        if self.is_cuda:
+            torch.cuda.synchronize()
+            mem, peak_mem_process = torch.cuda.memory_allocated(), torch.cuda.max_memory_allocated()
+        self.list_stack.append([self.get_name(name), time.perf_counter(), mem, peak_mem_process])
+
+    def stop(self, name=None):
+        '''
+        * name: None for the last started, the inner stages not stopped (e.g., exception) are discarded
+        '''
+        if not self.is_enabled:
+            return
+        if self.is_cuda:
+            torch.cuda.synchronize()
+        time_stop = time.perf_counter()
+        name = None if name is None else self.get_name(name)
+        while len(self.list_stack) > 0:
+            name_stage, time_start, peak_mem, peak_mem_process = self.list_stack.pop()
+            if (name is None) or (name_stage == name):
+                break
+        else:
+            return
+        self.dict_times.setdefault(name_stage, []).append(time_stop-time_start)
+        if self.is_cuda:
+            peak_mem = max(peak_mem, torch.cuda.memory_allocated())
+            if torch.cuda.max_memory_allocated() > peak_mem_process: # new peak in the stage
+                peak_mem = max(peak_mem, torch.cuda.max_memory_allocated())
+            self.dict_peak_mem[name_stage] = max(self.dict_peak_mem.get(name_stage, 0), peak_mem)
+            if len(self.list_stack) > 0:
+                self.list_stack[-1][2] = max(self.list_stack[-1][2], peak_mem)
+
+    @contextmanager
+    def stage(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def iter_stage(self, iterable, name='data_wait'):
+        '''
+        * time of next() (e.g., waiting for the data loader), iterable itself if disabled
+        '''
+        if not self.is_enabled:
+            return iterable
+        return self.get_iter_stage(iterable, name)
+
+    def get_iter_stage(self, iterable, name):
+        iterator = iter(iterable)
+        while True:
+            self.start(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.list_stack.pop() # not a stage
+                return
+            self.stop(name)
+            yield item
+
+    def attach_modules(self, list_modules, prefix='forward'):
+        '''
+        * stages of the modules with forward hooks, e.g., RadarRoI.list_modules
+        * out: handles (handle.remove() to detach)
+        '''
+        list_handles = []
+        if not self.is_enabled:
+            return list_handles
+        for module in list_modules:
+            name = f'{prefix}/{type(module).__name__}'
+            list_handles.append(module.register_forward_pre_hook( \
+                lambda module, args, name=name: self.start(name)))
+            list_handles.append(module.register_forward_hook( \
+                lambda module, args, out, name=name: self.stop(name)))
+        return list_handles
+
+    def get_summary(self):
+        '''
+        * out: {name: {count, mean_ms, p50_ms, p95_ms, max_ms, total_s, peak_mem_mb}}
+        *   in order of the first stop (inner stages first)
+        '''
+        dict_summary = dict()
+        for name, list_times in self.dict_times.items():
+            arr_ms = np.array(list_times)*1000.
+            dict_summary[name] = {
+                'count': int(len(arr_ms)),
+                'mean_ms': float(np.mean(arr_ms)),
+                'p50_ms': float(np.percentile(arr_ms, 50)),
+                'p95_ms': float(np.percentile(arr_ms, 95)),
+                'max_ms': float(np.max(arr_ms)),
+                'total_s': float(np.sum(arr_ms)/1000.),
+                'peak_mem_mb': float(self.dict_peak_mem[name]/(1024.**2)) if name in self.dict_peak_mem.keys() else None,
+            }
+        return dict_summary
+
+    def get_report_str(self, dict_summary=None, header=None):
+        dict_summary = self.get_summary() if dict_summary is None else dict_summary
+        len_name = max([len(name) for name in dict_summary.keys()] + [5])
+        list_lines = [] if header is None else [header]
+        list_lines.append(f'{"stage":<{len_name}} | {"count":>6} | {"mean ms":>9} | {"p50 ms":>9} | ' + \
+                          f'{"p95 ms":>9} | {"total s":>9} | {"peak MB":>9}')
+        for name, v in dict_summary.items():
+            peak_mem = '-' if v['peak_mem_mb'] is None else f'{v["peak_mem_mb"]:.1f}'
+            list_lines.append(f'{name:<{len_name}} | {v["count"]:>6} | {v["mean_ms"]:>9.2f} | {v["p50_ms"]:>9.2f} | ' + \
+                              f'{v["p95_ms"]:>9.2f} | {v["total_s"]:>9.2f} | {peak_mem:>9}')
+        return '\n'.join(list_lines)
+
+    def save_json(self, path_json, dict_info=None, dict_summary=None):
+        '''
+        * dict_info: e.g., epoch & # of iterations, with 'stages': summary
+        '''
+        dict_report = dict() if dict_info is None else dict(dict_info)
+        dict_report['stages'] = self.get_summary() if dict_summary is None else dict_summary
+        os.makedirs(os.path.dirname(path_json), exist_ok=True)
+        with open(path_json, 'w') as f:
+            json.dump(dict_report, f, indent=2)
+
+### Active profiler of the process (for the models) ###
+PROFILER_DISABLED = StageProfiler(is_enabled=False)
+dict_active_profiler = {'profiler': PROFILER_DISABLED}
+
+def get_profiler():
+    return dict_active_profiler['profiler']
+
+def set_profiler(profiler=None):
+    '''
+    * None: disabled
+    '''
+    dict_active_profiler['profiler'] = PROFILER_DISABLED if profiler is None else profiler
+### Active profiler of the process (for the models) ###
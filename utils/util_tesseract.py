@@ -0,0 +1,308 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: numpy processing of 4D radar tensors (tesseract)
+*   doppler reduction of DREA in one pass & polar (REA) -> cartesian (ZYX) cube
+*   (same as gen_3_get_zyx_cube.m & gen_doppler_ubuntu.m)
+*   raw adc -> tesseract with range/doppler fft & dbf (gen_2_get_tesseract.m)
+*   compressed tesseract store (npz with chunks along range, for partial reads)
+'''
+
+import io
+import os
+import hashlib
+import numpy as np
+from scipy.io import loadmat
+
+__all__ = [ 'LIST_DOPPLER_CHANNELS', \
+            'load_physical_arrays', \
+            'get_cube_arrays', \
+            'reduce_doppler', \
+            'get_zyx_from_rea', \
+            'get_fused_doppler_cube', \
+            'read_adc_frame', \
+            'get_range_doppler_fft', \
+            'get_dbf_tesseract', \
+            'get_tesseract_from_adc', \
+            'save_tesseract_store', \
+            'load_tesseract_store', \
+            'get_tesseract_store_checksum', \
+            ]
+
+LIST_DOPPLER_CHANNELS = ['mean_power', 'max_power', 'mean_doppler', 'argmax_doppler']
+INVALID_POWER = -1. # as arr_zyx in radar_zyx_cube
+INVALID_DOPPLER = -10. # as arr_zyx in radar_cube_doppler
+
+def load_physical_arrays(path_info='./resources/info_arr.mat', path_doppler='./resources/arr_doppler.mat'):
+    '''
+    * returns arr_range [m], arr_azimuth [rad], arr_elevation [rad], arr_doppler [m/s]
+    '''
+    temp_values = loadmat(path_info)
+    deg2rad = np.pi/180.
+    arr_range = temp_values['arrRange'].reshape(-1)
+    arr_azimuth = temp_values['arrAzimuth'].reshape(-1)*deg2rad
+    arr_elevation = temp_values['arrElevation'].reshape(-1)*deg2rad
+    arr_doppler = loadmat(path_doppler)['arr_doppler'].reshape(-1)
+    return arr_range, arr_azimuth, arr_elevation, arr_doppler
+
+def get_cube_arrays(bin_size=0.4):
+    '''
+    * arr_z, arr_y, arr_x of radar_zyx_cube (before flip)
+    '''
+    arr_z = np.arange(-30, 30, bin_size)
+    arr_y = np.arange(-80, 80, bin_size)
+    arr_x = np.arange(0, 100, bin_size)
+    return arr_z, arr_y, arr_x
+
+def reduce_doppler(arr_tesseract, arr_doppler, len_chunk=16):
+    '''
+    * arr_tesseract: (D, ...) e.g., DREA
+    * returns float32 (4, ...) in LIST_DOPPLER_CHANNELS order,
+    *   mean power, max power, power-weighted mean doppler, doppler of max power
+    * every chunk (along axis 1) is read once for all channels
+    '''
+    arr_doppler = np.asarray(arr_doppler, dtype=np.float64)
+    num_doppler = arr_tesseract.shape[0]
+    assert num_doppler == len(arr_doppler), '* doppler axis should be the first'
+
+    arr_out = np.empty((len(LIST_DOPPLER_CHANNELS),)+arr_tesseract.shape[1:], dtype=np.float32)
+    shape_dop = (num_doppler,)+(1,)*(arr_tesseract.ndim-1)
+    for idx_start in range(0, arr_tesseract.shape[1], len_chunk):
+        chunk = np.asarray(arr_tesseract[:,idx_start:idx_start+len_chunk], dtype=np.float64)
+        sum_power = np.sum(chunk, axis=0)
+        idx_max = np.argmax(chunk, axis=0)
+        arr_out[0,idx_start:idx_start+len_chunk] = sum_power/num_doppler
+        arr_out[1,idx_start:idx_start+len_chunk] = np.take_along_axis(chunk, idx_max[np.newaxis], axis=0)[0]
+        arr_out[2,idx_start:idx_start+len_chunk] = \
+            np.sum(chunk*arr_doppler.reshape(shape_dop), axis=0)/np.maximum(sum_power, np.finfo(np.float64).tiny)
+        arr_out[3,idx_start:idx_start+len_chunk] = arr_doppler[idx_max]
+
+    return arr_out
+
+def get_zyx_from_rea(arr_rea, arr_range, arr_azimuth, arr_elevation, arr_z, arr_y, arr_x, invalid_value=INVALID_POWER):
+    '''
+    * arr_rea: (R, E, A) or (C, R, E, A), arr_azimuth & arr_elevation in [rad]
+    * returns (Z, Y, X) or (C, Z, Y, X) with trilinear interpolation as gen_3_get_zyx_cube.m
+    *   invalid_value: scalar or per channel, for the cells out of the polar grid
+    * computed per z slice (no look-up table is kept)
+    '''
+    is_single = (arr_rea.ndim == 3)
+    arr_rea = arr_rea[np.newaxis] if is_single else arr_rea
+    num_ch = arr_rea.shape[0]
+    invalid_value = np.broadcast_to(np.asarray(invalid_value, dtype=np.float32), (num_ch,))
+
+    arr_zyx = np.empty((num_ch, len(arr_z), len(arr_y), len(arr_x)), dtype=np.float32)
+    grid_y, grid_x = np.meshgrid(arr_y, arr_x, indexing='ij')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        arr_a = np.arctan(-grid_y/grid_x)
+    dist_xy = np.sqrt(grid_x**2+grid_y**2)
+
+    def get_idx_and_t(val, arr):
+        # arr[i_0] < val <= arr[i_0+1] as findIndexForBiInt
+        idx = np.searchsorted(arr, val, side='left')
+        is_valid = (idx >= 1) & (idx <= len(arr)-1)
+        idx_0 = np.clip(idx-1, 0, len(arr)-2)
+        t = (val-arr[idx_0])/(arr[idx_0+1]-arr[idx_0])
+        return idx_0, t, is_valid
+
+    idx_a_0, t_a, is_valid_a = get_idx_and_t(arr_a, arr_azimuth)
+    for idx_z, val_z in enumerate(arr_z):
+        arr_r = np.sqrt(dist_xy**2+val_z**2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            arr_e = np.arctan(val_z/dist_xy)
+        idx_r_0, t_r, is_valid_r = get_idx_and_t(arr_r, arr_range)
+        idx_e_0, t_e, is_valid_e = get_idx_and_t(arr_e, arr_elevation)
+        is_valid = is_valid_r & is_valid_e & is_valid_a
+
+        i_r, i_e, i_a = idx_r_0[is_valid], idx_e_0[is_valid], idx_a_0[is_valid]
+        w_r, w_e, w_a = t_r[is_valid], t_e[is_valid], t_a[is_valid]
+        val = np.zeros((num_ch, len(i_r)), dtype=np.float64)
+        for d_r, c_r in ((0, 1-w_r), (1, w_r)):
+            for d_e, c_e in ((0, 1-w_e), (1, w_e)):
+                for d_a, c_a in ((0, 1-w_a), (1, w_a)):
+                    val += arr_rea[:,i_r+d_r,i_e+d_e,i_a+d_a]*(c_r*c_e*c_a)
+
+        arr_slice = arr_zyx[:,idx_z]
+        arr_slice[:] = invalid_value[:,np.newaxis,np.newaxis]
+        arr_slice[:,is_valid] = val
+
+    return arr_zyx[0] if is_single else arr_zyx
+
+def get_fused_doppler_cube(arr_drea, arr_range, arr_azimuth, arr_elevation, arr_doppler, \
+                            arr_z=None, arr_y=None, arr_x=None):
+    '''
+    * arr_drea: arrDREA of radar_tesseract (D, R, E, A)
+    * returns float32 (4, Z, Y, X) with LIST_DOPPLER_CHANNELS,
+    *   aligned with radar_zyx_cube (mean_power) & radar_cube_doppler (argmax_doppler)
+    '''
+    if arr_z is None:
+        arr_z, arr_y, arr_x = get_cube_arrays()
+    arr_rea = reduce_doppler(arr_drea, arr_doppler)
+    invalid_value = [INVALID_POWER, INVALID_POWER, INVALID_DOPPLER, INVALID_DOPPLER]
+    return get_zyx_from_rea(arr_rea, arr_range, arr_azimuth, arr_elevation, \
+                            arr_z, arr_y, arr_x, invalid_value)
+
+def read_adc_frame(path_bin, idx_frame, num_adc_samples, num_rx, num_chirps_per_loop, num_chirp_loops, dtype=np.int16):
+    '''
+    * one frame of a chip file (I, Q interleaved, frames are contiguous), idx_frame from 0
+    * returns complex64 (num_adc_samples, num_rx, num_chirps_per_loop, num_chirp_loops),
+    *   same order as reshape() of gen_2_get_tesseract.m (column-major)
+    '''
+    shape_frame = (num_adc_samples, num_rx, num_chirps_per_loop, num_chirp_loops)
+    num_values = 2*int(np.prod(shape_frame))
+    adc_data = np.fromfile(path_bin, dtype=dtype, count=num_values, \
+                            offset=idx_frame*num_values*np.dtype(dtype).itemsize)
+    if len(adc_data) != num_values:
+        raise ValueError(f'* frame {idx_frame} is out of {path_bin}')
+    adc_data = adc_data.astype(np.float32)
+    adc_frame = adc_data[0::2] + 1j*adc_data[1::2]
+    return adc_frame.reshape(shape_frame, order='F').astype(np.complex64)
+
+def get_window(type_window, num):
+    if type_window is None:
+        return np.ones(num, dtype=np.float32)
+    elif type_window == 'hann':
+        return np.hanning(num).astype(np.float32)
+    elif type_window == 'hamming':
+        return np.hamming(num).astype(np.float32)
+    elif type_window == 'blackman':
+        return np.blackman(num).astype(np.float32)
+    else:
+        raise ValueError(f'* window {type_window} is not supported')
+
+def get_range_doppler_fft(radar_cube, num_range_bins, num_doppler_bins, \
+                            window_range=None, window_doppler=None, is_fftshift_doppler=True):
+    '''
+    * radar_cube: (samples, rx, chirps_per_loop, chirp_loops, chips) after calibration
+    * fft along samples (range) & chirp_loops (doppler), zero padded to the # of bins
+    *   windows: None (as gen_2_get_tesseract.m), 'hann', 'hamming', 'blackman'
+    *   is_fftshift_doppler: zero doppler at the center (order of arr_doppler)
+    '''
+    num_samples, num_loops = radar_cube.shape[0], radar_cube.shape[3]
+    radar_cube = radar_cube*get_window(window_range, num_samples).reshape(-1, 1, 1, 1, 1)
+    radar_cube = radar_cube*get_window(window_doppler, num_loops).reshape(1, 1, 1, -1, 1)
+    range_fft = np.fft.fft(radar_cube, num_range_bins, axis=0)
+    doppler_fft = np.fft.fft(range_fft, num_doppler_bins, axis=3)
+    if is_fftshift_doppler:
+        doppler_fft = np.fft.fftshift(doppler_fft, axes=3)
+    return doppler_fft.astype(np.complex64)
+
+def get_dbf_tesseract(doppler_fft, steering, is_fftshift_doppler=True, is_tdm_compensation=True, \
+                        is_power=True, len_chunk=16):
+    '''
+    * doppler_fft: (range, rx, chirps_per_loop (tx), doppler, chips)
+    * steering: (E, A, V) complex, V = rx*tx*chips in column-major order of (rx, tx, chips)
+    *   (same order as squeeze(dopplerFFTout(idxRange, :, :, idxDoppler, :)))
+    * is_tdm_compensation: phase of the doppler between tx slots (tdm mimo) is compensated
+    * returns float32 DREA (doppler, range, elevation, azimuth), |w^H x|^2 (or |w^H x|)
+    '''
+    num_range, num_rx, num_tx, num_doppler, num_chips = doppler_fft.shape
+    num_e, num_a, num_v = steering.shape
+    assert num_v == num_rx*num_tx*num_chips, '* steering should have rx*tx*chips channels'
+    weight = np.conj(steering.reshape(num_e*num_a, num_v)).T.astype(np.complex64) # V, E*A
+
+    # (range, doppler, V) with V in column-major order of (rx, tx, chips)
+    x = np.transpose(doppler_fft, (0, 3, 4, 2, 1)).reshape(num_range, num_doppler, num_v)
+    if is_tdm_compensation:
+        idx_doppler = np.arange(num_doppler)
+        idx_doppler = idx_doppler-num_doppler//2 if is_fftshift_doppler else \
+                        np.where(idx_doppler < num_doppler//2, idx_doppler, idx_doppler-num_doppler)
+        phase = np.exp(-1j*2*np.pi*np.outer(idx_doppler/num_doppler, np.arange(num_tx))/num_tx) # D, tx
+        phase = np.broadcast_to(phase[:,np.newaxis,:,np.newaxis], (num_doppler, num_chips, num_tx, num_rx))
+        x = x*phase.reshape(1, num_doppler, num_v).astype(np.complex64)
+
+    arr_drea = np.empty((num_doppler, num_range, num_e, num_a), dtype=np.float32)
+    for idx_start in range(0, num_range, len_chunk):
+        y = x[idx_start:idx_start+len_chunk] @ weight # r, D, E*A
+        y = np.abs(y)**2 if is_power else np.abs(y)
+        arr_drea[:,idx_start:idx_start+len_chunk] = \
+            np.transpose(y, (1, 0, 2)).reshape(num_doppler, -1, num_e, num_a)
+    return arr_drea
+
+def get_tesseract_from_adc(list_path_bin, idx_frame, dict_params, calib, steering):
+    '''
+    * list_path_bin: bin file of each chip
+    * dict_params: NUM_ADC_SAMPLES, NUM_RX, NUM_CHIRPS_PER_LOOP, NUM_CHIRP_LOOPS,
+    *   NUM_RANGE_BINS, NUM_DOPPLER_BINS, WINDOW_RANGE, WINDOW_DOPPLER,
+    *   IS_FFTSHIFT_DOPPLER, IS_TDM_COMPENSATION, IS_POWER
+    * calib: complex (rx, chirps_per_loop, chips), multiplied to the adc (None: no calibration)
+    * returns arrDREA (doppler, range, elevation, azimuth) flipped along elevation as the .mat
+    '''
+    radar_cube = np.stack([read_adc_frame(path_bin, idx_frame, dict_params['NUM_ADC_SAMPLES'], \
+        dict_params['NUM_RX'], dict_params['NUM_CHIRPS_PER_LOOP'], dict_params['NUM_CHIRP_LOOPS']) \
+            for path_bin in list_path_bin], axis=-1)
+    if calib is not None:
+        radar_cube = radar_cube*calib[np.newaxis,:,:,np.newaxis,:].astype(np.complex64)
+    doppler_fft = get_range_doppler_fft(radar_cube, dict_params['NUM_RANGE_BINS'], dict_params['NUM_DOPPLER_BINS'], \
+        dict_params['WINDOW_RANGE'], dict_params['WINDOW_DOPPLER'], dict_params['IS_FFTSHIFT_DOPPLER'])
+    arr_drea = get_dbf_tesseract(doppler_fft, steering, dict_params['IS_FFTSHIFT_DOPPLER'], \
+        dict_params['IS_TDM_COMPENSATION'], dict_params['IS_POWER'])
+    return np.ascontiguousarray(np.flip(arr_drea, axis=2)) # flip along elevation
+
+def get_tesseract_store_checksum(list_chunks):
+    sha = hashlib.sha1()
+    for chunk in list_chunks:
+        sha.update(np.ascontiguousarray(chunk).tobytes())
+    return sha.hexdigest()
+
+def save_tesseract_store(path_save, arr_tesseract, dtype=np.float32, len_chunk=32, is_compress=True):
+    '''
+    * arr_tesseract (e.g., DREA) -> npz, chunks of len_chunk along axis 1 (range) are separate members
+    *   so that load_tesseract_store can read a range interval only
+    * dtype: np.float64, np.float32 or np.float16 (float16 keeps 10*log10(power), power does not fit)
+    * written to a tmp file first and renamed (atomic), returns sha1 of the stored chunks
+    '''
+    dtype = np.dtype(dtype)
+    is_log = (dtype == np.float16)
+    arr_save = 10*np.log10(np.maximum(arr_tesseract, np.finfo(np.float64).tiny)) if is_log else arr_tesseract
+
+    num_range = arr_tesseract.shape[1]
+    list_chunks = [np.ascontiguousarray(arr_save[:,idx_start:idx_start+len_chunk], dtype=dtype) \
+                    for idx_start in range(0, num_range, len_chunk)]
+    checksum = get_tesseract_store_checksum(list_chunks)
+    dict_save = {f'chunk_{idx_chunk:04d}': chunk for idx_chunk, chunk in enumerate(list_chunks)}
+    dict_save.update({
+        'shape': np.array(arr_tesseract.shape, dtype=np.int64),
+        'len_chunk': np.array(len_chunk, dtype=np.int64),
+        'is_log': np.array(is_log),
+        'sha1': np.array(checksum),
+    })
+
+    func_save = np.savez_compressed if is_compress else np.savez
+    with open(path_save + '.tmp', 'wb') as f:
+        func_save(f, **dict_save)
+    os.replace(path_save + '.tmp', path_save)
+    return checksum
+
+def load_tesseract_store(path_store, idx_range=None, is_verify=False, is_in_log=False, dtype=np.float64):
+    '''
+    * idx_range: [idx_start, idx_end) along axis 1 (range), None for all
+    *   only the chunks inside idx_range are decompressed
+    * is_verify: compare sha1 of the chunks (all chunks are read), raises ValueError if different
+    * returns power (or 10*log10(power) with is_in_log) in dtype
+    '''
+    with np.load(path_store, allow_pickle=False) as store:
+        shape = tuple(store['shape'].tolist())
+        len_chunk = int(store['len_chunk'])
+        is_log = bool(store['is_log'])
+        num_chunks = (shape[1]+len_chunk-1)//len_chunk
+
+        if is_verify:
+            list_chunks = [store[f'chunk_{idx_chunk:04d}'] for idx_chunk in range(num_chunks)]
+            if get_tesseract_store_checksum(list_chunks) != str(store['sha1']):
+                raise ValueError(f'* checksum is different: {path_store}')
+
+        idx_start, idx_end = (0, shape[1]) if idx_range is None else idx_range
+        list_arr = []
+        for idx_chunk in range(idx_start//len_chunk, (idx_end-1)//len_chunk+1):
+            chunk = store[f'chunk_{idx_chunk:04d}']
+            offset = idx_chunk*len_chunk
+            list_arr.append(chunk[:,max(idx_start-offset, 0):idx_end-offset])
+    arr_tesseract = np.concatenate(list_arr, axis=1).astype(dtype)
+
+    if is_log and (not is_in_log):
+        arr_tesseract = np.power(10., arr_tesseract/10.)
+    elif (not is_log) and is_in_log:
+        arr_tesseract = 10*np.log10(arr_tesseract)
+    return arr_tesseract
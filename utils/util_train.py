@@ -0,0 +1,143 @@
+'''
+* Copyright (c) AVELab, KAIST. All rights reserved.
+* author: Donghee Paek & Kevin Tirta Wijaya, AVELab, KAIST
+* e-mail: donghee.paek@kaist.ac.kr, kevin.tirta@kaist.ac.kr
+* description: utils for the training loop without host-device syncs per iteration
+'''
+
+import torch
+
+__all__ = [ 'MetricAccumulator', \
+            'get_finite_flag', \
+            'zero_grads_if_not_finite', \
+            'get_grad_window', \
+            'get_num_optimizer_steps', \
+            'get_amp_dtype', \
+            'get_autocast_context', \
+            'build_grad_scaler', ]
+
+class MetricAccumulator():
+    '''
+    * keeps the logging values of each iteration (detached tensors on the device or python floats)
+    * flush(): copies every tensor to the host at once (one sync per flush instead of per value)
+    *   returns a list of (idx_iter, dict_values) & updates the running sums (e.g., average loss of an epoch)
+    '''
+    def __init__(self, per_iter_flush=1):
+        self.per_iter_flush = max(int(per_iter_flush), 1)
+        self.list_steps = [] # (idx_iter, dict_values)
+        self.dict_sum = dict()
+        self.dict_cnt = dict()
+
+    def add(self, idx_iter, dict_values):
+        dict_step = dict()
+        for k, v in dict_values.items():
+            dict_step[k] = v.detach() if torch.is_tensor(v) else v
+        self.list_steps.append((idx_iter, dict_step))
+
+    def is_flush(self):
+        return len(self.list_steps) >= self.per_iter_flush
+
+    def flush(self):
+        if len(self.list_steps) == 0:
+            return []
+
+        ### Tensors to host at once ###
+        list_keys = []
+        list_tensors = []
+        for idx_step, (_, dict_step) in enumerate(self.list_steps):
+            for k, v in dict_step.items():
+                if torch.is_tensor(v):
+                    list_keys.append((idx_step, k))
+                    list_tensors.append(v.reshape(-1)[:1].float())
+        if len(list_tensors) > 0:
+            list_host = torch.cat([v.to(list_tensors[0].device) for v in list_tensors]).cpu().tolist()
+            for (idx_step, k), v in zip(list_keys, list_host):
+                self.list_steps[idx_step][1][k] = v
+        ### Tensors to host at once ###
+
+        list_steps = self.list_steps
+        self.list_steps = []
+        for _, dict_step in list_steps:
+            for k, v in dict_step.items():
+                v = float(v)
+                self.dict_sum[k] = self.dict_sum.get(k, 0.) + v
+                self.dict_cnt[k] = self.dict_cnt.get(k, 0) + 1
+
+        return list_steps
+
+    def get_mean(self, key):
+        if self.dict_cnt.get(key, 0) == 0:
+            return None
+        return self.dict_sum[key]/self.dict_cnt[key]
+
+    def reset(self):
+        self.list_steps = []
+        self.dict_sum = dict()
+        self.dict_cnt = dict()
+
+def get_finite_flag(loss):
+    '''
+    * 0-dim bool tensor on the device of loss (not synchronized), python bool for a float loss
+    '''
+    if torch.is_tensor(loss):
+        return torch.isfinite(loss.detach()).all()
+    return bool(torch.isfinite(torch.tensor(loss)))
+
+def zero_grads_if_not_finite(params, is_finite):
+    '''
+    * the step of a non-finite loss is applied with zero gradients (no sync)
+    '''
+    if not torch.is_tensor(is_finite):
+        if not is_finite:
+            for p in params:
+                if p.grad is not None:
+                    p.grad.zero_()
+        return
+    is_not_finite = torch.logical_not(is_finite)
+    for p in params:
+        if p.grad is not None:
+            p.grad.masked_fill_(is_not_finite, 0.)
+
+def get_grad_window(idx_iter, num_iters, num_grad_acc=1):
+    '''
+    * gradient accumulation over windows of num_grad_acc iterations
+    * out: # of iterations in the window of idx_iter (for the loss scale), optimizer step at idx_iter
+    *   the last window of an epoch can be shorter (num_iters % num_grad_acc) and is stepped as well
+    '''
+    num_grad_acc = max(int(num_grad_acc), 1)
+    idx_start = (idx_iter//num_grad_acc)*num_grad_acc
+    num_window = min(num_grad_acc, num_iters-idx_start)
+    is_step = (idx_iter == idx_start+num_window-1)
+    return num_window, is_step
+
+def get_num_optimizer_steps(num_iters, num_grad_acc=1):
+    num_grad_acc = max(int(num_grad_acc), 1)
+    return (num_iters+num_grad_acc-1)//num_grad_acc
+
+def get_amp_dtype(name_dtype=None):
+    '''
+    * name_dtype: None (float32), 'float16' or 'bfloat16' (GENERAL.AMP)
+    * out: dtype of autocast, None without autocast
+    '''
+    dict_dtype = {None: None, 'None': None, 'float32': None, \
+                  'float16': torch.float16, 'bfloat16': torch.bfloat16}
+    if name_dtype not in dict_dtype.keys():
+        raise AttributeError(f'* check amp dtype: {name_dtype} (None, float16, bfloat16)')
+    return dict_dtype[name_dtype]
+
+def get_autocast_context(device_type, amp_dtype=None):
+    '''
+    * autocast of the forward (& loss), disabled (float32) if amp_dtype is None
+    * device_type: 'cuda' or 'cpu' (bfloat16 on cpu for testing)
+    '''
+    return torch.autocast(device_type=device_type, dtype=amp_dtype, enabled=(amp_dtype is not None))
+
+def build_grad_scaler(device_type, amp_dtype=None):
+    '''
+    * loss scaling only for float16 (bfloat16 has the exponent range of float32)
+    * disabled scaler: scale() & unscale_() are identity, step() is optimizer.step()
+    '''
+    is_enabled = (amp_dtype == torch.float16)
+    if hasattr(torch.amp, 'GradScaler'):
+        return torch.amp.GradScaler(device_type, enabled=is_enabled)
+    return torch.cuda.amp.GradScaler(enabled=(is_enabled and (device_type == 'cuda')))